@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from sqlmodel import Session
 from typing import List, Optional, Annotated
 from pydantic import Field
@@ -11,9 +11,11 @@ from app.schemas.appraisal import (
     AppraisalResultBatchRequest, BatchAddResultResponse
 )
 from app.services.appraisal import AppraisalService
+from app.services.appraisal_jobs import get_appraisal_job_service
 from app.utils.db import get_session
 from app.utils.response import success_response
-from app.core.dependencies import get_current_user_required
+from app.core.dependencies import get_current_user_required, get_admin_user
+from app.core.idempotency import run_idempotent
 from app.models.user import User
 
 router = APIRouter()
@@ -71,11 +73,25 @@ def get_appraisal_list(
 @router.post("/update")
 def batch_update_appraisals(
     items: List[AppraisalUpdateItem],
+    async_job: bool = Query(False, alias="asyncJob", description="是否以后台任务方式分块处理"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     session: Session = Depends(get_session)
 ):
+    def handle():
+        if async_job:
+            job = get_appraisal_job_service().submit_update_job(items)
+            return success_response(data=job, message="批量更新任务已提交")
+        return AppraisalService.batch_update_appraisals(items, session)
+
     try:
-        result = AppraisalService.batch_update_appraisals(items, session)
-        return result
+        return run_idempotent(
+            idempotency_key,
+            scope="appraisal_update",
+            payload={"items": items, "asyncJob": async_job},
+            handler=handle
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"批量更新订单失败: {str(e)}")
 
@@ -83,11 +99,33 @@ def batch_update_appraisals(
 @router.post("/result/add")
 def batch_add_appraisal_results(
     request: AppraisalResultBatchRequest,
+    async_job: bool = Query(False, alias="asyncJob", description="是否以后台任务方式分块处理"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: User = Depends(get_current_user_required),
     session: Session = Depends(get_session)
 ):
+    def handle():
+        if async_job:
+            job = get_appraisal_job_service().submit_result_job(request.items, current_user.id)
+            return success_response(data=job, message="批量添加鉴定结果任务已提交")
+        return AppraisalService.batch_add_appraisal_results(request, current_user, session)
+
     try:
-        result = AppraisalService.batch_add_appraisal_results(request, current_user, session)
-        return result
+        return run_idempotent(
+            idempotency_key,
+            scope=f"appraisal_result_add:{current_user.id}",
+            payload={"request": request, "asyncJob": async_job},
+            handler=handle
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"批量添加鉴定结果失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"批量添加鉴定结果失败: {str(e)}")
+
+
+@router.get("/job/{job_id}", summary="查询批量后台任务进度")
+def get_batch_job(job_id: str, current_user: User = Depends(get_admin_user)):
+    job = get_appraisal_job_service().get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return success_response(data=job)
\ No newline at end of file
@@ -4,6 +4,9 @@ from fastapi import APIRouter
 
 from app.utils.response import success_response
 from app.constants.response_codes import ResponseCode
+from app.config.settings import CACHE_ENABLED
+from app.utils.cache import get_cache
+from app.utils.redis import redis_client, async_redis_client, redis_breaker
 
 router = APIRouter()
 
@@ -16,7 +19,13 @@ def health_check():
         "status": ResponseCode.SUCCESS,
         "timestamp": current_time.strftime("%Y-%m-%d %H:%M:%S"),
         "service": "kaimen-admin-backend",
-        "version": "1.0.3"
+        "version": "1.0.3",
+        "redis": {
+            "breaker": redis_breaker.get_metrics(),
+            "pool": redis_client.get_pool_metrics(),
+            "async_pool": async_redis_client.get_pool_metrics()
+        },
+        "cache": get_cache().get_metrics() if CACHE_ENABLED else None
     }
     
     return success_response(
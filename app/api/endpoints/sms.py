@@ -0,0 +1,159 @@
+import hmac
+
+from fastapi import APIRouter, Depends, Query, HTTPException
+from sqlmodel import Session
+from typing import List, Optional
+
+from app.core.dependencies import get_admin_user
+from app.models.user import User
+from app.config.settings import SMS_CALLBACK_TOKEN
+from app.schemas.sms import (
+    SmsDeadLetterListData, SmsDeadLetterReplayRequest, SmsStatusReport, SmsCampaignCreateRequest
+)
+from app.services.sms_campaign import get_sms_campaign_service
+from app.services.sms import get_sms_service
+from app.services.sms_dead_letter import get_sms_dead_letter_store
+from app.services.sms_dispatcher import get_sms_dispatcher
+from app.services.sms_ledger import SmsLedgerService, get_sms_ledger_service, mask_phone
+from app.utils.db import get_session
+from app.utils.redis import redis_breaker
+from app.utils.response import success_response
+
+router = APIRouter()
+
+
+@router.get("/metrics", summary="短信发送指标")
+def get_sms_metrics(current_user: User = Depends(get_admin_user)):
+    ledger = get_sms_ledger_service()
+    sms_service = get_sms_service()
+    return success_response(data={
+        "dispatcher": get_sms_dispatcher().get_metrics(),
+        "send_sms_latency_ms": sms_service.send_latency.snapshot() if sms_service else None,
+        "providers": sms_service.client.get_metrics() if sms_service else None,
+        "ledger_writer": ledger.writer.get_metrics() if ledger else None,
+        "receipts": ledger.get_receipt_metrics() if ledger else None,
+        "dead_letters": get_sms_dead_letter_store().count(),
+        # 限流、延迟队列与死信均依赖 Redis
+        "redis_breaker": redis_breaker.get_metrics()
+    })
+
+
+@router.get("/ledger", summary="短信发送台账查询")
+def get_sms_ledger(
+    page: int = Query(1, ge=1),
+    pageSize: int = Query(20, ge=1, le=100),
+    appraisalId: Optional[str] = Query(None, description="鉴定订单ID"),
+    phone: Optional[str] = Query(None, description="手机号"),
+    status: Optional[str] = Query(None, description="发送状态：success/failed"),
+    startTime: Optional[str] = Query(None, description="开始时间（ISO 格式）"),
+    endTime: Optional[str] = Query(None, description="结束时间（ISO 格式）"),
+    current_user: User = Depends(get_admin_user),
+    session: Session = Depends(get_session)
+):
+    try:
+        data = SmsLedgerService.get_ledger_list(
+            page=page,
+            pageSize=pageSize,
+            appraisal_id=appraisalId,
+            phone=phone,
+            start_time=startTime,
+            end_time=endTime,
+            status=status,
+            session=session
+        )
+        return success_response(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"时间格式错误: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+
+
+@router.get("/ledger/daily", summary="短信按日汇总")
+def get_sms_daily_rollup(
+    startDate: str = Query(..., description="开始日期 YYYY-MM-DD"),
+    endDate: str = Query(..., description="结束日期 YYYY-MM-DD（包含）"),
+    current_user: User = Depends(get_admin_user),
+    session: Session = Depends(get_session)
+):
+    try:
+        data = SmsLedgerService.get_daily_rollup(startDate, endDate, session)
+        return success_response(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"日期格式错误: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+
+
+@router.get("/dead-letters", summary="短信死信列表")
+def get_sms_dead_letters(
+    page: int = Query(1, ge=1),
+    pageSize: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_admin_user)
+):
+    try:
+        total, letters = get_sms_dead_letter_store().list(page, pageSize)
+        return success_response(SmsDeadLetterListData(
+            total=total,
+            page=page,
+            pageSize=pageSize,
+            list=[{**letter, "phone_masked": mask_phone(letter.get("phone", ""))} for letter in letters]
+        ))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+
+
+@router.post("/dead-letters/replay", summary="批量重发短信死信")
+def replay_sms_dead_letters(
+    request: SmsDeadLetterReplayRequest,
+    current_user: User = Depends(get_admin_user)
+):
+    try:
+        count = get_sms_dispatcher().replay_dead_letters(request.ids, request.limit)
+        return success_response(data={"replayed": count})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"重发失败: {str(e)}")
+
+
+@router.post("/callback/status", summary="短信下发状态回执回调")
+def receive_sms_status_reports(
+    reports: List[SmsStatusReport],
+    token: Optional[str] = Query(None, description="回调校验 token"),
+):
+    # 腾讯云按批推送回执，需返回 {"result": 0, "errmsg": "OK"}，否则会重试推送
+    if not SMS_CALLBACK_TOKEN:
+        # 未配置 token 时无法校验来源，拒绝接收，避免任意请求篡改回执状态
+        raise HTTPException(status_code=503, detail="回执回调未启用")
+    if not token or not hmac.compare_digest(token.encode("utf-8"), SMS_CALLBACK_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="回调校验失败")
+    ledger = get_sms_ledger_service()
+    if ledger and ledger.record_receipts(reports) < len(reports):
+        # 写入队列已满，让平台稍后重推（重复回执按流水号幂等更新）
+        return {"result": 1, "errmsg": "busy"}
+    return {"result": 0, "errmsg": "OK"}
+
+
+@router.post("/campaigns", summary="创建短信群发")
+def create_sms_campaign(
+    request: SmsCampaignCreateRequest,
+    current_user: User = Depends(get_admin_user)
+):
+    try:
+        campaign = get_sms_campaign_service().create_campaign(request)
+        return success_response(data=campaign, message="短信群发已提交")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"创建群发失败: {str(e)}")
+
+
+@router.get("/campaigns/{campaign_id}", summary="查询短信群发进度")
+def get_sms_campaign(campaign_id: str, current_user: User = Depends(get_admin_user)):
+    campaign = get_sms_campaign_service().get_campaign(campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=404, detail="群发不存在或已过期")
+    return success_response(data=campaign)
+
+
+@router.post("/campaigns/{campaign_id}/cancel", summary="取消短信群发")
+def cancel_sms_campaign(campaign_id: str, current_user: User = Depends(get_admin_user)):
+    if not get_sms_campaign_service().cancel_campaign(campaign_id):
+        raise HTTPException(status_code=404, detail="群发不存在或已过期")
+    return success_response(message="已请求取消，当前分块发送完成后停止")
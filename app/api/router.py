@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.endpoints import auth, user, appraisal, health, appraisal_buy, appraisal_consignment, article, upload
+from app.api.endpoints import auth, user, appraisal, health, appraisal_buy, appraisal_consignment, article, upload, sms
 
 api_router = APIRouter()
 
@@ -11,4 +11,5 @@ api_router.include_router(appraisal.router, prefix="/appraisal", tags=["鉴定"]
 api_router.include_router(appraisal_buy.router, prefix="/appraisal-buy", tags=["鉴宝求购"])
 api_router.include_router(appraisal_consignment.router, prefix="/appraisal-consignment", tags=["鉴宝寄卖"])
 api_router.include_router(article.router, prefix="/article", tags=["文章管理"])
-api_router.include_router(upload.router, prefix="/upload", tags=["文件上传"])
\ No newline at end of file
+api_router.include_router(upload.router, prefix="/upload", tags=["文件上传"])
+api_router.include_router(sms.router, prefix="/sms", tags=["短信"])
\ No newline at end of file
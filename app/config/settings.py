@@ -66,6 +66,14 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_USER = os.getenv("REDIS_USER")
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))  # 连接池最大连接数（每个进程）
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 2))  # 连接池耗尽时等待空闲连接的最长时间（秒），超时抛出连接错误
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 5))  # 命令读写超时（秒）
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 5))  # 建立连接超时（秒）
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))  # 连接空闲超过该秒数后，使用前先 PING 检查
+REDIS_BREAKER_ENABLED = os.getenv("REDIS_BREAKER_ENABLED", "true").lower() == "true"  # Redis 熔断：连续失败后直接失败，不再每次等待超时
+REDIS_BREAKER_FAILURE_THRESHOLD = int(os.getenv("REDIS_BREAKER_FAILURE_THRESHOLD", 5))  # 连续多少次连接失败/超时后熔断
+REDIS_BREAKER_RESET_TIMEOUT = float(os.getenv("REDIS_BREAKER_RESET_TIMEOUT", 10))  # 熔断多少秒后放行一个探测请求
 
 # Redis 连接 URL
 REDIS_URL = f"redis://{REDIS_USER}:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}" if REDIS_USER and REDIS_PASSWORD else f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
@@ -76,6 +84,20 @@ TENCENT_CLOUD_SECRET_KEY = os.getenv("TENCENT_CLOUD_SECRET_KEY")
 SMS_SDK_APP_ID = os.getenv("SMS_SDK_APP_ID")
 SMS_REGION = os.getenv("SMS_REGION", "ap-guangzhou")
 SMS_SIGN_NAME = os.getenv("SMS_SIGN_NAME")
+SMS_PROVIDER = os.getenv("SMS_PROVIDER", "tencent")  # tencent: 腾讯云; fake: 本地假实现（开发/压测用，不发送真实短信）
+SMS_FAKE_LATENCY_MS = float(os.getenv("SMS_FAKE_LATENCY_MS", 50))  # 假实现模拟的单次请求耗时
+SMS_MAX_PHONES_PER_REQUEST = 200  # 腾讯云 SendSms 单次请求最多号码数
+SMS_ENDPOINT = os.getenv("SMS_ENDPOINT", "sms.tencentcloudapi.com")  # 接入域名，可改为就近地域域名如 sms.ap-guangzhou.tencentcloudapi.com
+SMS_REQ_TIMEOUT = int(os.getenv("SMS_REQ_TIMEOUT", 10))  # SendSms 请求超时（秒），SDK 默认 60 秒
+SMS_KEEP_ALIVE = os.getenv("SMS_KEEP_ALIVE", "true").lower() == "true"  # 复用 HTTPS 连接，避免每次请求重新握手
+SMS_SIGN_METHOD = os.getenv("SMS_SIGN_METHOD", "TC3-HMAC-SHA256")  # 签名方法: TC3-HMAC-SHA256, HmacSHA256, HmacSHA1
+SMS_CONN_KEEPALIVE_INTERVAL = float(os.getenv("SMS_CONN_KEEPALIVE_INTERVAL", 50))  # 连接空闲超过该秒数时发一次轻量请求保持连接，0 表示不保持
+
+# 短信通道故障转移配置
+SMS_PROVIDERS = os.getenv("SMS_PROVIDERS", SMS_PROVIDER)  # 有序的短信通道列表，逗号分隔，格式 tencent[:地域] 或 fake[:耗时毫秒[:错误率]]，如 tencent:ap-guangzhou,tencent:ap-beijing
+SMS_HEDGE_AFTER_MS = int(os.getenv("SMS_HEDGE_AFTER_MS", 0))  # 当前通道超过该耗时仍未返回时并发请求下一通道，0 表示关闭（开启后同一短信可能重复送达）
+SMS_PROVIDER_MAX_ERROR_RATE = float(os.getenv("SMS_PROVIDER_MAX_ERROR_RATE", 0.5))  # 近期错误率超过该值的通道暂停使用
+SMS_PROVIDER_COOLDOWN = float(os.getenv("SMS_PROVIDER_COOLDOWN", 30))  # 通道暂停多少秒后再放行请求探测
 
 # 短信模板ID配置
 SMS_TEMPLATE_STATUS_COMPLETE = "2553335"  # 已完成20251113
@@ -84,6 +106,76 @@ SMS_TEMPLATE_REJECTED = "2553334"  # 已退回20251113
 
 # 短信延迟发送配置
 SMS_DELAY_SECONDS = int(os.getenv("SMS_DELAY_SECONDS", 300))  # 默认5分钟延迟
+SMS_DELAY_BACKEND = os.getenv("SMS_DELAY_BACKEND", "redis")  # redis: 持久化、跨进程共享; memory: 进程内
+SMS_DELAY_POLL_INTERVAL = float(os.getenv("SMS_DELAY_POLL_INTERVAL", 1))  # Redis 延迟队列轮询间隔（秒）
+SMS_DELAY_LEASE_SECONDS = int(os.getenv("SMS_DELAY_LEASE_SECONDS", 900))  # 领取任务后的租约时长，超时未确认会被重新领取；需大于单次限流推迟（3600/SMS_PHONE_HOURLY_LIMIT）与重试退避之和，发送调度器推迟发送时会续约
+SMS_DELAY_CLAIM_BATCH = int(os.getenv("SMS_DELAY_CLAIM_BATCH", 200))  # 每次最多领取的到期任务数
+SMS_DIGEST_WINDOW_SECONDS = int(os.getenv("SMS_DIGEST_WINDOW_SECONDS", SMS_DELAY_SECONDS))  # 同一号码同一模板在该窗口内只发一条（0 表示只合并同时到期的任务）
+SMS_DIGEST_GATHER_MS = int(os.getenv("SMS_DIGEST_GATHER_MS", 1000))  # 进程内任务到期后等待合并的时间（毫秒）
+
+# 短信发送调度器配置（有界队列 + 固定线程池）
+SMS_DISPATCH_WORKERS = int(os.getenv("SMS_DISPATCH_WORKERS", 4))  # 发送线程数
+SMS_DISPATCH_QUEUE_SIZE = int(os.getenv("SMS_DISPATCH_QUEUE_SIZE", 10000))  # 队列容量
+SMS_DISPATCH_OVERFLOW_POLICY = os.getenv("SMS_DISPATCH_OVERFLOW_POLICY", "block")  # 队列满时策略: block, drop_oldest, reject, caller_runs
+SMS_DISPATCH_PUT_TIMEOUT = float(os.getenv("SMS_DISPATCH_PUT_TIMEOUT", 5))  # block 策略的最长等待时间（秒）
+SMS_COALESCE_WINDOW_MS = int(os.getenv("SMS_COALESCE_WINDOW_MS", 200))  # 合并同模板短信的等待窗口
+SMS_COALESCE_MAX_BATCH = min(int(os.getenv("SMS_COALESCE_MAX_BATCH", 200)), SMS_MAX_PHONES_PER_REQUEST)  # 单次合并的最大条数
+
+# 短信限流配置（Redis 令牌桶，多副本共享；超限的短信延后发送而不是丢弃）
+SMS_RATE_LIMIT_ENABLED = os.getenv("SMS_RATE_LIMIT_ENABLED", "true").lower() == "true"
+SMS_GLOBAL_QPS = float(os.getenv("SMS_GLOBAL_QPS", 20))  # 全局每秒 SendSms 请求数
+SMS_GLOBAL_BURST = float(os.getenv("SMS_GLOBAL_BURST", 20))  # 全局令牌桶容量
+SMS_PHONE_TEMPLATE_INTERVAL = float(os.getenv("SMS_PHONE_TEMPLATE_INTERVAL", 30))  # 同一号码同一模板的最小发送间隔（秒）
+SMS_PHONE_HOURLY_LIMIT = int(os.getenv("SMS_PHONE_HOURLY_LIMIT", 5))  # 同一号码每小时最多条数
+
+# 短信失败重试配置（指数退避 + 抖动，耗尽后进入死信）
+SMS_RETRY_MAX_ATTEMPTS = int(os.getenv("SMS_RETRY_MAX_ATTEMPTS", 4))  # 最多发送次数（含首次）
+SMS_RETRY_BASE_DELAY = float(os.getenv("SMS_RETRY_BASE_DELAY", 2))  # 首次重试的基础延迟（秒），之后每次翻倍
+SMS_RETRY_MAX_DELAY = float(os.getenv("SMS_RETRY_MAX_DELAY", 300))  # 单次重试最大延迟（秒）
+
+# 短信发送台账配置（后台线程批量写入）
+SMS_LEDGER_ENABLED = os.getenv("SMS_LEDGER_ENABLED", "true").lower() == "true"
+SMS_LEDGER_FLUSH_ROWS = int(os.getenv("SMS_LEDGER_FLUSH_ROWS", 200))  # 累计多少条写一次
+SMS_LEDGER_FLUSH_MS = int(os.getenv("SMS_LEDGER_FLUSH_MS", 1000))  # 最长多久写一次（毫秒）
+SMS_LEDGER_QUEUE_SIZE = int(os.getenv("SMS_LEDGER_QUEUE_SIZE", 20000))  # 待写入队列容量，满时丢弃并计数
+SMS_LEDGER_PHONE_SALT = os.getenv("SMS_LEDGER_PHONE_SALT", "")  # 手机号哈希盐值，修改后旧记录无法按手机号查询
+SMS_RECEIPT_MATCH_WINDOW = int(os.getenv("SMS_RECEIPT_MATCH_WINDOW", 600))  # 先于发送记录到达的回执保留多久（秒），等待台账写入后重新匹配
+SMS_CALLBACK_TOKEN = os.getenv("SMS_CALLBACK_TOKEN", "")  # 回执回调地址上的 token 参数，必须配置，为空时拒绝所有回执回调
+
+# 短信群发配置
+SMS_CAMPAIGN_CHUNK_SIZE = min(int(os.getenv("SMS_CAMPAIGN_CHUNK_SIZE", 200)), SMS_MAX_PHONES_PER_REQUEST)  # 每次从数据库读取并提交的收件人数
+SMS_CAMPAIGN_CHUNK_TIMEOUT = float(os.getenv("SMS_CAMPAIGN_CHUNK_TIMEOUT", 600))  # 等待一个分块发送完成的最长时间（秒），超时后继续下一块
+SMS_CAMPAIGN_TTL = int(os.getenv("SMS_CAMPAIGN_TTL", 7 * 86400))  # 群发进度保留时间（秒）
+
+# 鉴定事件总线配置（Redis Stream）
+APPRAISAL_EVENT_BUS_ENABLED = os.getenv("APPRAISAL_EVENT_BUS_ENABLED", "true").lower() == "true"
+APPRAISAL_EVENT_STREAM_MAXLEN = int(os.getenv("APPRAISAL_EVENT_STREAM_MAXLEN", 100000))  # Stream 近似最大长度
+APPRAISAL_EVENT_BATCH_SIZE = int(os.getenv("APPRAISAL_EVENT_BATCH_SIZE", 100))  # 消费者每次读取的事件数
+APPRAISAL_EVENT_BLOCK_MS = int(os.getenv("APPRAISAL_EVENT_BLOCK_MS", 2000))  # 阻塞读取时间，需小于 Redis socket 超时
+APPRAISAL_EVENT_CLAIM_IDLE_MS = int(os.getenv("APPRAISAL_EVENT_CLAIM_IDLE_MS", 60000))  # 超过该时间未确认的事件由其他消费者接管
+APPRAISAL_EVENT_MAX_DELIVERIES = int(os.getenv("APPRAISAL_EVENT_MAX_DELIVERIES", 5))  # 同一事件处理失败达到该投递次数后移入死信流并确认
+
+# 鉴定批量后台任务配置
+APPRAISAL_JOB_CHUNK_SIZE = int(os.getenv("APPRAISAL_JOB_CHUNK_SIZE", 200))  # 每个事务处理的条数
+APPRAISAL_JOB_WORKERS = int(os.getenv("APPRAISAL_JOB_WORKERS", 2))  # 后台任务线程数
+APPRAISAL_JOB_TTL = int(os.getenv("APPRAISAL_JOB_TTL", 86400))  # 任务进度保留时间（秒）
+APPRAISAL_JOB_SHUTDOWN_TIMEOUT = float(os.getenv("APPRAISAL_JOB_SHUTDOWN_TIMEOUT", 10))  # 关闭时等待执行中分块完成的最长时间（秒）
+
+# 幂等键配置
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 86400))  # 响应结果保留时间（秒）
+IDEMPOTENCY_LOCK_TTL = int(os.getenv("IDEMPOTENCY_LOCK_TTL", 300))  # 处理中锁的最长持有时间（秒）
+
+# 两级缓存配置（进程内 LRU + Redis）
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_SERIALIZER = os.getenv("CACHE_SERIALIZER", "json")  # json, orjson, msgpack（后两者需安装对应依赖，未安装时回退到 json）
+CACHE_DEFAULT_TTL = int(os.getenv("CACHE_DEFAULT_TTL", 60))  # Redis 缓存默认过期时间（秒）
+CACHE_LOCAL_TTL = float(os.getenv("CACHE_LOCAL_TTL", 5))  # 进程内缓存过期时间（秒），也是其他副本失效后最长的不一致时间
+CACHE_LOCAL_MAXSIZE = int(os.getenv("CACHE_LOCAL_MAXSIZE", 1024))  # 进程内缓存最多条数，超出时淘汰最久未使用的
+CACHE_LOCK_TTL = int(os.getenv("CACHE_LOCK_TTL", 10))  # 跨进程回源锁的最长持有时间（秒）
+CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", 3))  # 未拿到回源锁时等待其他进程写入缓存的最长时间（秒），超时后自行回源
+
+# 启动预热配置
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"  # 服务就绪后在后台线程预先加载云 SDK
 
 
 def get_runtime_env_config() -> Dict[str, str]:
@@ -122,7 +214,7 @@ def get_runtime_env_config() -> Dict[str, str]:
 
 def print_runtime_env_config() -> None:
     """
-    启动时打印环境变量配置（不做掩码）。
+    启动时打印环境变量配置（不做掩码），由应用生命周期在启动时调用，导入配置模块时不再打印
     """
     # 计算北京时间启动时间
     startup_dt = datetime.now(timezone.utc).astimezone(timezone(timedelta(hours=8)))
@@ -133,6 +225,5 @@ def print_runtime_env_config() -> None:
     print("[Startup] 环境变量配置：")
     for k, v in cfg.items():
         print(f"  - {k}: {v}")
-
-# 启动时打印环境变量配置（敏感信息已掩码）
-print_runtime_env_config()
+    if not SMS_CALLBACK_TOKEN:
+        print("[Startup] 未配置 SMS_CALLBACK_TOKEN，短信回执回调将被拒绝")
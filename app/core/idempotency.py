@@ -0,0 +1,136 @@
+"""
+幂等键处理
+批量写接口携带 Idempotency-Key 请求头时，同一个键只执行一次，重试直接返回首次的响应
+"""
+import hashlib
+import json
+import logging
+import uuid
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+
+from app.config.settings import ENVIRONMENT, IDEMPOTENCY_TTL, IDEMPOTENCY_LOCK_TTL
+from app.constants.response_codes import ResponseCode
+from app.utils.redis import RedisClient, get_redis
+
+logger = logging.getLogger(__name__)
+
+# Redis key前缀：生产环境用"online"，其他环境用"dev"
+_ENV_PREFIX = "online" if ENVIRONMENT == "production" else "dev"
+
+
+def _fingerprint(payload: Any) -> str:
+    """计算请求内容指纹，用于识别同一个键被用于不同请求"""
+    raw = json.dumps(jsonable_encoder(payload), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _load_stored(
+    redis: RedisClient,
+    result_key: str,
+    fingerprint: str,
+    scope: str,
+    idempotency_key: str
+) -> Tuple[bool, Any]:
+    """
+    读取已保存的响应
+    
+    Returns:
+        (是否存在, 保存的响应)
+        
+    Raises:
+        HTTPException: 幂等键已被用于不同的请求内容
+    """
+    stored = redis.get(result_key)
+    if not stored:
+        return False, None
+    record = json.loads(stored)
+    if record.get("fingerprint") != fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={
+                "code": ResponseCode.FAILURE,
+                "message": "Idempotency-Key 已被用于不同的请求内容",
+                "data": None
+            }
+        )
+    logger.info(f"幂等键命中，返回已保存的响应: scope={scope}, key={idempotency_key}")
+    return True, record.get("response")
+
+
+def run_idempotent(
+    idempotency_key: Optional[str],
+    scope: str,
+    payload: Any,
+    handler: Callable[[], Any]
+) -> Any:
+    """
+    按幂等键执行请求处理函数
+    
+    - 首次请求：加处理中锁，执行 handler，成功后保存响应（带 TTL）
+    - 重试请求：直接返回保存的响应
+    - 同一个键仍在处理中：返回 409
+    - 同一个键对应不同的请求内容：返回 422
+    - Redis 报错或熔断：降级为直接执行
+    
+    Args:
+        idempotency_key: 请求头中的幂等键，为空时直接执行
+        scope: 作用域（接口名 + 用户），不同作用域的同名键互不影响
+        payload: 请求内容，用于计算指纹
+        handler: 实际处理函数
+        
+    Returns:
+        handler 的响应或保存的响应
+        
+    Raises:
+        HTTPException: 请求处理中或幂等键冲突
+    """
+    if not idempotency_key:
+        return handler()
+    
+    redis = get_redis()
+    result_key = f"{_ENV_PREFIX}:idempotency:{scope}:{idempotency_key}"
+    lock_key = f"{result_key}:lock"
+    fingerprint = _fingerprint(payload)
+    
+    found, response = _load_stored(redis, result_key, fingerprint, scope, idempotency_key)
+    if found:
+        return response
+    
+    token = uuid.uuid4().hex
+    try:
+        locked = redis.get_client().set(lock_key, token, ex=IDEMPOTENCY_LOCK_TTL, nx=True)
+    except Exception as e:
+        # 只有 Redis 报错（含熔断）时才降级为直接执行
+        logger.warning(f"幂等键存储不可用，直接执行请求: scope={scope}, key={idempotency_key}, 错误={e}")
+        return handler()
+    
+    if not locked:
+        # 锁被占用，或持有者刚保存响应并释放锁：有响应时返回，否则仍在处理中
+        found, response = _load_stored(redis, result_key, fingerprint, scope, idempotency_key)
+        if found:
+            return response
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "code": ResponseCode.FAILURE,
+                "message": "相同 Idempotency-Key 的请求正在处理中，请稍后重试",
+                "data": None
+            }
+        )
+    
+    try:
+        # 加锁前读取之后，其他请求可能已完成并释放锁，加锁后再确认一次
+        found, response = _load_stored(redis, result_key, fingerprint, scope, idempotency_key)
+        if found:
+            return response
+        response = handler()
+        record = {"fingerprint": fingerprint, "response": jsonable_encoder(response)}
+        if not redis.set(result_key, json.dumps(record, ensure_ascii=False), ex=IDEMPOTENCY_TTL):
+            logger.warning(f"保存幂等响应失败: scope={scope}, key={idempotency_key}")
+        return response
+    finally:
+        # 只释放自己持有的锁
+        redis.delete_if_equal(lock_key, token)
@@ -0,0 +1,56 @@
+"""
+应用生命周期管理
+启动时拉起后台消费者，关闭时有序停止
+"""
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from app.config.settings import WARMUP_ENABLED, print_runtime_env_config
+from app.core.warmup import start_background_warmup
+from app.services.appraisal_events import get_appraisal_event_bus
+from app.services.appraisal_jobs import get_appraisal_job_service
+from app.services.sms import stop_sms_keepalive
+from app.services.sms_campaign import get_sms_campaign_service
+from app.services.sms_delay_manager import get_sms_delay_manager
+from app.services.sms_dispatcher import get_sms_dispatcher
+from app.services.sms_ledger import get_sms_ledger_service
+from app.utils.redis import redis_client, async_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    FastAPI 生命周期钩子
+    
+    Args:
+        app: FastAPI 应用实例
+    """
+    print_runtime_env_config()
+    event_bus = get_appraisal_event_bus()
+    event_bus.start()
+    sms_delay_manager = get_sms_delay_manager()
+    if sms_delay_manager:
+        sms_delay_manager.start()
+    if WARMUP_ENABLED:
+        start_background_warmup()
+    
+    yield
+    
+    get_appraisal_job_service().shutdown()
+    get_sms_campaign_service().shutdown()
+    event_bus.stop()
+    if sms_delay_manager:
+        sms_delay_manager.stop()
+    stop_sms_keepalive()
+    get_sms_dispatcher().shutdown()
+    # 台账最后停止，写完调度器关闭前产生的记录
+    ledger = get_sms_ledger_service()
+    if ledger:
+        ledger.shutdown()
+    # 各组件停止后再关闭 Redis 连接池
+    redis_client.close()
+    await async_redis_client.close()
@@ -0,0 +1,68 @@
+"""
+启动预热
+云 SDK 改为首次使用时导入后，由后台线程在服务就绪后提前加载，避免第一个请求承担导入与初始化耗时
+"""
+import importlib
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 需要预先导入的重量级模块
+WARMUP_MODULES = (
+    "tencentcloud.sms.v20210111.sms_client",
+    "qcloud_cos",
+)
+
+_warmup_thread: Optional[threading.Thread] = None
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    导入重量级模块，初始化短信服务并建立连接
+    
+    Returns:
+        {模块名: 耗时毫秒}，导入失败的模块为 -1
+    """
+    timings: Dict[str, float] = {}
+    for module in WARMUP_MODULES:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(module)
+            timings[module] = round((time.perf_counter() - started) * 1000, 1)
+        except ImportError as e:
+            timings[module] = -1
+            logger.warning(f"预热导入模块失败: {module}, 错误={str(e)}")
+    
+    from app.services.sms import get_sms_service
+    
+    started = time.perf_counter()
+    sms_service = get_sms_service()
+    timings["sms_service"] = round((time.perf_counter() - started) * 1000, 1)
+    if sms_service:
+        # 提前建立到短信接口的连接，并在空闲时保持
+        started = time.perf_counter()
+        sms_service.warm_connection()
+        timings["sms_connection"] = round((time.perf_counter() - started) * 1000, 1)
+        sms_service.start_keepalive()
+    return timings
+
+
+def _run() -> None:
+    started = time.perf_counter()
+    try:
+        timings = warm_up()
+        logger.info(f"后台预热完成，总耗时 {(time.perf_counter() - started) * 1000:.0f}ms: {timings}")
+    except Exception as e:
+        logger.error(f"后台预热异常: {str(e)}", exc_info=True)
+
+
+def start_background_warmup() -> None:
+    """在后台守护线程中预热，不阻塞应用启动"""
+    global _warmup_thread
+    if _warmup_thread is not None:
+        return
+    _warmup_thread = threading.Thread(target=_run, name="warmup", daemon=True)
+    _warmup_thread.start()
@@ -0,0 +1,71 @@
+"""
+短信发送台账数据模型
+
+建表语句（MySQL）:
+    CREATE TABLE `sms_ledger` (
+      `id` bigint NOT NULL AUTO_INCREMENT,
+      `appraisal_id` varchar(34) NOT NULL DEFAULT '',
+      `covered_appraisal_ids` text DEFAULT NULL,
+      `phone_hash` char(64) NOT NULL,
+      `phone_masked` varchar(32) DEFAULT NULL,
+      `template_id` varchar(32) NOT NULL,
+      `template_desc` varchar(64) DEFAULT NULL,
+      `status` varchar(16) NOT NULL,
+      `code` varchar(64) DEFAULT NULL,
+      `message` varchar(255) DEFAULT NULL,
+      `request_id` varchar(64) DEFAULT NULL,
+      `serial_no` varchar(64) DEFAULT NULL,
+      `fee` int NOT NULL DEFAULT 0,
+      `latency_ms` int DEFAULT NULL,
+      `delivery_status` varchar(16) DEFAULT NULL,
+      `delivery_code` varchar(64) DEFAULT NULL,
+      `delivered_at` datetime DEFAULT NULL,
+      `created_at` datetime(3) NOT NULL,
+      PRIMARY KEY (`id`),
+      KEY `idx_sms_ledger_appraisal` (`appraisal_id`, `created_at`),
+      KEY `idx_sms_ledger_phone` (`phone_hash`, `created_at`),
+      KEY `idx_sms_ledger_created` (`created_at`),
+      KEY `idx_sms_ledger_serial` (`serial_no`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+已有表增加合并通知字段:
+    ALTER TABLE `sms_ledger` ADD COLUMN `covered_appraisal_ids` text DEFAULT NULL AFTER `appraisal_id`;
+
+已有表增加送达回执字段:
+    ALTER TABLE `sms_ledger`
+      ADD COLUMN `delivery_status` varchar(16) DEFAULT NULL AFTER `latency_ms`,
+      ADD COLUMN `delivery_code` varchar(64) DEFAULT NULL AFTER `delivery_status`,
+      ADD COLUMN `delivered_at` datetime DEFAULT NULL AFTER `delivery_code`,
+      ADD KEY `idx_sms_ledger_serial` (`serial_no`);
+"""
+from sqlmodel import SQLModel, Field, Column, String, DateTime, Text
+from typing import Optional
+from datetime import datetime
+
+
+class SmsLedger(SQLModel, table=True):
+    """短信发送台账模型（每个号码的每次发送尝试一条）"""
+    __tablename__ = "sms_ledger"
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    appraisal_id: str = Field(default="", max_length=34, description="鉴定订单ID")
+    covered_appraisal_ids: Optional[str] = Field(
+        default=None,
+        sa_column=Column("covered_appraisal_ids", Text),
+        description="合并通知覆盖的全部鉴定订单ID（逗号分隔），单条通知为空"
+    )
+    phone_hash: str = Field(max_length=64, description="手机号哈希")
+    phone_masked: Optional[str] = Field(default=None, max_length=32, description="脱敏手机号")
+    template_id: str = Field(max_length=32, description="模板ID")
+    template_desc: Optional[str] = Field(default=None, max_length=64, description="模板描述")
+    status: str = Field(max_length=16, description="发送状态：success/failed")
+    code: Optional[str] = Field(default=None, max_length=64, description="平台返回码或错误码")
+    message: Optional[str] = Field(default=None, sa_column=Column("message", String(255)), description="平台返回信息")
+    request_id: Optional[str] = Field(default=None, max_length=64, description="请求ID")
+    serial_no: Optional[str] = Field(default=None, max_length=64, description="发送流水号")
+    fee: int = Field(default=0, description="计费条数")
+    latency_ms: Optional[int] = Field(default=None, description="SendSms 请求耗时（毫秒）")
+    delivery_status: Optional[str] = Field(default=None, max_length=16, description="送达状态：delivered/undelivered，未收到回执为空")
+    delivery_code: Optional[str] = Field(default=None, max_length=64, description="运营商回执码，如 DELIVRD")
+    delivered_at: Optional[datetime] = Field(default=None, description="用户实际接收时间（UTC）")
+    created_at: datetime = Field(sa_column=Column("created_at", DateTime, nullable=False), description="发送时间")
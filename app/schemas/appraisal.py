@@ -120,4 +120,19 @@ class AppraisalResultItem(BaseModel):
 
 class AppraisalResultBatchRequest(BaseModel):
     """鉴定结果批量请求模式"""
-    items: List[AppraisalResultItem]
\ No newline at end of file
+    items: List[AppraisalResultItem]
+
+
+class BatchJobData(BaseModel):
+    """批量后台任务数据模式"""
+    job_id: str
+    job_type: str
+    status: str
+    total: int
+    processed: int = 0
+    success_count: int = 0
+    failed_count: int = 0
+    failed_items: List[FailedItem] = []
+    error: Optional[str] = None
+    created_at: Optional[int] = None
+    updated_at: Optional[int] = None
@@ -0,0 +1,115 @@
+from pydantic import BaseModel, Field
+from typing import Dict, Optional, List
+from datetime import datetime
+
+
+class SmsLedgerItem(BaseModel):
+    """短信发送台账记录"""
+    id: int
+    appraisal_id: str
+    covered_appraisal_ids: Optional[str] = None
+    phone_masked: Optional[str] = None
+    template_id: str
+    template_desc: Optional[str] = None
+    status: str
+    code: Optional[str] = None
+    message: Optional[str] = None
+    request_id: Optional[str] = None
+    serial_no: Optional[str] = None
+    fee: int = 0
+    latency_ms: Optional[int] = None
+    delivery_status: Optional[str] = None
+    delivery_code: Optional[str] = None
+    delivered_at: Optional[datetime] = None
+    created_at: datetime
+
+
+class SmsLedgerListData(BaseModel):
+    total: int
+    page: int
+    pageSize: int
+    list: List[SmsLedgerItem]
+
+
+class SmsDailyRollupItem(BaseModel):
+    """短信按日汇总（北京时间）"""
+    date: str
+    total: int
+    success_count: int
+    failed_count: int
+    delivered_count: int = 0
+    fee: int
+
+
+class SmsDeadLetterItem(BaseModel):
+    """短信死信"""
+    id: str
+    phone_masked: str
+    template_id: str
+    template_desc: Optional[str] = None
+    appraisal_id: Optional[str] = None
+    covered_ids: Optional[List[str]] = None
+    attempts: int
+    error_code: Optional[str] = None
+    error_message: Optional[str] = None
+    failed_at: float
+
+
+class SmsDeadLetterListData(BaseModel):
+    total: int
+    page: int
+    pageSize: int
+    list: List[SmsDeadLetterItem]
+
+
+class SmsDeadLetterReplayRequest(BaseModel):
+    """死信重发请求：不传 ids 时重发最早的 limit 条"""
+    ids: Optional[List[str]] = Field(None, description="死信ID列表")
+    limit: int = Field(1000, ge=1, le=10000, description="最多重发条数")
+
+
+class SmsStatusReport(BaseModel):
+    """腾讯云短信下发状态回执（字段与回调推送一致）"""
+    sid: str = Field(..., description="下发流水号，对应 SendStatus.SerialNo")
+    report_status: str = Field(..., description="SUCCESS 表示送达，FAIL 表示未送达")
+    errmsg: Optional[str] = Field(None, description="运营商回执码，如 DELIVRD")
+    description: Optional[str] = Field(None, description="回执说明")
+    user_receive_time: Optional[str] = Field(None, description="用户实际接收时间（北京时间）")
+    nationcode: Optional[str] = None
+    mobile: Optional[str] = None
+
+
+class SmsCampaignSelector(BaseModel):
+    """群发收件人筛选条件：有符合条件鉴定单的用户（按手机号去重）"""
+    appraisal_status: Optional[List[str]] = Field(None, description="鉴定状态列表")
+    appraisal_business_type: Optional[str] = Field(None, description="鉴定业务类型")
+    create_start_time: Optional[int] = Field(None, description="鉴定单创建时间下限（与 createdAt 字段一致）")
+    create_end_time: Optional[int] = Field(None, description="鉴定单创建时间上限（与 createdAt 字段一致）")
+
+
+class SmsCampaignCreateRequest(BaseModel):
+    """创建短信群发（仅支持无参数模板）"""
+    template_id: str = Field(..., description="模板ID")
+    template_desc: Optional[str] = Field(None, description="模板描述")
+    selector: SmsCampaignSelector
+
+
+class SmsCampaignData(BaseModel):
+    """短信群发进度"""
+    campaign_id: str
+    template_id: str
+    template_desc: Optional[str] = None
+    selector: Optional[str] = None
+    status: str
+    total: int = 0
+    processed: int = 0
+    sent: int = 0
+    failed: int = 0
+    pending: int = 0
+    throughput_per_sec: float = 0
+    error_codes: Dict[str, int] = {}
+    cursor: Optional[str] = None
+    error: Optional[str] = None
+    created_at: Optional[int] = None
+    started_at: Optional[float] = None
+    updated_at: Optional[float] = None
@@ -1,6 +1,6 @@
-from sqlmodel import Session, select
+from sqlmodel import Session, select, update, insert, case
 from fastapi import HTTPException, Depends
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime, timezone
 import logging
 
@@ -12,13 +12,12 @@ from app.models.user import User
 from app.schemas.appraisal import (
     BatchDetailRequest, AppraisalDetail, LatestAppraisalData,
     BatchUpdateRequest, BatchUpdateResult, AppraisalUpdateItem,
-    OrderUpdateResult, AppraisalResultBatchRequest, BatchAddResultData, FailedItem
+    OrderUpdateResult, AppraisalResultBatchRequest, AppraisalResultItem, BatchAddResultData, FailedItem
 )
 from app.utils.db import get_session
 from app.utils.response import success_response
 from app.core.dependencies import get_current_user_required
-from app.services.sms import get_sms_service, get_sms_delay_manager
-from app.services.appraisal_stats import get_appraisal_stats_service
+from app.services.appraisal_events import get_appraisal_event_bus
 
 logger = logging.getLogger(__name__)
 
@@ -247,98 +246,122 @@ class AppraisalService:
         })
 
     @staticmethod
-    def batch_update_appraisals(request: List[AppraisalUpdateItem], session: Session = Depends(get_session)):
-        
+    def _build_update_values(item: AppraisalUpdateItem) -> Dict[str, Any]:
+        """根据更新项生成需要写入的字段（只包含非空字段）"""
+        values = {}
+        if item.appraisal_status is not None:
+            values["appraisal_status"] = str(item.appraisal_status)
+        if item.appraisal_class is not None:
+            values["first_class"] = str(item.appraisal_class)
+        if item.fine_class is not None:
+            values["fine_class"] = int(item.fine_class)
+        if item.fine_tips is not None:
+            values["fine_tips"] = int(item.fine_tips)
+        return values
+
+    @staticmethod
+    def _load_appraisal_map(appraisal_ids: List[str], session: Session) -> Dict[str, Appraisal]:
+        """一次 IN 查询加载所有目标鉴定单"""
+        appraisal_ids = list(set(appraisal_ids))
+        if not appraisal_ids:
+            return {}
+        appraisals = session.exec(
+            select(Appraisal).where(Appraisal.id.in_(appraisal_ids))
+        ).all()
+        return {a.id: a for a in appraisals}
+
+    @staticmethod
+    def apply_appraisal_updates(
+        items: List[AppraisalUpdateItem],
+        session: Session
+    ) -> Tuple[int, List[FailedItem]]:
+        """
+        在一个事务内批量更新鉴定单，提交成功后发布状态变更事件
+
+        Args:
+            items: 鉴定更新项列表
+            session: 数据库会话
+
+        Returns:
+            (成功数量, 失败项列表)
+        """
         success_count = 0
         failed_items = []
-        stats_service = get_appraisal_stats_service()
-        sms_service = get_sms_service()
-        
-        for item in request:
-            try:
-                appraisal = session.exec(
-                    select(Appraisal).where(Appraisal.id == item.id)
-                ).first()
-                
-                if not appraisal:
-                    failed_items.append(FailedItem(
-                        appraisal_id=item.id,
-                        reason="鉴定不存在"
-                    ))
-                    continue
-                
-                # 记录旧状态用于统计更新
-                old_status = appraisal.appraisal_status
-                
-                if item.appraisal_status is not None:
-                    appraisal.appraisal_status = str(item.appraisal_status)
-                if item.appraisal_class is not None:
-                    appraisal.first_class = str(item.appraisal_class)
-                if item.fine_class is not None:
-                    appraisal.fine_class = int(item.fine_class)
-                if item.fine_tips is not None:
-                    appraisal.fine_tips = int(item.fine_tips)
-                
-                session.add(appraisal)
-                success_count += 1
-                
-                # 更新统计数据
-                if appraisal.userinfo_id:
-                    stats_service.handle_status_change(
-                        userinfo_id=appraisal.userinfo_id,
-                        appraisal_id=appraisal.id,
-                        old_status=old_status,
-                        new_status=appraisal.appraisal_status
-                    )
 
-                # 检测状态变更，如果变更为需要通知的状态则发送短信
-                if old_status != appraisal.appraisal_status and appraisal.appraisal_status in ["3", "4", "5"]:
-                    logger.info(
-                        f"检测到状态变更为需要通知的状态: 订单ID={item.id}, "
-                        f"旧状态={old_status}, 新状态={appraisal.appraisal_status}"
-                    )
-                    
-                    # 查询用户手机号
-                    user_info = session.exec(
-                        select(UserInfo).where(UserInfo.id == appraisal.userinfo_id)
-                    ).first()
-                    
-                    if user_info and user_info.phone:
-                        # 使用延迟发送管理器
-                        delay_manager = get_sms_delay_manager()
-                        if delay_manager:
-                            try:
-                                delay_manager.schedule_delayed_sms(
-                                    appraisal_id=str(item.id),
-                                    phone=user_info.phone,
-                                    status=appraisal.appraisal_status
-                                )
-                                logger.info(
-                                    f"已调度延迟状态通知短信: 订单ID={item.id}, "
-                                    f"状态={appraisal.appraisal_status}, 手机号={user_info.phone}"
-                                )
-                            except Exception as delay_error:
-                                # 延迟发送失败不影响主业务流程
-                                logger.error(
-                                    f"延迟状态通知短信调度失败: 订单ID={item.id}, "
-                                    f"错误={str(delay_error)}",
-                                    exc_info=True
-                                )
-                        else:
-                            logger.warning("延迟发送管理器未初始化，跳过状态通知短信发送")
-                    else:
-                        logger.warning(
-                            f"未找到用户手机号，跳过状态通知短信发送: "
-                            f"订单ID={item.id}, userinfo_id={appraisal.userinfo_id}"
-                        )
-                
+        # 批量查询优化：一次 IN 查询加载所有目标鉴定单
+        appraisal_map = AppraisalService._load_appraisal_map([item.id for item in items], session)
+
+        # 按请求顺序推演每一项的新旧状态，同一订单重复出现时与逐条执行的结果一致
+        current_status = {a_id: a.appraisal_status for a_id, a in appraisal_map.items()}
+        merged_values: Dict[str, Dict[str, Any]] = {}
+        transitions = []
+        for item in items:
+            if item.id not in appraisal_map:
+                failed_items.append(FailedItem(
+                    appraisal_id=item.id,
+                    reason="鉴定不存在"
+                ))
+                continue
+
+            values = AppraisalService._build_update_values(item)
+            old_status = current_status[item.id]
+            new_status = values.get("appraisal_status", old_status)
+            current_status[item.id] = new_status
+            merged_values.setdefault(item.id, {}).update(values)
+            transitions.append((item, old_status, new_status))
+
+        # 相同变更内容的订单合并为一条 UPDATE ... WHERE _id IN (...)
+        update_groups: Dict[tuple, List[str]] = {}
+        for appraisal_id, values in merged_values.items():
+            if values:
+                update_groups.setdefault(tuple(sorted(values.items())), []).append(appraisal_id)
+
+        group_errors: Dict[str, str] = {}
+        for group_key, ids in update_groups.items():
+            try:
+                session.execute(
+                    update(Appraisal)
+                    .where(Appraisal.id.in_(ids))
+                    .values(**dict(group_key))
+                    .execution_options(synchronize_session=False)
+                )
             except Exception as e:
+                logger.error(f"批量更新鉴定单失败: 订单数={len(ids)}, 错误={str(e)}", exc_info=True)
+                for appraisal_id in ids:
+                    group_errors[appraisal_id] = str(e)
+
+        events = []
+        for item, old_status, new_status in transitions:
+            if item.id in group_errors:
                 failed_items.append(FailedItem(
                     appraisal_id=item.id,
-                    reason=str(e)
+                    reason=group_errors[item.id]
                 ))
+                continue
+
+            appraisal = appraisal_map[item.id]
+            success_count += 1
+            events.append({
+                "source": "update",
+                "appraisal_id": item.id,
+                "userinfo_id": appraisal.userinfo_id,
+                "old_status": old_status,
+                "new_status": new_status,
+                "appraisal_result": None,
+                "operator_id": None
+            })
         
         session.commit()
+
+        # 事务提交成功后才发布事件，统计更新和短信调度由后台消费者批量处理
+        get_appraisal_event_bus().publish_status_changes(events)
+
+        return success_count, failed_items
+
+    @staticmethod
+    def batch_update_appraisals(request: List[AppraisalUpdateItem], session: Session = Depends(get_session)):
+
+        success_count, failed_items = AppraisalService.apply_appraisal_updates(request, session)
         
         return success_response(data={
             "success_count": success_count,
@@ -347,127 +370,175 @@ class AppraisalService:
         })
 
     @staticmethod
-    def batch_add_appraisal_results(
-        request: AppraisalResultBatchRequest, 
-        current_user: User = Depends(get_current_user_required),
-        session: Session = Depends(get_session)
-    ):
-        
+    def _bulk_insert_results(rows: List[Dict[str, Any]], user_id: int, session: Session) -> List[int]:
+        """
+        多行 INSERT 一次写入所有鉴定结果，并按插入顺序找回自增ID
+
+        MySQL 对单条多行 INSERT 分配连续的自增值，LAST_INSERT_ID() 返回第一行的ID；
+        再用一次查询按ID范围取回这些行，并核对订单ID顺序，避免依赖 auto_increment_increment 配置。
+
+        Args:
+            rows: 待插入的鉴定结果行
+            user_id: 鉴定师ID
+            session: 数据库会话
+
+        Returns:
+            与 rows 顺序一致的新记录ID列表
+        """
+        table = AppraisalResult.__table__
+        cursor = session.execute(insert(table).values(rows))
+        first_id = cursor.lastrowid
+
+        inserted = session.exec(
+            select(AppraisalResult.id, AppraisalResult.appraisal_id)
+            .where(AppraisalResult.id >= first_id, AppraisalResult.user_id == user_id)
+            .order_by(AppraisalResult.id.asc())
+            .limit(len(rows))
+        ).all()
+
+        if [appraisal_id for _, appraisal_id in inserted] != [row["appraisal_id"] for row in rows]:
+            raise RuntimeError(f"批量插入鉴定结果后无法找回自增ID: first_id={first_id}, 行数={len(rows)}")
+
+        return [result_id for result_id, _ in inserted]
+
+    @staticmethod
+    def apply_appraisal_results(
+        items: List[AppraisalResultItem],
+        operator_id: int,
+        session: Session
+    ) -> Tuple[int, List[FailedItem]]:
+        """
+        在一个事务内批量添加鉴定结果，提交成功后发布状态变更事件
+
+        Args:
+            items: 鉴定结果项列表
+            operator_id: 提交结果的鉴定师ID
+            session: 数据库会话
+
+        Returns:
+            (成功数量, 失败项列表)
+        """
         success_count = 0
         failed_items = []
-        
-        # 获取短信服务实例
-        sms_service = get_sms_service()
-        
-        # 获取统计服务实例
-        stats_service = get_appraisal_stats_service()
-        
-        for item in request.items:
+
+        # 批量查询优化：一次 IN 查询加载所有目标鉴定单
+        appraisal_map = AppraisalService._load_appraisal_map(
+            [item.appraisalId for item in items], session
+        )
+
+        now = datetime.now(timezone.utc)
+        current_status = {a_id: a.appraisal_status for a_id, a in appraisal_map.items()}
+        rows = []
+        transitions = []
+        for item in items:
+            if item.appraisalId not in appraisal_map:
+                failed_items.append(FailedItem(
+                    appraisal_id=item.appraisalId,
+                    reason="订单不存在"
+                ))
+                continue
+
+            # 生成备注内容
+            notes = item.comment or ""
+            if item.reasons:
+                notes += f" | 原因: {', '.join(item.reasons)}"
+
+            # 根据鉴定结果设置相应的状态
+            # 0 暂无提交
+            # 1=真, 2=假 -> 状态3=已完结
+            # 3=存疑 -> 状态4=待完善
+            old_status = current_status[item.appraisalId]
+            new_status = old_status
+            if item.appraisalResult == "1" or item.appraisalResult == "2":
+                new_status = "3"  # 已完结
+            elif item.appraisalResult == "3":
+                new_status = "4"  # 待完善
+            current_status[item.appraisalId] = new_status
+
+            rows.append({
+                "appraisal_id": item.appraisalId,
+                "user_id": operator_id,
+                "result": item.appraisalResult,
+                "notes": notes,
+                "created_at": now
+            })
+            transitions.append((item, old_status, new_status))
+
+        if rows:
             try:
-                appraisal = session.exec(
-                    select(Appraisal).where(Appraisal.id == item.appraisalId)
-                ).first()
-                
-                if not appraisal:
+                result_ids = AppraisalService._bulk_insert_results(rows, operator_id, session)
+
+                # 同一订单出现多次时以最后一条为准
+                last_result_ids = {}
+                last_results = {}
+                for (item, _, _), result_id in zip(transitions, result_ids):
+                    last_result_ids[item.appraisalId] = result_id
+                    last_results[item.appraisalId] = item.appraisalResult
+                status_changes = {
+                    appraisal_id: current_status[appraisal_id]
+                    for appraisal_id in last_result_ids
+                    if current_status[appraisal_id] != appraisal_map[appraisal_id].appraisal_status
+                }
+
+                # 单条 UPDATE ... CASE 批量回写鉴定单字段
+                values = {
+                    "last_appraiser_id": operator_id,
+                    "last_appraisal_result_id": case(last_result_ids, value=Appraisal.id),
+                    "appraisal_result": case(last_results, value=Appraisal.id),
+                }
+                if status_changes:
+                    values["appraisal_status"] = case(
+                        status_changes, value=Appraisal.id, else_=Appraisal.appraisal_status
+                    )
+                session.execute(
+                    update(Appraisal)
+                    .where(Appraisal.id.in_(list(last_result_ids)))
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+            except Exception as e:
+                logger.error(f"批量添加鉴定结果失败: 条数={len(rows)}, 错误={str(e)}", exc_info=True)
+                session.rollback()
+                for item, _, _ in transitions:
                     failed_items.append(FailedItem(
                         appraisal_id=item.appraisalId,
-                        reason="订单不存在"
+                        reason=str(e)
                     ))
-                    continue
-                
-                # 记录旧状态用于统计更新
-                old_status = appraisal.appraisal_status
-                
-                # 生成备注内容
-                notes = item.comment or ""
-                if item.reasons:
-                    notes += f" | 原因: {', '.join(item.reasons)}"
-                
-                result = AppraisalResult(
-                    appraisal_id=item.appraisalId,
-                    user_id=current_user.id,
-                    result=item.appraisalResult,
-                    notes=notes,
-                    created_at=datetime.now(timezone.utc)
-                )
-                
-                session.add(result)
-                session.flush()  # 获取新插入记录的ID
-                
-                # 更新Appraisal的字段
-                appraisal.last_appraiser_id = current_user.id
-                appraisal.last_appraisal_result_id = result.id
-                appraisal.appraisal_result = item.appraisalResult
-                
-                # 根据鉴定结果设置相应的状态
-                # 0 暂无提交
-                # 1=真, 2=假 -> 状态3=已完结
-                # 3=存疑 -> 状态4=待完善
-                if item.appraisalResult == "1" or item.appraisalResult == "2":
-                    appraisal.appraisal_status = "3"  # 已完结
-                elif item.appraisalResult == "3":
-                    appraisal.appraisal_status = "4"  # 待完善
-                
-                session.add(appraisal)
-                success_count += 1
-                
-                # 只有当鉴定结果为真(1)或假(2)时，才更新统计数据
-                if item.appraisalResult in ["1", "2"] and appraisal.userinfo_id:
-                    stats_service.handle_status_change(
-                        userinfo_id=appraisal.userinfo_id,
-                        appraisal_id=appraisal.id,
-                        old_status=old_status,
-                        new_status=appraisal.appraisal_status
-                    )
-                
-                # 检测状态是否变更为需要通知的状态（3=已完结, 4=待完善, 5=已退回），如果是则发送短信通知
-                if old_status != appraisal.appraisal_status and appraisal.appraisal_status in ["3", "4", "5"]:
-                    logger.info(
-                        f"检测到状态变更为需要通知的状态: 订单ID={item.appraisalId}, "
-                        f"旧状态={old_status}, 新状态={appraisal.appraisal_status}"
-                    )
-                    
-                    # 查询用户手机号
-                    user_info = session.exec(
-                        select(UserInfo).where(UserInfo.id == appraisal.userinfo_id)
-                    ).first()
-                    
-                    if user_info and user_info.phone:
-                        # 使用延迟发送管理器
-                        delay_manager = get_sms_delay_manager()
-                        if delay_manager:
-                            try:
-                                delay_manager.schedule_delayed_sms(
-                                    appraisal_id=str(item.appraisalId),
-                                    phone=user_info.phone,
-                                    status=appraisal.appraisal_status
-                                )
-                                logger.info(
-                                    f"已调度延迟状态通知短信: 订单ID={item.appraisalId}, "
-                                    f"状态={appraisal.appraisal_status}, 手机号={user_info.phone}"
-                                )
-                            except Exception as delay_error:
-                                # 延迟发送失败不影响主业务流程
-                                logger.error(
-                                    f"延迟状态通知短信调度失败: 订单ID={item.appraisalId}, "
-                                    f"错误={str(delay_error)}",
-                                    exc_info=True
-                                )
-                        else:
-                            logger.warning("延迟发送管理器未初始化，跳过状态通知短信发送")
-                    else:
-                        logger.warning(
-                            f"未找到用户手机号，跳过状态通知短信发送: "
-                            f"订单ID={item.appraisalId}, userinfo_id={appraisal.userinfo_id}"
-                        )
-                
-            except Exception as e:
-                failed_items.append(FailedItem(
-                    appraisal_id=item.appraisalId,
-                    reason=str(e)
-                ))
+                transitions = []
+
+        # 统计只在状态变更为已完结(3)时更新，结果为真(1)/假(2)才会进入该状态；
+        # 状态变更为需要通知的状态（3=已完结, 4=待完善, 5=已退回）时由短信消费者调度通知
+        events = []
+        for item, old_status, new_status in transitions:
+            appraisal = appraisal_map[item.appraisalId]
+            success_count += 1
+            events.append({
+                "source": "result",
+                "appraisal_id": item.appraisalId,
+                "userinfo_id": appraisal.userinfo_id,
+                "old_status": old_status,
+                "new_status": new_status,
+                "appraisal_result": item.appraisalResult,
+                "operator_id": operator_id
+            })
         
         session.commit()
+
+        # 事务提交成功后才发布事件，统计更新和短信调度由后台消费者批量处理
+        get_appraisal_event_bus().publish_status_changes(events)
+
+        return success_count, failed_items
+
+    @staticmethod
+    def batch_add_appraisal_results(
+        request: AppraisalResultBatchRequest, 
+        current_user: User = Depends(get_current_user_required),
+        session: Session = Depends(get_session)
+    ):
+
+        success_count, failed_items = AppraisalService.apply_appraisal_results(
+            request.items, current_user.id, session
+        )
         
         return success_response(data=BatchAddResultData(
             success_count=success_count,
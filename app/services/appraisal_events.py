@@ -0,0 +1,386 @@
+"""
+鉴定单状态变更事件总线
+事务提交成功后将状态变更事件写入 Redis Stream，由后台消费组（统计、短信、审计）批量处理
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.utils.redis import RedisClient, get_redis
+from app.config.settings import (
+    ENVIRONMENT,
+    APPRAISAL_EVENT_BUS_ENABLED,
+    APPRAISAL_EVENT_STREAM_MAXLEN,
+    APPRAISAL_EVENT_BATCH_SIZE,
+    APPRAISAL_EVENT_BLOCK_MS,
+    APPRAISAL_EVENT_CLAIM_IDLE_MS,
+    APPRAISAL_EVENT_MAX_DELIVERIES
+)
+
+logger = logging.getLogger(__name__)
+
+
+# 消费组定义
+class EventGroup:
+    """事件消费组常量"""
+    STATS = "stats"  # 统计
+    SMS = "sms"  # 短信通知
+    AUDIT = "audit"  # 审计日志
+
+
+# 需要短信通知的状态（3=已完结, 4=待完善, 5=已退回）
+NOTIFY_STATUSES = ["3", "4", "5"]
+
+# 消费组处理函数：逐条处理并捕获单条事件的异常，返回处理失败的事件（入参中的元素），全部成功返回空列表；
+# 抛出异常表示整批未处理（不能有已生效的副作用），整批保持未确认等待再次投递
+EventHandler = Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]
+
+
+def handle_stats_events(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """统计消费组：批量更新已完成集合（集合写入幂等，单个 pipeline 内完成）"""
+    from app.services.appraisal_stats import get_appraisal_stats_service
+    get_appraisal_stats_service().handle_status_changes(events)
+    return []
+
+
+def _load_phone_map(userinfo_ids: List[str]) -> Dict[str, Optional[str]]:
+    """一次 IN 查询加载用户手机号（手机号不写入事件流）"""
+    from sqlmodel import Session, select
+    from app.models.user_info import UserInfo
+    from app.utils.db import engine
+
+    userinfo_ids = list({uid for uid in userinfo_ids if uid})
+    if not userinfo_ids:
+        return {}
+    with Session(engine) as session:
+        userinfos = session.exec(
+            select(UserInfo).where(UserInfo.id.in_(userinfo_ids))
+        ).all()
+    return {u.id: u.phone for u in userinfos}
+
+
+def handle_sms_events(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """短信消费组：状态变更为需要通知的状态时调度延迟短信，返回调度失败的事件"""
+    from app.services.sms import get_sms_delay_manager
+
+    notify_events = [
+        event for event in events
+        if event.get("old_status") != event.get("new_status") and event.get("new_status") in NOTIFY_STATUSES
+    ]
+    if not notify_events:
+        return []
+    phone_map = _load_phone_map([event.get("userinfo_id") for event in notify_events])
+
+    failed = []
+    for event in notify_events:
+        old_status = event.get("old_status")
+        new_status = event.get("new_status")
+        appraisal_id = event.get("appraisal_id")
+        phone = phone_map.get(event.get("userinfo_id"))
+        logger.info(
+            f"检测到状态变更为需要通知的状态: 订单ID={appraisal_id}, "
+            f"旧状态={old_status}, 新状态={new_status}"
+        )
+
+        if not phone:
+            logger.warning(
+                f"未找到用户手机号，跳过状态通知短信发送: "
+                f"订单ID={appraisal_id}, userinfo_id={event.get('userinfo_id')}"
+            )
+            continue
+
+        # 使用延迟发送管理器
+        delay_manager = get_sms_delay_manager()
+        if not delay_manager:
+            logger.warning("延迟发送管理器未初始化，跳过状态通知短信发送")
+            continue
+
+        try:
+            if not delay_manager.schedule_delayed_sms(
+                appraisal_id=str(appraisal_id),
+                phone=phone,
+                status=new_status
+            ):
+                failed.append(event)
+                continue
+            logger.info(
+                f"已调度延迟状态通知短信: 订单ID={appraisal_id}, "
+                f"状态={new_status}, 手机号={phone}"
+            )
+        except Exception as delay_error:
+            # 延迟发送失败不影响其他事件，失败的事件等待再次投递
+            logger.error(
+                f"延迟状态通知短信调度失败: 订单ID={appraisal_id}, "
+                f"错误={str(delay_error)}",
+                exc_info=True
+            )
+            failed.append(event)
+    return failed
+
+
+def handle_audit_events(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """审计消费组：记录鉴定单变更日志"""
+    for event in events:
+        logger.info(
+            f"[审计] 鉴定单变更: 来源={event.get('source')}, 订单ID={event.get('appraisal_id')}, "
+            f"操作人={event.get('operator_id')}, 状态: {event.get('old_status')}->{event.get('new_status')}, "
+            f"鉴定结果={event.get('appraisal_result')}"
+        )
+    return []
+
+
+class AppraisalEventBus:
+    """鉴定单事件总线"""
+    
+    def __init__(self, redis_client: Optional[RedisClient] = None):
+        """
+        初始化事件总线
+        
+        Args:
+            redis_client: Redis客户端实例，不传则使用默认实例
+        """
+        self.redis = redis_client or get_redis()
+        # Redis key前缀：生产环境用"online"，其他环境用"dev"
+        self.env_prefix = "online" if ENVIRONMENT == "production" else "dev"
+        self.stream_key = f"{self.env_prefix}:appraisal_events"
+        self.dead_letter_key = f"{self.stream_key}:dead"
+        self.consumer_name = f"{socket.gethostname()}-{os.getpid()}"
+        self._handlers: Dict[str, EventHandler] = {
+            EventGroup.STATS: handle_stats_events,
+            EventGroup.SMS: handle_sms_events,
+            EventGroup.AUDIT: handle_audit_events,
+        }
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+    
+    # ========== 序列化 ==========
+    
+    @staticmethod
+    def _encode(event: Dict[str, Any]) -> Dict[str, str]:
+        """Stream 字段只能是字符串，None 编码为空串"""
+        return {k: "" if v is None else str(v) for k, v in event.items()}
+    
+    @staticmethod
+    def _decode(fields: Dict[str, str]) -> Dict[str, Any]:
+        """空串还原为 None"""
+        return {k: v if v != "" else None for k, v in fields.items()}
+    
+    # ========== 发布 ==========
+    
+    def publish_status_changes(self, events: List[Dict[str, Any]]) -> None:
+        """
+        发布状态变更事件（必须在事务提交成功后调用）
+        
+        事件总线关闭或 Redis 不可用时，在当前线程直接执行各消费组的处理逻辑，保证副作用不丢失；
+        只对未写入 Stream 的事件同步处理，已写入的由消费者处理，避免副作用重复
+        
+        Args:
+            events: 事件列表，字段包括 appraisal_id, userinfo_id, old_status,
+                    new_status, appraisal_result, source, operator_id
+        """
+        if not events:
+            return
+        
+        if not APPRAISAL_EVENT_BUS_ENABLED:
+            self.dispatch_locally(events)
+            return
+        
+        now_ms = int(time.time() * 1000)
+        # MULTI/EXEC 包裹：EXEC 未执行时一条都不会写入；单条命令出错时只有该条未写入
+        with self.redis.transaction(raise_on_error=False) as pipe:
+            for event in events:
+                pipe.xadd(
+                    self.stream_key,
+                    self._encode({**event, "created_at": now_ms}),
+                    maxlen=APPRAISAL_EVENT_STREAM_MAXLEN,
+                    approximate=True
+                )
+        
+        if not pipe.succeeded:
+            logger.error(f"发布鉴定状态变更事件失败，改为同步处理: 数量={len(events)}, 错误={pipe.error}")
+            self.dispatch_locally(events)
+            return
+        
+        errors = [result for result in pipe.results if isinstance(result, Exception)]
+        unpublished = [event for event, result in zip(events, pipe.results) if isinstance(result, Exception)]
+        logger.info(f"已发布鉴定状态变更事件: 数量={len(events) - len(unpublished)}")
+        if unpublished:
+            logger.error(f"部分鉴定状态变更事件写入失败，改为同步处理: 数量={len(unpublished)}, 错误={errors[0]}")
+            self.dispatch_locally(unpublished)
+    
+    def dispatch_locally(self, events: List[Dict[str, Any]]) -> None:
+        """在当前线程依次执行所有消费组的处理逻辑"""
+        for group, handler in self._handlers.items():
+            try:
+                failed = handler(events)
+                if failed:
+                    logger.error(f"同步处理鉴定事件部分失败: group={group}, 失败数量={len(failed)}")
+            except Exception as e:
+                logger.error(f"同步处理鉴定事件失败: group={group}, 错误={e}", exc_info=True)
+    
+    # ========== 消费 ==========
+    
+    def start(self) -> None:
+        """为每个消费组启动一个后台消费线程"""
+        if not APPRAISAL_EVENT_BUS_ENABLED or self._threads:
+            return
+        
+        self._stop_event.clear()
+        for group, handler in self._handlers.items():
+            thread = threading.Thread(
+                target=self._consume_loop,
+                args=(group, handler),
+                daemon=True,
+                name=f"appraisal-events-{group}"
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"鉴定事件消费者已启动: consumer={self.consumer_name}, groups={list(self._handlers)}")
+    
+    def stop(self, timeout: float = 5.0) -> None:
+        """停止所有消费线程，未确认的事件由其他消费者或下次启动时接管"""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        logger.info("鉴定事件消费者已停止")
+    
+    def _ensure_group(self, client, group: str) -> None:
+        """创建消费组（已存在则忽略）"""
+        try:
+            client.xgroup_create(self.stream_key, group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+    
+    def _consume_loop(self, group: str, handler: EventHandler) -> None:
+        """消费循环：先接管超时未确认的事件，再读取新事件，处理成功后确认"""
+        group_ready = False
+        while not self._stop_event.is_set():
+            try:
+                client = self.redis.get_client()
+                if not group_ready:
+                    self._ensure_group(client, group)
+                    group_ready = True
+                
+                # 接管其他消费者（如已退出的 Pod）超时未确认的事件
+                _, messages, *_ = client.xautoclaim(
+                    self.stream_key, group, self.consumer_name,
+                    min_idle_time=APPRAISAL_EVENT_CLAIM_IDLE_MS,
+                    start_id="0-0",
+                    count=APPRAISAL_EVENT_BATCH_SIZE
+                )
+                if not messages:
+                    response = client.xreadgroup(
+                        group, self.consumer_name, {self.stream_key: ">"},
+                        count=APPRAISAL_EVENT_BATCH_SIZE,
+                        block=APPRAISAL_EVENT_BLOCK_MS
+                    )
+                    messages = response[0][1] if response else []
+                if not messages:
+                    continue
+                
+                # 已被 MAXLEN 裁剪的事件 fields 为空，直接确认
+                acked = [message_id for message_id, fields in messages if not fields]
+                events = [(message_id, self._decode(fields)) for message_id, fields in messages if fields]
+                acked.extend(self._handle_batch(client, group, handler, events))
+                if acked:
+                    client.xack(self.stream_key, group, *acked)
+                logger.debug(f"已处理鉴定事件: group={group}, 数量={len(messages)}, 确认={len(acked)}")
+            
+            except Exception as e:
+                if "NOGROUP" in str(e):
+                    group_ready = False
+                logger.error(f"鉴定事件消费失败: group={group}, 错误={e}", exc_info=True)
+                self._stop_event.wait(1)
+
+    
+    def _handle_batch(
+        self,
+        client,
+        group: str,
+        handler: EventHandler,
+        events: List[Tuple[str, Dict[str, Any]]]
+    ) -> List[str]:
+        """
+        处理一批事件：处理函数逐条报告失败，成功的事件确认，失败的事件保持未确认等待再次投递；
+        成功的事件不会重新处理，副作用不会重复
+        
+        Returns:
+            可以确认的消息ID（处理成功或已移入死信流）
+        """
+        if not events:
+            return []
+        try:
+            failed_events = handler([event for _, event in events]) or []
+            error: Exception = RuntimeError("消费组处理函数报告失败")
+        except Exception as e:
+            # 整批未处理
+            logger.error(f"鉴定事件批量处理失败: group={group}, 数量={len(events)}, 错误={e}", exc_info=True)
+            failed_events = [event for _, event in events]
+            error = e
+        
+        failed_ids = {id(event) for event in failed_events}
+        handled = [message_id for message_id, event in events if id(event) not in failed_ids]
+        failed = {message_id: (event, error) for message_id, event in events if id(event) in failed_ids}
+        if failed:
+            logger.warning(f"鉴定事件处理失败，等待再次投递: group={group}, 消息ID={list(failed)}")
+            handled.extend(self._dead_letter_exhausted(client, group, failed))
+        return handled
+    
+    def _dead_letter_exhausted(
+        self,
+        client,
+        group: str,
+        failed: Dict[str, Tuple[Dict[str, Any], Exception]]
+    ) -> List[str]:
+        """
+        投递次数达到上限的失败事件写入死信流
+        
+        Returns:
+            已写入死信流、可以确认的消息ID
+        """
+        exhausted = []
+        for message_id, (event, error) in failed.items():
+            pending = client.xpending_range(self.stream_key, group, min=message_id, max=message_id, count=1)
+            deliveries = pending[0]["times_delivered"] if pending else 0
+            if deliveries >= APPRAISAL_EVENT_MAX_DELIVERIES:
+                exhausted.append((message_id, event, error, deliveries))
+        if not exhausted:
+            return []
+        
+        pipe = client.pipeline(transaction=False)
+        for message_id, event, error, deliveries in exhausted:
+            pipe.xadd(
+                self.dead_letter_key,
+                self._encode({
+                    **event,
+                    "group": group,
+                    "message_id": message_id,
+                    "deliveries": deliveries,
+                    "error": str(error)
+                }),
+                maxlen=APPRAISAL_EVENT_STREAM_MAXLEN,
+                approximate=True
+            )
+        pipe.execute()
+        logger.error(
+            f"鉴定事件多次处理失败，已移入死信流: group={group}, "
+            f"消息ID={[message_id for message_id, *_ in exhausted]}, 死信流={self.dead_letter_key}"
+        )
+        return [message_id for message_id, *_ in exhausted]
+
+
+# 全局事件总线实例
+_event_bus: Optional[AppraisalEventBus] = None
+
+
+def get_appraisal_event_bus() -> AppraisalEventBus:
+    """获取事件总线实例（单例模式）"""
+    global _event_bus
+    if _event_bus is None:
+        _event_bus = AppraisalEventBus()
+    return _event_bus
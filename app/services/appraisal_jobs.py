@@ -0,0 +1,286 @@
+"""
+鉴定批量后台任务服务
+超大批量的更新/结果提交按固定大小分块，每块一个独立事务，由后台线程处理；
+任务进度与失败项保存在 Redis 中，任意实例均可查询
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlmodel import Session
+
+from app.config.settings import (
+    ENVIRONMENT,
+    APPRAISAL_JOB_CHUNK_SIZE,
+    APPRAISAL_JOB_WORKERS,
+    APPRAISAL_JOB_TTL,
+    APPRAISAL_JOB_SHUTDOWN_TIMEOUT
+)
+from app.schemas.appraisal import (
+    AppraisalUpdateItem, AppraisalResultItem, BatchJobData, FailedItem
+)
+from app.utils.db import engine
+from app.utils.redis import RedisClient, get_redis
+
+logger = logging.getLogger(__name__)
+
+
+# 任务类型与状态定义
+class JobType:
+    """任务类型常量"""
+    UPDATE = "update"  # 批量更新鉴定单
+    RESULT = "result"  # 批量添加鉴定结果
+
+
+class JobStatus:
+    """任务状态常量"""
+    PENDING = "pending"  # 排队中
+    RUNNING = "running"  # 处理中
+    COMPLETED = "completed"  # 已完成
+    INTERRUPTED = "interrupted"  # 服务关闭导致中断
+
+
+class AppraisalJobService:
+    """鉴定批量后台任务服务类"""
+    
+    def __init__(self, redis_client: Optional[RedisClient] = None):
+        """
+        初始化任务服务
+        
+        Args:
+            redis_client: Redis客户端实例，不传则使用默认实例
+        """
+        self.redis = redis_client or get_redis()
+        # Redis key前缀：生产环境用"online"，其他环境用"dev"
+        self.env_prefix = "online" if ENVIRONMENT == "production" else "dev"
+        self.chunk_size = APPRAISAL_JOB_CHUNK_SIZE
+        self.job_ttl = APPRAISAL_JOB_TTL
+        self._executor = ThreadPoolExecutor(
+            max_workers=APPRAISAL_JOB_WORKERS,
+            thread_name_prefix="appraisal-job"
+        )
+        self._stop_event = threading.Event()
+        # 未结束的任务，关闭时据此把排队中/执行中的任务标记为中断
+        self._futures: Dict[str, Future] = {}
+        self._futures_lock = threading.Lock()
+    
+    # ========== Key生成 ==========
+    
+    def _get_job_key(self, job_id: str) -> str:
+        """生成任务进度的key"""
+        return f"{self.env_prefix}:appraisal_job:{job_id}"
+    
+    def _get_failed_key(self, job_id: str) -> str:
+        """生成任务失败项列表的key"""
+        return f"{self.env_prefix}:appraisal_job:{job_id}:failed"
+    
+    # ========== 提交任务 ==========
+    
+    def submit_update_job(self, items: List[AppraisalUpdateItem]) -> BatchJobData:
+        """
+        提交批量更新鉴定单任务
+        
+        Args:
+            items: 鉴定更新项列表
+        
+        Returns:
+            任务初始状态
+        """
+        from app.services.appraisal import AppraisalService
+        return self._submit(
+            JobType.UPDATE,
+            items,
+            lambda chunk, session: AppraisalService.apply_appraisal_updates(chunk, session),
+            lambda item: item.id
+        )
+    
+    def submit_result_job(self, items: List[AppraisalResultItem], operator_id: int) -> BatchJobData:
+        """
+        提交批量添加鉴定结果任务
+        
+        Args:
+            items: 鉴定结果项列表
+            operator_id: 提交结果的鉴定师ID
+        
+        Returns:
+            任务初始状态
+        """
+        from app.services.appraisal import AppraisalService
+        return self._submit(
+            JobType.RESULT,
+            items,
+            lambda chunk, session: AppraisalService.apply_appraisal_results(chunk, operator_id, session),
+            lambda item: item.appraisalId
+        )
+    
+    def _submit(
+        self,
+        job_type: str,
+        items: List[Any],
+        apply_chunk: Callable[[List[Any], Session], Tuple[int, List[FailedItem]]],
+        get_item_id: Callable[[Any], str]
+    ) -> BatchJobData:
+        """记录任务初始状态并交给后台线程处理"""
+        job_id = uuid.uuid4().hex
+        now = int(time.time())
+        job = BatchJobData(
+            job_id=job_id,
+            job_type=job_type,
+            status=JobStatus.PENDING,
+            total=len(items),
+            created_at=now,
+            updated_at=now
+        )
+        
+        key = self._get_job_key(job_id)
+        with self.redis.pipeline() as pipe:
+            pipe.hset(key, mapping=job.model_dump(exclude={"failed_items", "error"}))
+            pipe.expire(key, self.job_ttl)
+        if not pipe.succeeded:
+            raise RuntimeError("任务状态写入 Redis 失败")
+        
+        future = self._executor.submit(self._run, job_id, items, apply_chunk, get_item_id)
+        with self._futures_lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._forget(job_id))
+        logger.info(f"已提交鉴定批量任务: job_id={job_id}, 类型={job_type}, 条数={len(items)}")
+        return job
+    
+    # ========== 执行任务 ==========
+    
+    def _run(
+        self,
+        job_id: str,
+        items: List[Any],
+        apply_chunk: Callable[[List[Any], Session], Tuple[int, List[FailedItem]]],
+        get_item_id: Callable[[Any], str]
+    ) -> None:
+        """逐块处理，每块一个事务，块级异常只影响本块"""
+        self._update_job(job_id, {"status": JobStatus.RUNNING})
+        
+        for start in range(0, len(items), self.chunk_size):
+            if self._stop_event.is_set():
+                self._update_job(job_id, {"status": JobStatus.INTERRUPTED, "error": f"服务关闭，任务中断，已处理 {start} 条"})
+                logger.warning(f"鉴定批量任务中断: job_id={job_id}, 已处理={start}/{len(items)}")
+                return
+            
+            chunk = items[start:start + self.chunk_size]
+            try:
+                with Session(engine) as session:
+                    success_count, failed_items = apply_chunk(chunk, session)
+            except Exception as e:
+                logger.error(f"鉴定批量任务分块失败: job_id={job_id}, 起始={start}, 错误={e}", exc_info=True)
+                success_count = 0
+                failed_items = [FailedItem(appraisal_id=get_item_id(item), reason=str(e)) for item in chunk]
+            
+            self._record_progress(job_id, len(chunk), success_count, failed_items)
+        
+        self._update_job(job_id, {"status": JobStatus.COMPLETED})
+        logger.info(f"鉴定批量任务完成: job_id={job_id}, 条数={len(items)}")
+    
+    def _update_job(self, job_id: str, fields: Dict[str, Any]) -> None:
+        """更新任务字段"""
+        mapping = {k: v for k, v in fields.items() if v is not None}
+        mapping["updated_at"] = int(time.time())
+        self.redis.hset(self._get_job_key(job_id), mapping=mapping)
+    
+    def _record_progress(
+        self,
+        job_id: str,
+        processed: int,
+        success_count: int,
+        failed_items: List[FailedItem]
+    ) -> None:
+        """单次 pipeline 写入一个分块的进度与失败项"""
+        key = self._get_job_key(job_id)
+        failed_key = self._get_failed_key(job_id)
+        with self.redis.pipeline() as pipe:
+            pipe.hincrby(key, "processed", processed)
+            pipe.hincrby(key, "success_count", success_count)
+            pipe.hincrby(key, "failed_count", len(failed_items))
+            pipe.hset(key, "updated_at", int(time.time()))
+            if failed_items:
+                pipe.rpush(failed_key, *[json.dumps(item.model_dump(), ensure_ascii=False) for item in failed_items])
+                pipe.expire(failed_key, self.job_ttl)
+        if not pipe.succeeded:
+            logger.error(f"记录鉴定批量任务进度失败: job_id={job_id}, 错误={pipe.error}")
+    
+    # ========== 查询任务 ==========
+    
+    def get_job(self, job_id: str) -> Optional[BatchJobData]:
+        """
+        查询任务进度与失败项
+        
+        Args:
+            job_id: 任务ID
+        
+        Returns:
+            任务数据，不存在或已过期时返回None
+        """
+        job = self.redis.hgetall(self._get_job_key(job_id))
+        if not job:
+            return None
+        
+        try:
+            raw_failed = self.redis.get_client().lrange(self._get_failed_key(job_id), 0, -1)
+        except Exception as e:
+            logger.error(f"获取鉴定批量任务失败项失败: job_id={job_id}, 错误={e}", exc_info=True)
+            raw_failed = []
+        
+        return BatchJobData(
+            **job,
+            failed_items=[FailedItem(**json.loads(raw)) for raw in raw_failed]
+        )
+    
+    def _forget(self, job_id: str) -> None:
+        """任务结束（完成、中断或取消）后移除记录"""
+        with self._futures_lock:
+            self._futures.pop(job_id, None)
+    
+    def shutdown(self) -> None:
+        """
+        停止接收新分块并把未完成的任务标记为中断：
+        排队中的任务直接取消；执行中的任务在当前分块完成后自行标记，
+        超过等待时间仍未结束的按已写入的进度标记
+        """
+        self._stop_event.set()
+        with self._futures_lock:
+            futures = dict(self._futures)
+        
+        running = {}
+        for job_id, future in futures.items():
+            if future.cancel():
+                self._update_job(job_id, {"status": JobStatus.INTERRUPTED, "error": "服务关闭，任务未开始执行"})
+                logger.warning(f"鉴定批量任务未开始即被取消: job_id={job_id}")
+            else:
+                running[job_id] = future
+        self._executor.shutdown(wait=False)
+        
+        if not running:
+            return
+        _, not_done = wait(running.values(), timeout=APPRAISAL_JOB_SHUTDOWN_TIMEOUT)
+        for job_id, future in running.items():
+            if future not in not_done:
+                continue
+            processed = self.redis.hget(self._get_job_key(job_id), "processed") or 0
+            self._update_job(job_id, {
+                "status": JobStatus.INTERRUPTED,
+                "error": f"服务关闭时分块仍在执行，任务中断，已处理 {processed} 条"
+            })
+            logger.warning(f"鉴定批量任务关闭时仍在执行: job_id={job_id}, 已处理={processed}")
+
+
+# 全局任务服务实例
+_job_service: Optional[AppraisalJobService] = None
+
+
+def get_appraisal_job_service() -> AppraisalJobService:
+    """获取任务服务实例（单例模式）"""
+    global _job_service
+    if _job_service is None:
+        _job_service = AppraisalJobService()
+    return _job_service
@@ -3,7 +3,7 @@
 用于管理用户鉴定单的状态统计数据（Redis）
 """
 import logging
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from app.utils.redis import RedisClient, get_redis
 from app.config.settings import ENVIRONMENT
 
@@ -58,15 +58,46 @@ class AppraisalStatsService:
         """
         try:
             key = self._get_completed_key(userinfo_id)
-            self.redis.sadd(key, appraisal_id)
-            # 设置过期时间（7天）
-            self.redis.expire(key, self.completed_ttl)
+            with self.redis.pipeline() as pipe:
+                pipe.sadd(key, appraisal_id)
+                # 设置过期时间（7天）
+                pipe.expire(key, self.completed_ttl)
+            if not pipe.succeeded:
+                logger.error(f"添加到已完成集合失败: userinfo_id={userinfo_id}, appraisal_id={appraisal_id}, 错误={pipe.error}")
+                return False
             logger.info(f"添加到已完成集合: userinfo_id={userinfo_id}, appraisal_id={appraisal_id}, TTL={self.completed_ttl}s")
             return True
         except Exception as e:
             logger.error(f"添加到已完成集合失败: {e}", exc_info=True)
             return False
     
+    def add_many_to_completed(self, items: List[Dict[str, str]]) -> bool:
+        """
+        批量添加到已完成集合（单次 pipeline 往返）
+        
+        同一用户的多个鉴定单合并为一次 SADD，每个 key 只刷新一次过期时间
+        
+        Args:
+            items: [{"userinfo_id": 用户ID, "appraisal_id": 鉴定单ID}, ...]
+        
+        Returns:
+            是否成功
+        """
+        if not items:
+            return True
+        try:
+            grouped: Dict[str, List[str]] = {}
+            for item in items:
+                grouped.setdefault(self._get_completed_key(item["userinfo_id"]), []).append(item["appraisal_id"])
+            
+            # 设置过期时间（7天）
+            self.redis.sadd_many(grouped, ex=self.completed_ttl)
+            logger.info(f"批量添加到已完成集合: 用户数={len(grouped)}, 鉴定单数={len(items)}, TTL={self.completed_ttl}s")
+            return True
+        except Exception as e:
+            logger.error(f"批量添加到已完成集合失败: {e}", exc_info=True)
+            return False
+    
     def remove_from_completed(self, userinfo_id: str, appraisal_id: str) -> bool:
         """
         从已完成集合移除
@@ -80,9 +111,13 @@ class AppraisalStatsService:
         """
         try:
             key = self._get_completed_key(userinfo_id)
-            self.redis.srem(key, appraisal_id)
-            # 刷新过期时间（7天）
-            self.redis.expire(key, self.completed_ttl)
+            with self.redis.pipeline() as pipe:
+                pipe.srem(key, appraisal_id)
+                # 刷新过期时间（7天）
+                pipe.expire(key, self.completed_ttl)
+            if not pipe.succeeded:
+                logger.error(f"从已完成集合移除失败: userinfo_id={userinfo_id}, appraisal_id={appraisal_id}, 错误={pipe.error}")
+                return False
             logger.info(f"从已完成集合移除: userinfo_id={userinfo_id}, appraisal_id={appraisal_id}, TTL={self.completed_ttl}s")
             return True
         except Exception as e:
@@ -206,6 +241,31 @@ class AppraisalStatsService:
         except Exception as e:
             logger.error(f"处理状态变更失败: {e}", exc_info=True)
 
+    
+    def handle_status_changes(self, changes: List[Dict[str, Optional[str]]]) -> None:
+        """
+        批量处理鉴定单状态变更，所有统计写入在一个 pipeline 中完成
+        
+        业务规则与 handle_status_change 相同，用于批量接口在事务提交后统一调用
+        
+        Args:
+            changes: [{"userinfo_id", "appraisal_id", "old_status", "new_status"}, ...]
+        """
+        try:
+            completed = [
+                {"userinfo_id": change["userinfo_id"], "appraisal_id": change["appraisal_id"]}
+                for change in changes
+                if change.get("userinfo_id")
+                and change.get("new_status") == AppraisalStatus.COMPLETED
+                and change.get("old_status") != change.get("new_status")
+            ]
+            if not completed:
+                logger.debug(f"批量状态变更中没有变更为已完成的鉴定单，跳过统计: 总数={len(changes)}")
+                return
+            self.add_many_to_completed(completed)
+        
+        except Exception as e:
+            logger.error(f"批量处理状态变更失败: {e}", exc_info=True)
 
 # 全局统计服务实例
 _stats_service: Optional[AppraisalStatsService] = None
@@ -6,6 +6,14 @@ import uuid
 
 from app.models.article import Article
 from app.schemas.article import ArticleListData, ArticleDetail, ArticleUpdate, ArticleCreate
+from app.utils.cache import cached, invalidate_tags
+
+# 缓存标签：文章列表（任一文章变更都会影响），单篇文章
+ARTICLE_LIST_TAG = "article:list"
+
+
+def _article_tag(article_id: str) -> str:
+    return f"article:{article_id}"
 
 
 class ArticleService:
@@ -34,10 +42,12 @@ class ArticleService:
         session.add(new_article)
         session.commit()
         session.refresh(new_article)
+        invalidate_tags(ARTICLE_LIST_TAG)
         
         return new_article.id
     
     @staticmethod
+    @cached("article:list", ttl=60, model=ArticleListData, tags=[ARTICLE_LIST_TAG])
     def get_article_list(
         page: int = 1,
         pageSize: int = 20,
@@ -100,6 +110,13 @@ class ArticleService:
         )
     
     @staticmethod
+    @cached(
+        "article:detail",
+        ttl=300,
+        key=lambda args: args["article_id"],
+        tags=lambda args: [_article_tag(args["article_id"])],
+        model=ArticleDetail
+    )
     def get_article_detail(article_id: str, session: Session) -> Optional[ArticleDetail]:
         article = session.get(Article, article_id)
         
@@ -138,5 +155,6 @@ class ArticleService:
         session.add(article)
         session.commit()
         session.refresh(article)
+        invalidate_tags(_article_tag(article_id), ARTICLE_LIST_TAG)
         
         return True
\ No newline at end of file
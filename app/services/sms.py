@@ -1,18 +1,12 @@
 """
 短信服务封装
 提供鉴定结果变更的短信通知功能
+腾讯云 SDK 在首次创建短信服务时才导入，避免拖慢应用冷启动（启动后由后台预热线程提前加载）
 """
 import logging
 import threading
-from typing import Optional, Dict, Any
-
-try:
-    from tencentcloud.common import credential
-    from tencentcloud.common.exception.tencent_cloud_sdk_exception import TencentCloudSDKException
-    from tencentcloud.sms.v20210111 import sms_client, models
-except ImportError:
-    logging.error("腾讯云 SDK 未安装，请运行: pip install tencentcloud-sdk-python")
-    raise
+import time
+from typing import Optional, Dict, Any, Callable, List, Tuple
 
 from app.config.settings import (
     TENCENT_CLOUD_SECRET_ID,
@@ -20,14 +14,47 @@ from app.config.settings import (
     SMS_SDK_APP_ID,
     SMS_REGION,
     SMS_SIGN_NAME,
+    SMS_PROVIDERS,
+    SMS_FAKE_LATENCY_MS,
+    SMS_MAX_PHONES_PER_REQUEST,
+    SMS_ENDPOINT,
+    SMS_REQ_TIMEOUT,
+    SMS_KEEP_ALIVE,
+    SMS_SIGN_METHOD,
+    SMS_CONN_KEEPALIVE_INTERVAL,
+    SMS_HEDGE_AFTER_MS,
+    SMS_DISPATCH_WORKERS,
     SMS_TEMPLATE_STATUS_COMPLETE,
     SMS_TEMPLATE_DOUBT,
     SMS_TEMPLATE_REJECTED
 )
+from app.services.sms_ledger import get_sms_ledger_service
+from app.services.sms_providers import FailoverSmsClient, SmsProvider
+from app.utils.metrics import LatencyRecorder
 
 logger = logging.getLogger(__name__)
 
 
+def _import_sdk():
+    """
+    按需导入腾讯云短信 SDK
+    
+    Returns:
+        (credential, profile, sms_client, models, TencentCloudSDKException)，
+        profile 为 (ClientProfile, HttpProfile)
+    """
+    try:
+        from tencentcloud.common import credential
+        from tencentcloud.common.exception.tencent_cloud_sdk_exception import TencentCloudSDKException
+        from tencentcloud.common.profile.client_profile import ClientProfile
+        from tencentcloud.common.profile.http_profile import HttpProfile
+        from tencentcloud.sms.v20210111 import sms_client, models
+    except ImportError:
+        logger.error("腾讯云 SDK 未安装，请运行: pip install tencentcloud-sdk-python")
+        raise
+    return credential, (ClientProfile, HttpProfile), sms_client, models, TencentCloudSDKException
+
+
 class SmsService:
     """短信服务类"""
     
@@ -45,18 +72,154 @@ class SmsService:
     def __init__(self):
         """初始化短信客户端"""
         if not hasattr(self, '_initialized'):
-            self._validate_config()
+            credential, profile, sms_client, self._models, self._sdk_exception = _import_sdk()
+            # SendSms 调用耗时（含失败），用于观察连接复用后的尾延迟
+            self.send_latency = LatencyRecorder()
+            self._last_request_at = 0.0
+            self._keepalive_thread: Optional[threading.Thread] = None
+            self._keepalive_stop = threading.Event()
             
-            # 实例化认证对象
-            cred = credential.Credential(
-                TENCENT_CLOUD_SECRET_ID,
-                TENCENT_CLOUD_SECRET_KEY
-            )
+            specs = [spec.strip() for spec in SMS_PROVIDERS.split(",") if spec.strip()]
+            if any(spec.split(":")[0] == "tencent" for spec in specs):
+                self._validate_config()
             
-            # 实例化短信客户端
-            self.client = sms_client.SmsClient(cred, SMS_REGION)
+            # 按配置顺序创建短信通道，由故障转移客户端统一调用
+            providers = [self._create_provider(spec, credential, profile, sms_client) for spec in specs]
+            self.client = FailoverSmsClient(
+                providers,
+                hedge_after_ms=SMS_HEDGE_AFTER_MS,
+                hedge_workers=SMS_DISPATCH_WORKERS * 2
+            )
             self._initialized = True
-            logger.info("短信服务初始化成功")
+            logger.info(
+                f"短信服务初始化成功: 通道={[provider.name for provider in providers]}, "
+                f"对冲={SMS_HEDGE_AFTER_MS}ms"
+            )
+    
+    @staticmethod
+    def _create_provider(spec: str, credential, profile, sms_client) -> SmsProvider:
+        """
+        按配置创建短信通道
+        
+        Args:
+            spec: 通道配置，tencent[:地域] 或 fake[:耗时毫秒[:错误率]]
+            credential: SDK credential 模块
+            profile: (ClientProfile, HttpProfile)
+            sms_client: SDK sms_client 模块
+            
+        Returns:
+            短信通道
+        """
+        name, _, arg = spec.partition(":")
+        if name == "fake":
+            # 本地假实现，不发送真实短信
+            from app.services.sms_fake import FakeSmsClient
+            latency_ms, _, error_rate = arg.partition(":")
+            logger.warning(f"短信通道 {spec} 使用本地假实现，不会发送真实短信")
+            return SmsProvider(spec, FakeSmsClient(
+                latency_ms=float(latency_ms) if latency_ms else SMS_FAKE_LATENCY_MS,
+                max_phones_per_request=SMS_MAX_PHONES_PER_REQUEST,
+                error_rate=float(error_rate) if error_rate else 0
+            ), timeout_ms=SMS_REQ_TIMEOUT * 1000)
+        
+        if name != "tencent":
+            raise ValueError(f"不支持的短信通道: {spec}")
+        
+        # 主地域使用 SMS_ENDPOINT（默认就近接入），其他地域使用地域域名
+        region = arg or SMS_REGION
+        endpoint = SMS_ENDPOINT if region == SMS_REGION else f"sms.{region}.tencentcloudapi.com"
+        cred = credential.Credential(
+            TENCENT_CLOUD_SECRET_ID,
+            TENCENT_CLOUD_SECRET_KEY
+        )
+        
+        # 实例化短信客户端：缩短超时、复用 HTTPS 连接
+        client_profile_cls, http_profile_cls = profile
+        http_profile = http_profile_cls(
+            endpoint=endpoint,
+            reqTimeout=SMS_REQ_TIMEOUT,
+            keepAlive=SMS_KEEP_ALIVE
+        )
+        client_profile = client_profile_cls(signMethod=SMS_SIGN_METHOD, httpProfile=http_profile)
+        logger.info(
+            f"短信通道 {spec}: endpoint={endpoint}, 超时={SMS_REQ_TIMEOUT}秒, "
+            f"keep-alive={SMS_KEEP_ALIVE}, 签名方法={SMS_SIGN_METHOD}"
+        )
+        return SmsProvider(
+            spec,
+            sms_client.SmsClient(cred, region, client_profile),
+            timeout_ms=SMS_REQ_TIMEOUT * 1000
+        )
+    
+    def warm_connection(self) -> bool:
+        """
+        发送一次只读的轻量请求（查询签名状态），提前完成 DNS 解析与 TLS 握手，
+        之后的 SendSms 复用该连接；请求返回业务错误（如无权限）时连接同样已建立
+        
+        Returns:
+            所有通道的连接是否都可用（假实现通道不需要预热）
+        """
+        ok = True
+        for provider in self.client.providers:
+            if not hasattr(provider.client, "DescribeSmsSignList"):
+                continue
+            started = time.monotonic()
+            try:
+                req = self._models.DescribeSmsSignListRequest()
+                req.SignIdSet = [0]
+                req.International = 0
+                provider.client.DescribeSmsSignList(req)
+            except self._sdk_exception as e:
+                if e.code == "ClientNetworkError":
+                    logger.warning(f"短信通道 {provider.name} 连接预热失败: {e.message}")
+                    ok = False
+                    continue
+            except Exception as e:
+                logger.warning(f"短信通道 {provider.name} 连接预热失败: {str(e)}")
+                ok = False
+                continue
+            logger.debug(f"短信通道 {provider.name} 连接预热完成，耗时 {(time.monotonic() - started) * 1000:.0f}ms")
+        self._last_request_at = time.monotonic()
+        return ok
+    
+    def start_keepalive(self) -> None:
+        """
+        启动保活线程：连接空闲超过 SMS_CONN_KEEPALIVE_INTERVAL 秒时发一次轻量请求，
+        避免服务端或中间网络关闭空闲连接后，下一条短信重新握手
+        """
+        if not SMS_KEEP_ALIVE or SMS_CONN_KEEPALIVE_INTERVAL <= 0:
+            return
+        if not any(hasattr(provider.client, "DescribeSmsSignList") for provider in self.client.providers):
+            return
+        if self._keepalive_thread is not None:
+            return
+        self._keepalive_stop.clear()
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop, name="sms-keepalive", daemon=True)
+        self._keepalive_thread.start()
+    
+    def _keepalive_loop(self) -> None:
+        """保活线程主循环，收到停止信号后退出"""
+        while not self._keepalive_stop.is_set():
+            idle = time.monotonic() - self._last_request_at
+            if idle < SMS_CONN_KEEPALIVE_INTERVAL:
+                self._keepalive_stop.wait(SMS_CONN_KEEPALIVE_INTERVAL - idle)
+                continue
+            self.warm_connection()
+    
+    def stop_keepalive(self, timeout: float = 5.0) -> None:
+        """
+        停止保活线程
+        
+        Args:
+            timeout: 等待正在进行的保活请求结束的最长时间（秒）
+        """
+        thread = self._keepalive_thread
+        if thread is None:
+            return
+        self._keepalive_stop.set()
+        thread.join(timeout=timeout)
+        self._keepalive_thread = None
+        logger.info("短信连接保活线程已停止")
     
     @staticmethod
     def _validate_config():
@@ -107,78 +270,161 @@ class SmsService:
         Returns:
             发送结果字典
         """
+        return self._send_sms_batch([phone_number], template_id, template_params)[phone_number]
+    
+    def _send_sms_batch(
+        self,
+        phone_numbers: List[str],
+        template_id: str,
+        template_params: Optional[list] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        一次 SendSms 请求发送给多个号码（同一模板、同一参数）
+        
+        Args:
+            phone_numbers: 手机号列表（已格式化、不重复，最多 SMS_MAX_PHONES_PER_REQUEST 个）
+            template_id: 模板ID
+            template_params: 模板参数列表
+            
+        Returns:
+            {手机号: 发送结果字典}
+        """
         try:
             # 构造请求
-            req = models.SendSmsRequest()
+            req = self._models.SendSmsRequest()
             req.SmsSdkAppId = SMS_SDK_APP_ID
             req.SignName = SMS_SIGN_NAME
             req.TemplateId = template_id
-            req.PhoneNumberSet = [phone_number]
+            req.PhoneNumberSet = list(phone_numbers)
             
             if template_params:
                 req.TemplateParamSet = template_params
             
             # 发送短信
-            resp = self.client.SendSms(req)
+            started = time.monotonic()
+            try:
+                resp = self.client.SendSms(req)
+            finally:
+                self._last_request_at = time.monotonic()
+                self.send_latency.record((self._last_request_at - started) * 1000)
+            latency_ms = int((self._last_request_at - started) * 1000)
             
-            # 解析响应
-            result = {
-                "success": True,
-                "request_id": resp.RequestId,
-                "phone_number": phone_number,
-                "template_id": template_id
-            }
+            # 按号码拆分发送状态，号码格式不一致时按顺序对应
+            status_set = resp.SendStatusSet or []
+            status_map = {status.PhoneNumber: status for status in status_set}
             
-            # 检查发送状态
-            if resp.SendStatusSet and len(resp.SendStatusSet) > 0:
-                status = resp.SendStatusSet[0]
-                result["code"] = status.Code
-                result["message"] = status.Message
-                result["fee"] = status.Fee
+            results = {}
+            for index, phone_number in enumerate(phone_numbers):
+                result = {
+                    "success": True,
+                    "request_id": resp.RequestId,
+                    "phone_number": phone_number,
+                    "template_id": template_id,
+                    "latency_ms": latency_ms
+                }
+                
+                status = status_map.get(phone_number)
+                if status is None and len(status_set) == len(phone_numbers):
+                    status = status_set[index]
                 
-                if status.Code != "Ok":
-                    result["success"] = False
-                    logger.warning(
-                        f"短信发送失败: phone={phone_number}, "
-                        f"code={status.Code}, message={status.Message}"
-                    )
+                # 检查发送状态
+                if status is not None:
+                    result["code"] = status.Code
+                    result["message"] = status.Message
+                    result["fee"] = status.Fee
+                    result["serial_no"] = status.SerialNo
+                    
+                    if status.Code != "Ok":
+                        result["success"] = False
+                        logger.warning(
+                            f"短信发送失败: phone={phone_number}, "
+                            f"code={status.Code}, message={status.Message}"
+                        )
+                
+                results[phone_number] = result
             
-            return result
+            return results
             
-        except TencentCloudSDKException as e:
+        except self._sdk_exception as e:
             logger.error(
                 f"腾讯云SDK异常: code={e.code}, message={e.message}, "
                 f"request_id={getattr(e, 'requestId', None)}"
             )
             return {
-                "success": False,
-                "error_code": e.code,
-                "error_message": e.message,
-                "phone_number": phone_number,
-                "template_id": template_id
+                phone_number: {
+                    "success": False,
+                    "error_code": e.code,
+                    "error_message": e.message,
+                    "phone_number": phone_number,
+                    "template_id": template_id
+                }
+                for phone_number in phone_numbers
             }
         except Exception as e:
             logger.error(f"短信发送异常: {str(e)}", exc_info=True)
             return {
-                "success": False,
-                "error_code": "UNKNOWN_ERROR",
-                "error_message": str(e),
-                "phone_number": phone_number,
-                "template_id": template_id
+                phone_number: {
+                    "success": False,
+                    "error_code": "UNKNOWN_ERROR",
+                    "error_message": str(e),
+                    "phone_number": phone_number,
+                    "template_id": template_id
+                }
+                for phone_number in phone_numbers
             }
     
-    def send_appraisal_notification(
+    @staticmethod
+    def resolve_result_template(appraisal_result: str) -> Optional[Tuple[str, str]]:
+        """
+        根据鉴定结果选择短信模板
+        
+        Args:
+            appraisal_result: 鉴定结果 ("1"=真, "2"=假, "3"=存疑, "4"=驳回)
+            
+        Returns:
+            (模板ID, 模板描述)，未知结果返回None
+        """
+        if appraisal_result == "3":
+            # 存疑/待完善
+            return SMS_TEMPLATE_DOUBT, "存疑通知"
+        if appraisal_result in ["1", "2", "4"]:
+            # 真/假/驳回
+            return SMS_TEMPLATE_STATUS_COMPLETE, "状态完成通知"
+        return None
+    
+    @staticmethod
+    def resolve_status_template(appraisal_status: str) -> Optional[Tuple[str, str]]:
+        """
+        根据鉴定状态选择短信模板
+        
+        Args:
+            appraisal_status: 鉴定状态 ("3"=已完结, "4"=待完善, "5"=已退回)
+            
+        Returns:
+            (模板ID, 模板描述)，不需要发送短信的状态返回None
+        """
+        if appraisal_status == "3":
+            return SMS_TEMPLATE_STATUS_COMPLETE, "已完结通知"
+        if appraisal_status == "4":
+            return SMS_TEMPLATE_DOUBT, "待完善通知"
+        if appraisal_status == "5":
+            return SMS_TEMPLATE_REJECTED, "已退回通知"
+        return None
+    
+    def send_template_notification(
         self,
         phone: str,
-        appraisal_result: str,
+        template_id: str,
+        template_desc: str = "",
         appraisal_id: str = ""
     ) -> Dict[str, Any]:
         """
-        发送鉴定结果通知短信（同步）
+        发送无参数模板短信（同步）
         
         Args:
             phone: 用户手机号
-            appraisal_result: 鉴定结果 ("1"=真, "2"=假, "3"=存疑, "4"=驳回)
+            template_id: 模板ID
+            template_desc: 模板描述（用于日志）
             appraisal_id: 鉴定订单ID（用于日志）
             
         Returns:
@@ -187,29 +433,11 @@ class SmsService:
         # 格式化手机号
         formatted_phone = self._format_phone_number(phone)
         
-        # 根据鉴定结果选择模板
-        if appraisal_result == "3":
-            # 存疑/待完善 - 使用模板 2532458
-            template_id = SMS_TEMPLATE_DOUBT
-            template_desc = "存疑通知"
-        elif appraisal_result in ["1", "2", "4"]:
-            # 真/假/驳回 - 使用模板 2532457
-            template_id = SMS_TEMPLATE_STATUS_COMPLETE
-            template_desc = "状态完成通知"
-        else:
-            logger.warning(f"未知的鉴定结果类型: {appraisal_result}, 订单ID: {appraisal_id}")
-            return {
-                "success": False,
-                "error_code": "INVALID_RESULT",
-                "error_message": f"未知的鉴定结果类型: {appraisal_result}"
-            }
-        
         logger.info(
-            f"准备发送短信: 订单ID={appraisal_id}, 手机号={phone}, "
-            f"结果={appraisal_result}, 模板={template_desc}"
+            f"准备发送短信: 订单ID={appraisal_id}, 手机号={phone}, 模板={template_desc or template_id}"
         )
         
-        # 发送短信（这两个模板都不需要参数）
+        # 发送短信（这些模板都不需要参数）
         result = self._send_sms_internal(
             phone_number=formatted_phone,
             template_id=template_id,
@@ -219,21 +447,139 @@ class SmsService:
         if result.get("success"):
             logger.info(
                 f"短信发送成功: 订单ID={appraisal_id}, 手机号={phone}, "
-                f"request_id={result.get('request_id')}"
+                f"模板={template_desc or template_id}, request_id={result.get('request_id')}"
             )
         else:
             logger.error(
                 f"短信发送失败: 订单ID={appraisal_id}, 手机号={phone}, "
-                f"错误={result.get('error_message', result.get('message'))}"
+                f"模板={template_desc or template_id}, 错误={result.get('error_message', result.get('message'))}"
             )
         
+        self._record_ledger(appraisal_id, phone, template_id, template_desc, result)
         return result
     
-    def send_appraisal_notification_async(
+    def send_template_batch(
+        self,
+        phones: List[str],
+        template_id: str,
+        template_desc: str = "",
+        appraisal_ids: Optional[List[str]] = None,
+        covered_ids: Optional[List[List[str]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        将同一无参数模板的多条短信合并为一次 SendSms 请求（同步）
+        
+        Args:
+            phones: 用户手机号列表（不重复，最多 SMS_MAX_PHONES_PER_REQUEST 个）
+            template_id: 模板ID
+            template_desc: 模板描述（用于日志）
+            appraisal_ids: 与 phones 一一对应的鉴定订单ID（用于日志）
+            covered_ids: 与 phones 一一对应的、每条短信合并通知的全部鉴定订单ID（写入台账）
+            
+        Returns:
+            与 phones 顺序一致的发送结果字典列表
+        """
+        appraisal_ids = appraisal_ids or [""] * len(phones)
+        covered_ids = covered_ids or [None] * len(phones)
+        formatted_phones = [self._format_phone_number(phone) for phone in phones]
+        
+        logger.info(
+            f"准备合并发送短信: 模板={template_desc or template_id}, 号码数={len(phones)}"
+        )
+        
+        result_map = self._send_sms_batch(formatted_phones, template_id)
+        
+        results = []
+        for phone, formatted_phone, appraisal_id, covered in zip(phones, formatted_phones, appraisal_ids, covered_ids):
+            result = result_map[formatted_phone]
+            if result.get("success"):
+                logger.info(
+                    f"短信发送成功: 订单ID={appraisal_id}, 手机号={phone}, "
+                    f"模板={template_desc or template_id}, request_id={result.get('request_id')}"
+                )
+            else:
+                logger.error(
+                    f"短信发送失败: 订单ID={appraisal_id}, 手机号={phone}, "
+                    f"模板={template_desc or template_id}, 错误={result.get('error_message', result.get('message'))}"
+                )
+            self._record_ledger(appraisal_id, phone, template_id, template_desc, result, covered)
+            results.append(result)
+        
+        return results
+    
+    @staticmethod
+    def _record_ledger(
+        appraisal_id: str,
+        phone: str,
+        template_id: str,
+        template_desc: str,
+        result: Dict[str, Any],
+        covered_ids: Optional[List[str]] = None
+    ) -> None:
+        """写入短信发送台账（异步批量写库，失败不影响发送）"""
+        ledger = get_sms_ledger_service()
+        if ledger:
+            ledger.record(appraisal_id, phone, template_id, template_desc, result, covered_ids)
+    
+    def _submit_to_dispatcher(
+        self,
+        phone: str,
+        template_id: str,
+        template_desc: str,
+        appraisal_id: str,
+        callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+        covered_ids: Optional[List[str]] = None,
+        on_deferred: Optional[Callable[[float], None]] = None
+    ) -> None:
+        """提交到短信发送调度器（有界队列 + 固定线程池）"""
+        from app.services.sms_dispatcher import get_sms_dispatcher, SmsMessage
+        
+        get_sms_dispatcher().submit(SmsMessage(
+            phone=phone,
+            template_id=template_id,
+            template_desc=template_desc,
+            appraisal_id=appraisal_id,
+            callback=callback,
+            covered_ids=covered_ids,
+            on_deferred=on_deferred
+        ))
+        logger.debug(f"短信已提交到发送队列: 订单ID={appraisal_id}, 模板={template_desc}")
+    
+    def send_appraisal_notification(
         self,
         phone: str,
         appraisal_result: str,
         appraisal_id: str = ""
+    ) -> Dict[str, Any]:
+        """
+        发送鉴定结果通知短信（同步）
+        
+        Args:
+            phone: 用户手机号
+            appraisal_result: 鉴定结果 ("1"=真, "2"=假, "3"=存疑, "4"=驳回)
+            appraisal_id: 鉴定订单ID（用于日志）
+            
+        Returns:
+            发送结果字典
+        """
+        template = self.resolve_result_template(appraisal_result)
+        if not template:
+            logger.warning(f"未知的鉴定结果类型: {appraisal_result}, 订单ID: {appraisal_id}")
+            return {
+                "success": False,
+                "error_code": "INVALID_RESULT",
+                "error_message": f"未知的鉴定结果类型: {appraisal_result}"
+            }
+        
+        template_id, template_desc = template
+        return self.send_template_notification(phone, template_id, template_desc, appraisal_id)
+    
+    def send_appraisal_notification_async(
+        self,
+        phone: str,
+        appraisal_result: str,
+        appraisal_id: str = "",
+        callback: Optional[Callable[[Dict[str, Any]], None]] = None
     ) -> None:
         """
         异步发送鉴定结果通知短信
@@ -242,16 +588,15 @@ class SmsService:
             phone: 用户手机号
             appraisal_result: 鉴定结果
             appraisal_id: 鉴定订单ID
+            callback: 发送完成后以结果字典调用
         """
-        # 使用守护线程异步发送，不阻塞主流程
-        thread = threading.Thread(
-            target=self.send_appraisal_notification,
-            args=(phone, appraisal_result, appraisal_id),
-            daemon=True,
-            name=f"sms-{appraisal_id}"
-        )
-        thread.start()
-        logger.debug(f"启动异步短信发送线程: 订单ID={appraisal_id}")
+        template = self.resolve_result_template(appraisal_result)
+        if not template:
+            logger.warning(f"未知的鉴定结果类型: {appraisal_result}, 订单ID: {appraisal_id}")
+            return
+        
+        template_id, template_desc = template
+        self._submit_to_dispatcher(phone, template_id, template_desc, appraisal_id, callback)
 
     def send_status_rejected_notification(
         self,
@@ -268,37 +613,13 @@ class SmsService:
         Returns:
             发送结果字典
         """
-        # 格式化手机号
-        formatted_phone = self._format_phone_number(phone)
-        
-        logger.info(
-            f"准备发送退回通知短信: 订单ID={appraisal_id}, 手机号={phone}"
-        )
-        
-        # 发送短信（模板不需要参数）
-        result = self._send_sms_internal(
-            phone_number=formatted_phone,
-            template_id=SMS_TEMPLATE_REJECTED,
-            template_params=None
-        )
-        
-        if result.get("success"):
-            logger.info(
-                f"退回通知短信发送成功: 订单ID={appraisal_id}, 手机号={phone}, "
-                f"request_id={result.get('request_id')}"
-            )
-        else:
-            logger.error(
-                f"退回通知短信发送失败: 订单ID={appraisal_id}, 手机号={phone}, "
-                f"错误={result.get('error_message', result.get('message'))}"
-            )
-        
-        return result
+        return self.send_template_notification(phone, SMS_TEMPLATE_REJECTED, "退回通知", appraisal_id)
 
     def send_status_rejected_notification_async(
         self,
         phone: str,
-        appraisal_id: str = ""
+        appraisal_id: str = "",
+        callback: Optional[Callable[[Dict[str, Any]], None]] = None
     ) -> None:
         """
         异步发送鉴定单退回通知短信
@@ -306,16 +627,9 @@ class SmsService:
         Args:
             phone: 用户手机号
             appraisal_id: 鉴定订单ID
+            callback: 发送完成后以结果字典调用
         """
-        # 使用守护线程异步发送，不阻塞主流程
-        thread = threading.Thread(
-            target=self.send_status_rejected_notification,
-            args=(phone, appraisal_id),
-            daemon=True,
-            name=f"sms-rejected-{appraisal_id}"
-        )
-        thread.start()
-        logger.debug(f"启动异步退回通知短信发送线程: 订单ID={appraisal_id}")
+        self._submit_to_dispatcher(phone, SMS_TEMPLATE_REJECTED, "退回通知", appraisal_id, callback)
 
     def send_status_notification(
         self,
@@ -334,23 +648,8 @@ class SmsService:
         Returns:
             发送结果字典
         """
-        # 格式化手机号
-        formatted_phone = self._format_phone_number(phone)
-        
-        # 根据鉴定状态选择模板
-        if appraisal_status == "3":
-            # 已完结 - 使用模板 2532457
-            template_id = SMS_TEMPLATE_STATUS_COMPLETE
-            template_desc = "已完结通知"
-        elif appraisal_status == "4":
-            # 待完善 - 使用模板 2532458
-            template_id = SMS_TEMPLATE_DOUBT
-            template_desc = "待完善通知"
-        elif appraisal_status == "5":
-            # 已退回 - 使用模板 2538861
-            template_id = SMS_TEMPLATE_REJECTED
-            template_desc = "已退回通知"
-        else:
+        template = self.resolve_status_template(appraisal_status)
+        if not template:
             logger.warning(f"不需要发送短信的状态: {appraisal_status}, 订单ID: {appraisal_id}")
             return {
                 "success": False,
@@ -358,36 +657,17 @@ class SmsService:
                 "error_message": f"状态 {appraisal_status} 不需要发送短信"
             }
         
-        logger.info(
-            f"准备发送状态通知短信: 订单ID={appraisal_id}, 手机号={phone}, "
-            f"状态={appraisal_status}, 模板={template_desc}"
-        )
-        
-        # 发送短信（这些模板都不需要参数）
-        result = self._send_sms_internal(
-            phone_number=formatted_phone,
-            template_id=template_id,
-            template_params=None
-        )
-        
-        if result.get("success"):
-            logger.info(
-                f"状态通知短信发送成功: 订单ID={appraisal_id}, 手机号={phone}, "
-                f"状态={appraisal_status}, request_id={result.get('request_id')}"
-            )
-        else:
-            logger.error(
-                f"状态通知短信发送失败: 订单ID={appraisal_id}, 手机号={phone}, "
-                f"状态={appraisal_status}, 错误={result.get('error_message', result.get('message'))}"
-            )
-        
-        return result
+        template_id, template_desc = template
+        return self.send_template_notification(phone, template_id, template_desc, appraisal_id)
 
     def send_status_notification_async(
         self,
         phone: str,
         appraisal_status: str,
-        appraisal_id: str = ""
+        appraisal_id: str = "",
+        callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+        covered_ids: Optional[List[str]] = None,
+        on_deferred: Optional[Callable[[float], None]] = None
     ) -> None:
         """
         异步发送鉴定状态通知短信
@@ -396,16 +676,17 @@ class SmsService:
             phone: 用户手机号
             appraisal_status: 鉴定状态
             appraisal_id: 鉴定订单ID
+            callback: 发送完成后以结果字典调用
+            covered_ids: 合并通知时本条短信覆盖的全部鉴定订单ID
+            on_deferred: 限流或重试推迟发送时以推迟秒数调用
         """
-        # 使用守护线程异步发送，不阻塞主流程
-        thread = threading.Thread(
-            target=self.send_status_notification,
-            args=(phone, appraisal_status, appraisal_id),
-            daemon=True,
-            name=f"sms-status-{appraisal_id}"
-        )
-        thread.start()
-        logger.debug(f"启动异步状态通知短信发送线程: 订单ID={appraisal_id}, 状态={appraisal_status}")
+        template = self.resolve_status_template(appraisal_status)
+        if not template:
+            logger.warning(f"不需要发送短信的状态: {appraisal_status}, 订单ID: {appraisal_id}")
+            return
+        
+        template_id, template_desc = template
+        self._submit_to_dispatcher(phone, template_id, template_desc, appraisal_id, callback, covered_ids, on_deferred)
 
 
 # 全局单例实例
@@ -431,6 +712,12 @@ def get_sms_service() -> Optional[SmsService]:
     return _sms_service_instance
 
 
+def stop_sms_keepalive() -> None:
+    """停止短信连接保活线程（应用关闭时调用，短信服务未初始化时不做处理）"""
+    if _sms_service_instance is not None:
+        _sms_service_instance.stop_keepalive()
+
+
 def get_sms_delay_manager():
     """
     获取短信延迟发送管理器实例
@@ -0,0 +1,394 @@
+"""
+短信群发服务
+按筛选条件从数据库分块读取收件人（按手机号去重、按手机号游标翻页），每块提交给短信发送调度器，
+由调度器合并为多号码的 SendSms 请求并经过限流；进度、发送结果与错误码分布保存在 Redis 中，任意实例均可查询
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from app.config.settings import (
+    ENVIRONMENT,
+    SMS_CAMPAIGN_CHUNK_SIZE,
+    SMS_CAMPAIGN_CHUNK_TIMEOUT,
+    SMS_CAMPAIGN_TTL
+)
+from app.models.appraisal import Appraisal
+from app.models.user_info import UserInfo
+from app.schemas.sms import SmsCampaignCreateRequest, SmsCampaignData, SmsCampaignSelector
+from app.services.sms_dispatcher import SmsMessage, get_sms_dispatcher
+from app.services.sms_errors import get_error_code
+from app.utils.db import engine
+from app.utils.redis import RedisClient, get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class CampaignStatus:
+    """群发状态常量"""
+    PENDING = "pending"  # 排队中
+    RUNNING = "running"  # 发送中
+    COMPLETED = "completed"  # 已完成
+    CANCELLED = "cancelled"  # 已取消
+    INTERRUPTED = "interrupted"  # 服务关闭导致中断
+    FAILED = "failed"  # 读取收件人失败
+
+
+class _ChunkTally:
+    """一个分块的发送结果汇总，全部回调后唤醒等待方；超时后迟到的结果直接写入 Redis"""
+    
+    def __init__(self, size: int, on_late_result):
+        self._remaining = size
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._closed = False
+        self._on_late_result = on_late_result
+        self.sent = 0
+        self.failed = 0
+        self.error_codes: Dict[str, int] = {}
+        if size == 0:
+            self._done.set()
+    
+    def record(self, result: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._closed:
+                late = True
+            else:
+                late = False
+                if result.get("success"):
+                    self.sent += 1
+                else:
+                    self.failed += 1
+                    code = get_error_code(result) or "UNKNOWN_ERROR"
+                    self.error_codes[code] = self.error_codes.get(code, 0) + 1
+                self._remaining -= 1
+                if self._remaining == 0:
+                    self._done.set()
+        if late:
+            self._on_late_result(result)
+    
+    def wait_and_close(self, timeout: float, stop_event: threading.Event) -> bool:
+        """
+        等待分块全部回调（服务关闭时提前返回），之后的结果不再计入本汇总
+        
+        Returns:
+            是否在超时前全部完成
+        """
+        deadline = time.monotonic() + timeout
+        finished = False
+        while not stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if self._done.wait(min(1.0, remaining)):
+                finished = True
+                break
+        with self._lock:
+            self._closed = True
+        return finished
+
+
+class SmsCampaignService:
+    """短信群发服务类"""
+    
+    def __init__(self, redis_client: Optional[RedisClient] = None):
+        """
+        初始化群发服务
+        
+        Args:
+            redis_client: Redis客户端实例，不传则使用默认实例
+        """
+        self.redis = redis_client or get_redis()
+        # Redis key前缀：生产环境用"online"，其他环境用"dev"
+        self.env_prefix = "online" if ENVIRONMENT == "production" else "dev"
+        self.chunk_size = max(1, SMS_CAMPAIGN_CHUNK_SIZE)
+        self.ttl = SMS_CAMPAIGN_TTL
+        # 同一时间只执行一个群发，避免多个群发争抢发送配额
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sms-campaign")
+        self._stop_event = threading.Event()
+        # 未结束的群发，关闭时据此把排队中/执行中的群发标记为中断
+        self._futures: Dict[str, Future] = {}
+        self._futures_lock = threading.Lock()
+    
+    # ========== Key生成 ==========
+    
+    def _get_campaign_key(self, campaign_id: str) -> str:
+        """生成群发进度的key"""
+        return f"{self.env_prefix}:sms_campaign:{campaign_id}"
+    
+    def _get_codes_key(self, campaign_id: str) -> str:
+        """生成群发错误码计数的key"""
+        return f"{self.env_prefix}:sms_campaign:{campaign_id}:codes"
+    
+    # ========== 收件人查询 ==========
+    
+    @staticmethod
+    def _recipient_query(selector: SmsCampaignSelector):
+        """符合筛选条件的用户手机号（去重）"""
+        query = (
+            select(UserInfo.phone)
+            .join(Appraisal, Appraisal.userinfo_id == UserInfo.id)
+            .where(UserInfo.phone.is_not(None), UserInfo.phone != "")
+        )
+        if selector.appraisal_status:
+            query = query.where(Appraisal.appraisal_status.in_(selector.appraisal_status))
+        if selector.appraisal_business_type:
+            query = query.where(Appraisal.appraisal_business_type == selector.appraisal_business_type)
+        if selector.create_start_time is not None:
+            query = query.where(Appraisal.created_at >= selector.create_start_time)
+        if selector.create_end_time is not None:
+            query = query.where(Appraisal.created_at <= selector.create_end_time)
+        return query.distinct()
+    
+    @staticmethod
+    def count_recipients(selector: SmsCampaignSelector, session: Session) -> int:
+        """
+        统计收件人数量（按手机号去重）
+        
+        Args:
+            selector: 筛选条件
+            session: 数据库会话
+            
+        Returns:
+            收件人数量
+        """
+        subquery = SmsCampaignService._recipient_query(selector).subquery()
+        return session.exec(select(func.count()).select_from(subquery)).one()
+    
+    @staticmethod
+    def _load_chunk(selector: SmsCampaignSelector, after: str, limit: int, session: Session) -> List[str]:
+        """按手机号游标读取下一块收件人，避免深分页 OFFSET"""
+        query = SmsCampaignService._recipient_query(selector)
+        if after:
+            query = query.where(UserInfo.phone > after)
+        return list(session.exec(query.order_by(UserInfo.phone).limit(limit)).all())
+    
+    # ========== 提交群发 ==========
+    
+    def create_campaign(self, request: SmsCampaignCreateRequest) -> SmsCampaignData:
+        """
+        创建群发并交给后台线程执行
+        
+        Args:
+            request: 模板与收件人筛选条件
+            
+        Returns:
+            群发初始状态
+        """
+        campaign_id = uuid.uuid4().hex
+        campaign = SmsCampaignData(
+            campaign_id=campaign_id,
+            template_id=request.template_id,
+            template_desc=request.template_desc,
+            selector=request.selector.model_dump_json(exclude_none=True),
+            status=CampaignStatus.PENDING,
+            created_at=int(time.time())
+        )
+        
+        key = self._get_campaign_key(campaign_id)
+        mapping = campaign.model_dump(exclude={"error_codes", "pending", "throughput_per_sec"}, exclude_none=True)
+        with self.redis.pipeline() as pipe:
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, self.ttl)
+        if not pipe.succeeded:
+            raise RuntimeError("群发状态写入 Redis 失败")
+        
+        future = self._executor.submit(self._run, campaign_id, request)
+        with self._futures_lock:
+            self._futures[campaign_id] = future
+        future.add_done_callback(lambda _: self._forget(campaign_id))
+        logger.info(f"已创建短信群发: campaign_id={campaign_id}, 模板={request.template_id}, 条件={campaign.selector}")
+        return campaign
+    
+    def cancel_campaign(self, campaign_id: str) -> bool:
+        """
+        请求取消群发，当前分块发送完成后停止
+        
+        Returns:
+            群发是否存在
+        """
+        key = self._get_campaign_key(campaign_id)
+        if not self.redis.exists(key):
+            return False
+        self.redis.hset(key, mapping={"cancel_requested": 1})
+        return True
+    
+    # ========== 执行群发 ==========
+    
+    def _run(self, campaign_id: str, request: SmsCampaignCreateRequest) -> None:
+        """逐块读取收件人并提交发送，每块发送完成后记录进度"""
+        selector = request.selector
+        key = self._get_campaign_key(campaign_id)
+        try:
+            with Session(engine) as session:
+                total = self.count_recipients(selector, session)
+        except Exception as e:
+            logger.error(f"短信群发统计收件人失败: campaign_id={campaign_id}, 错误={e}", exc_info=True)
+            self._update(campaign_id, {"status": CampaignStatus.FAILED, "error": str(e)})
+            return
+        self._update(campaign_id, {"status": CampaignStatus.RUNNING, "total": total, "started_at": time.time()})
+        
+        dispatcher = get_sms_dispatcher()
+        cursor = ""
+        while True:
+            if self._stop_event.is_set():
+                self._update(campaign_id, {"status": CampaignStatus.INTERRUPTED, "error": "服务关闭，群发中断"})
+                logger.warning(f"短信群发中断: campaign_id={campaign_id}, 游标={cursor}")
+                return
+            if self.redis.hget(key, "cancel_requested"):
+                self._update(campaign_id, {"status": CampaignStatus.CANCELLED})
+                logger.info(f"短信群发已取消: campaign_id={campaign_id}, 游标={cursor}")
+                return
+            
+            try:
+                with Session(engine) as session:
+                    phones = self._load_chunk(selector, cursor, self.chunk_size, session)
+            except Exception as e:
+                logger.error(f"短信群发读取收件人失败: campaign_id={campaign_id}, 游标={cursor}, 错误={e}", exc_info=True)
+                self._update(campaign_id, {"status": CampaignStatus.FAILED, "error": str(e)})
+                return
+            if not phones:
+                break
+            
+            cursor = phones[-1]
+            tally = _ChunkTally(len(phones), lambda result: self._record_late_result(campaign_id, result))
+            for phone in phones:
+                # 鉴定订单ID记为群发ID，台账中可按群发ID查询本次发送记录
+                dispatcher.submit(SmsMessage(
+                    phone=phone,
+                    template_id=request.template_id,
+                    template_desc=request.template_desc or "",
+                    appraisal_id=campaign_id,
+                    callback=tally.record
+                ))
+            self._record_progress(campaign_id, processed=len(phones), cursor=cursor)
+            
+            # 等待本块发送完成再读取下一块，队列中最多只有一块群发短信，不挤占实时通知
+            if not tally.wait_and_close(SMS_CAMPAIGN_CHUNK_TIMEOUT, self._stop_event) and not self._stop_event.is_set():
+                logger.warning(f"短信群发分块未在 {SMS_CAMPAIGN_CHUNK_TIMEOUT} 秒内完成，继续下一块: campaign_id={campaign_id}")
+            self._record_progress(campaign_id, sent=tally.sent, failed=tally.failed, error_codes=tally.error_codes)
+        
+        self._update(campaign_id, {"status": CampaignStatus.COMPLETED})
+        logger.info(f"短信群发完成: campaign_id={campaign_id}, 收件人={total}")
+    
+    def _update(self, campaign_id: str, fields: Dict[str, Any]) -> None:
+        """更新群发字段"""
+        mapping = {k: v for k, v in fields.items() if v is not None}
+        mapping["updated_at"] = time.time()
+        self.redis.hset(self._get_campaign_key(campaign_id), mapping=mapping)
+    
+    def _record_progress(
+        self,
+        campaign_id: str,
+        processed: int = 0,
+        sent: int = 0,
+        failed: int = 0,
+        error_codes: Optional[Dict[str, int]] = None,
+        cursor: Optional[str] = None
+    ) -> None:
+        """单次 pipeline 写入进度计数与错误码分布"""
+        key = self._get_campaign_key(campaign_id)
+        codes_key = self._get_codes_key(campaign_id)
+        with self.redis.pipeline() as pipe:
+            if processed:
+                pipe.hincrby(key, "processed", processed)
+            if sent:
+                pipe.hincrby(key, "sent", sent)
+            if failed:
+                pipe.hincrby(key, "failed", failed)
+            if cursor is not None:
+                pipe.hset(key, "cursor", cursor)
+            pipe.hset(key, "updated_at", time.time())
+            for code, count in (error_codes or {}).items():
+                pipe.hincrby(codes_key, code, count)
+            if error_codes:
+                pipe.expire(codes_key, self.ttl)
+        if not pipe.succeeded:
+            logger.error(f"记录短信群发进度失败: campaign_id={campaign_id}, 错误={pipe.error}")
+    
+    def _record_late_result(self, campaign_id: str, result: Dict[str, Any]) -> None:
+        """分块等待超时后才完成的短信（如被限流延后），单独计入进度"""
+        if result.get("success"):
+            self._record_progress(campaign_id, sent=1)
+        else:
+            self._record_progress(campaign_id, failed=1, error_codes={get_error_code(result) or "UNKNOWN_ERROR": 1})
+    
+    # ========== 查询群发 ==========
+    
+    def get_campaign(self, campaign_id: str) -> Optional[SmsCampaignData]:
+        """
+        查询群发进度
+        
+        Args:
+            campaign_id: 群发ID
+            
+        Returns:
+            群发数据，不存在或已过期时返回None
+        """
+        campaign = self.redis.hgetall(self._get_campaign_key(campaign_id))
+        if not campaign:
+            return None
+        campaign.pop("cancel_requested", None)
+        error_codes = self.redis.hgetall(self._get_codes_key(campaign_id)) or {}
+        
+        data = SmsCampaignData(**campaign, error_codes={code: int(count) for code, count in error_codes.items()})
+        data.pending = max(0, data.processed - data.sent - data.failed)
+        if data.started_at and data.updated_at and data.updated_at > data.started_at:
+            data.throughput_per_sec = round((data.sent + data.failed) / (data.updated_at - data.started_at), 2)
+        return data
+    
+    def _forget(self, campaign_id: str) -> None:
+        """群发结束（完成、中断或取消）后移除记录"""
+        with self._futures_lock:
+            self._futures.pop(campaign_id, None)
+    
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """
+        停止读取新分块并把未完成的群发标记为中断：
+        排队中的群发直接取消；执行中的群发在当前分块结束后自行标记，
+        超过等待时间仍未结束的在此标记
+        
+        Args:
+            timeout: 等待执行中群发退出的最长时间（秒）
+        """
+        self._stop_event.set()
+        with self._futures_lock:
+            futures = dict(self._futures)
+        
+        running = {}
+        for campaign_id, future in futures.items():
+            if future.cancel():
+                self._update(campaign_id, {"status": CampaignStatus.INTERRUPTED, "error": "服务关闭，群发未开始执行"})
+                logger.warning(f"短信群发未开始即被取消: campaign_id={campaign_id}")
+            else:
+                running[campaign_id] = future
+        self._executor.shutdown(wait=False)
+        
+        if not running:
+            return
+        _, not_done = wait(running.values(), timeout=timeout)
+        for campaign_id, future in running.items():
+            if future in not_done:
+                self._update(campaign_id, {"status": CampaignStatus.INTERRUPTED, "error": "服务关闭时仍在发送，群发中断"})
+                logger.warning(f"短信群发关闭时仍在执行: campaign_id={campaign_id}")
+
+
+# 全局群发服务实例
+_campaign_service: Optional[SmsCampaignService] = None
+_campaign_lock = threading.Lock()
+
+
+def get_sms_campaign_service() -> SmsCampaignService:
+    """获取短信群发服务实例（单例模式）"""
+    global _campaign_service
+    if _campaign_service is None:
+        with _campaign_lock:
+            if _campaign_service is None:
+                _campaign_service = SmsCampaignService()
+    return _campaign_service
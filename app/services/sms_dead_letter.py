@@ -0,0 +1,170 @@
+"""
+短信死信存储
+重试耗尽仍失败的短信保存在 Redis 中，供管理员查看并批量重发
+"""
+import json
+import logging
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config.settings import ENVIRONMENT
+from app.utils.redis import RedisClient, get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class SmsDeadLetterStore:
+    """短信死信存储（HASH 保存内容，ZSET 按失败时间索引）"""
+    
+    def __init__(self, redis_client: Optional[RedisClient] = None):
+        """
+        Args:
+            redis_client: Redis客户端实例，不传则使用默认实例
+        """
+        self.redis = redis_client or get_redis()
+        # Redis key前缀：生产环境用"online"，其他环境用"dev"
+        env_prefix = "online" if ENVIRONMENT == "production" else "dev"
+        self.items_key = f"{env_prefix}:sms_dead_letter:items"
+        self.index_key = f"{env_prefix}:sms_dead_letter:index"
+    
+    def add(
+        self,
+        phone: str,
+        template_id: str,
+        template_desc: str,
+        appraisal_id: str,
+        attempts: int,
+        result: Dict[str, Any],
+        covered_ids: Optional[List[str]] = None
+    ) -> Optional[str]:
+        """
+        保存一条死信
+        
+        Args:
+            phone: 用户手机号
+            template_id: 模板ID
+            template_desc: 模板描述
+            appraisal_id: 鉴定订单ID
+            attempts: 已发送次数
+            result: 最后一次发送结果
+            covered_ids: 合并通知时本条短信覆盖的全部鉴定订单ID
+            
+        Returns:
+            死信ID，保存失败返回None
+        """
+        letter_id = uuid.uuid4().hex
+        failed_at = time.time()
+        payload = json.dumps({
+            "id": letter_id,
+            "phone": phone,
+            "template_id": template_id,
+            "template_desc": template_desc,
+            "appraisal_id": appraisal_id,
+            "attempts": attempts,
+            "covered_ids": covered_ids or None,
+            "error_code": result.get("error_code") or result.get("code"),
+            "error_message": result.get("error_message") or result.get("message"),
+            "failed_at": failed_at
+        }, ensure_ascii=False)
+        try:
+            pipe = self.redis.get_client().pipeline(transaction=True)
+            pipe.hset(self.items_key, letter_id, payload)
+            pipe.zadd(self.index_key, {letter_id: failed_at})
+            pipe.execute()
+            return letter_id
+        except Exception as e:
+            logger.error(
+                f"保存短信死信失败: 订单ID={appraisal_id}, 手机号={phone}, 模板={template_id}, 错误={str(e)}",
+                exc_info=True
+            )
+            return None
+    
+    def list(self, page: int = 1, page_size: int = 20) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        按失败时间倒序分页查询死信
+        
+        Returns:
+            (总数, 死信列表)
+        """
+        client = self.redis.get_client()
+        start = (page - 1) * page_size
+        total = client.zcard(self.index_key)
+        ids = client.zrevrange(self.index_key, start, start + page_size - 1)
+        if not ids:
+            return total, []
+        payloads = client.hmget(self.items_key, ids)
+        return total, [json.loads(payload) for payload in payloads if payload]
+    
+    def take(self, letter_ids: Optional[List[str]] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        """
+        取出并删除死信（用于重发），同一条死信只会被取出一次
+        
+        Args:
+            letter_ids: 死信ID列表，为空时按失败时间顺序取最早的 limit 条
+            limit: 最多取出条数
+            
+        Returns:
+            取出的死信列表
+        """
+        client = self.redis.get_client()
+        if not letter_ids:
+            letter_ids = client.zrange(self.index_key, 0, limit - 1)
+        letter_ids = list(letter_ids)[:limit]
+        if not letter_ids:
+            return []
+        
+        payloads = client.hmget(self.items_key, letter_ids)
+        pipe = client.pipeline(transaction=False)
+        for letter_id in letter_ids:
+            pipe.hdel(self.items_key, letter_id)
+        pipe.zrem(self.index_key, *letter_ids)
+        deleted = pipe.execute()[:len(letter_ids)]
+        
+        # 只有自己删除成功的才算取出，避免并发重发同一条
+        return [
+            json.loads(payload)
+            for payload, removed in zip(payloads, deleted)
+            if payload and removed
+        ]
+    
+    def restore(self, letters: List[Dict[str, Any]]) -> None:
+        """
+        放回取出后未能重新提交的死信（保留原ID与失败时间）
+        
+        Args:
+            letters: take 返回的死信
+        """
+        if not letters:
+            return
+        try:
+            pipe = self.redis.get_client().pipeline(transaction=True)
+            for letter in letters:
+                pipe.hset(self.items_key, letter["id"], json.dumps(letter, ensure_ascii=False))
+                pipe.zadd(self.index_key, {letter["id"]: letter["failed_at"]})
+            pipe.execute()
+        except Exception as e:
+            logger.error(
+                f"放回短信死信失败: 死信ID={[letter['id'] for letter in letters]}, 错误={str(e)}",
+                exc_info=True
+            )
+    
+    def count(self) -> int:
+        """死信数量"""
+        try:
+            return self.redis.get_client().zcard(self.index_key)
+        except Exception as e:
+            logger.error(f"获取短信死信数量失败: {str(e)}", exc_info=True)
+            return 0
+
+
+# 全局死信存储实例
+_dead_letter_store: Optional[SmsDeadLetterStore] = None
+
+
+def get_sms_dead_letter_store() -> SmsDeadLetterStore:
+    """获取短信死信存储实例（单例模式）"""
+    global _dead_letter_store
+    if _dead_letter_store is None:
+        _dead_letter_store = SmsDeadLetterStore()
+    return _dead_letter_store
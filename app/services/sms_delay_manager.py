@@ -1,19 +1,40 @@
 """
 短信延迟发送管理器
 提供鉴定状态变更的延迟短信通知功能
+默认使用 Redis 延迟队列持久化任务（重启不丢失、多副本共享），Redis 不可用时退回进程内定时器；
+到期任务按"号码 + 模板"合并，同一用户在一个窗口内每个模板只收到一条短信
 """
 import logging
 import threading
 import time
-from typing import Dict, Optional, Any
-from threading import Timer
+from typing import Dict, List, NamedTuple, Optional, Any, Tuple
 
-from app.config.settings import SMS_DELAY_SECONDS
+from app.config.settings import (
+    SMS_DELAY_SECONDS,
+    SMS_DELAY_BACKEND,
+    SMS_DELAY_POLL_INTERVAL,
+    SMS_DELAY_LEASE_SECONDS,
+    SMS_DELAY_CLAIM_BATCH,
+    SMS_DIGEST_WINDOW_SECONDS,
+    SMS_DIGEST_GATHER_MS
+)
 from app.services.sms import get_sms_service
+from app.services.sms_delay_queue import RedisSmsDelayQueue
+from app.services.sms_errors import DISPATCH_STOPPED, get_error_code
+from app.utils.scheduler import DelayScheduler
 
 logger = logging.getLogger(__name__)
 
 
+class DueTask(NamedTuple):
+    """到期待发送的任务"""
+    appraisal_id: str
+    phone: str
+    status: str
+    created_time: float
+    payload: Optional[str] = None  # Redis 队列领取时的原始内容（用于确认），进程内任务为空
+
+
 class SmsDelayManager:
     """短信延迟发送管理器"""
     
@@ -31,10 +52,23 @@ class SmsDelayManager:
     def __init__(self):
         """初始化延迟发送管理器"""
         if not hasattr(self, '_initialized'):
-            self._pending_tasks: Dict[str, Dict[str, Any]] = {}
-            self._task_lock = threading.Lock()
+            # 进程内任务共用一个调度线程，任务参数为 (订单ID, 手机号, 状态, 创建时间)
+            self._scheduler = DelayScheduler(name="sms-delay-scheduler")
+            self._redis_queue: Optional[RedisSmsDelayQueue] = (
+                RedisSmsDelayQueue() if SMS_DELAY_BACKEND == "redis" else None
+            )
+            # 快照存储：redis 后端复用队列实例，memory 后端也用 Redis 保存关闭时的快照
+            self._snapshot_store = self._redis_queue or RedisSmsDelayQueue()
+            self._poller: Optional[threading.Thread] = None
+            self._stop_event = threading.Event()
+            # 进程内到期任务先攒一小段时间再按号码合并发送
+            self._gathered: List[DueTask] = []
+            self._gather_lock = threading.Lock()
             self._initialized = True
-            logger.info(f"短信延迟发送管理器初始化成功，延迟时间: {SMS_DELAY_SECONDS}秒")
+            logger.info(
+                f"短信延迟发送管理器初始化成功，延迟时间: {SMS_DELAY_SECONDS}秒，"
+                f"存储后端: {SMS_DELAY_BACKEND}"
+            )
     
     def schedule_delayed_sms(
         self, 
@@ -53,39 +87,31 @@ class SmsDelayManager:
         Returns:
             bool: 是否成功调度
         """
+        if self._redis_queue and self._redis_queue.schedule(appraisal_id, phone, status, SMS_DELAY_SECONDS):
+            # 进程内可能还有 Redis 故障期间留下的旧任务，一并取消
+            self._scheduler.cancel(appraisal_id)
+            logger.info(
+                f"已调度延迟短信发送(Redis): 订单ID={appraisal_id}, 手机号={phone}, "
+                f"状态={status}, 延迟={SMS_DELAY_SECONDS}秒"
+            )
+            return True
+        
         try:
-            with self._task_lock:
-                # 如果该订单已有待发送任务，先取消旧任务
-                if appraisal_id in self._pending_tasks:
-                    self._cancel_existing_task(appraisal_id)
-                
-                # 创建新的延迟任务
-                timer = Timer(
-                    SMS_DELAY_SECONDS,
-                    self._execute_send,
-                    args=(appraisal_id,)
-                )
-                timer.daemon = False  # 确保应用关闭前完成发送
-                
-                # 记录任务信息
-                task_info = {
-                    "timer": timer,
-                    "phone": phone,
-                    "status": status,
-                    "scheduled_time": time.time() + SMS_DELAY_SECONDS,
-                    "created_time": time.time()
-                }
-                
-                self._pending_tasks[appraisal_id] = task_info
-                timer.start()
-                
-                logger.info(
-                    f"已调度延迟短信发送: 订单ID={appraisal_id}, 手机号={phone}, "
-                    f"状态={status}, 延迟={SMS_DELAY_SECONDS}秒"
-                )
-                
-                return True
-                
+            # 同一订单重新调度时调度器会取消旧任务
+            self._scheduler.schedule(
+                SMS_DELAY_SECONDS,
+                self._execute_send,
+                appraisal_id, phone, status, time.time(),
+                key=appraisal_id
+            )
+            
+            logger.info(
+                f"已调度延迟短信发送: 订单ID={appraisal_id}, 手机号={phone}, "
+                f"状态={status}, 延迟={SMS_DELAY_SECONDS}秒"
+            )
+            
+            return True
+            
         except Exception as e:
             logger.error(
                 f"调度延迟短信发送失败: 订单ID={appraisal_id}, 错误={str(e)}",
@@ -104,14 +130,15 @@ class SmsDelayManager:
             bool: 是否成功取消
         """
         try:
-            with self._task_lock:
-                if appraisal_id in self._pending_tasks:
-                    self._cancel_existing_task(appraisal_id)
-                    logger.info(f"已取消延迟短信发送: 订单ID={appraisal_id}")
-                    return True
-                else:
-                    logger.debug(f"未找到待取消的延迟任务: 订单ID={appraisal_id}")
-                    return False
+            cancelled = bool(self._redis_queue and self._redis_queue.cancel(appraisal_id))
+            if self._scheduler.cancel(appraisal_id):
+                cancelled = True
+            if cancelled:
+                logger.info(f"已取消延迟短信发送: 订单ID={appraisal_id}")
+                return True
+            else:
+                logger.debug(f"未找到待取消的延迟任务: 订单ID={appraisal_id}")
+                return False
                     
         except Exception as e:
             logger.error(
@@ -120,64 +147,300 @@ class SmsDelayManager:
             )
             return False
     
-    def _cancel_existing_task(self, appraisal_id: str) -> None:
-        """取消已存在的任务"""
-        if appraisal_id in self._pending_tasks:
-            task_info = self._pending_tasks[appraisal_id]
-            timer = task_info.get("timer")
-            if timer and timer.is_alive():
-                timer.cancel()
-                logger.debug(f"已取消旧延迟任务: 订单ID={appraisal_id}")
-            del self._pending_tasks[appraisal_id]
-    
-    def _execute_send(self, appraisal_id: str) -> None:
+    def _execute_send(self, appraisal_id: str, phone: str, status: str, created_time: float) -> None:
         """
-        Timer 到期后执行的回调函数
+        进程内延迟任务到期后在调度线程中执行：放入合并缓冲区，等待 SMS_DIGEST_GATHER_MS 后统一发送
         
         Args:
             appraisal_id: 鉴定订单ID
+            phone: 用户手机号
+            status: 鉴定状态
+            created_time: 任务创建时间
         """
+        with self._gather_lock:
+            first = not self._gathered
+            self._gathered.append(DueTask(appraisal_id, phone, status, created_time))
+        if first:
+            self._scheduler.schedule(SMS_DIGEST_GATHER_MS / 1000, self._flush_gathered)
+    
+    def _flush_gathered(self) -> None:
+        """发送合并缓冲区中的进程内任务"""
+        with self._gather_lock:
+            tasks, self._gathered = self._gathered, []
+        # 等待合并期间同一订单又被重新调度的，以新任务为准
+        tasks = [task for task in tasks if self._scheduler.get(task.appraisal_id) is None]
         try:
-            with self._task_lock:
-                if appraisal_id not in self._pending_tasks:
-                    logger.warning(f"延迟任务已不存在: 订单ID={appraisal_id}")
-                    return
-                
-                task_info = self._pending_tasks[appraisal_id]
-                phone = task_info.get("phone")
-                status = task_info.get("status")
-                
-                # 从内存中移除任务记录
-                del self._pending_tasks[appraisal_id]
-            
-            # 获取短信服务并发送
-            sms_service = get_sms_service()
-            if sms_service:
-                result = sms_service.send_status_notification(
-                    phone=phone,
-                    appraisal_status=status,
-                    appraisal_id=appraisal_id
-                )
-                
-                if result.get("success"):
-                    logger.info(
-                        f"延迟短信发送成功: 订单ID={appraisal_id}, 手机号={phone}, "
-                        f"状态={status}"
-                    )
-                else:
-                    logger.error(
-                        f"延迟短信发送失败: 订单ID={appraisal_id}, 手机号={phone}, "
-                        f"状态={status}, 错误={result.get('error_message', result.get('message'))}"
-                    )
-            else:
-                logger.error(f"短信服务不可用，延迟短信发送失败: 订单ID={appraisal_id}")
-                
+            self._send_digests(tasks)
         except Exception as e:
             logger.error(
-                f"执行延迟短信发送异常: 订单ID={appraisal_id}, 错误={str(e)}",
+                f"执行延迟短信发送异常: 订单ID={[task.appraisal_id for task in tasks]}, 错误={str(e)}",
                 exc_info=True
             )
     
+    def _send_digests(self, tasks: List[DueTask]) -> None:
+        """
+        按"号码 + 模板"合并到期任务，每组只提交一条短信，交给发送调度器异步发送
+        
+        窗口内该号码该模板已发送过时，整组推迟到窗口结束后再合并发送
+        
+        Args:
+            tasks: 到期任务列表
+        """
+        if not tasks:
+            return
+        sms_service = get_sms_service()
+        if not sms_service:
+            # Redis 任务保留，等待租约到期后重新领取
+            logger.error(f"短信服务不可用，延迟短信发送失败: 订单ID={[task.appraisal_id for task in tasks]}")
+            return
+        
+        groups: Dict[Tuple[str, str, str], List[DueTask]] = {}
+        for task in tasks:
+            template = sms_service.resolve_status_template(task.status)
+            if not template:
+                logger.warning(f"不需要发送短信的状态: {task.status}, 订单ID: {task.appraisal_id}")
+                self._ack([task])
+                continue
+            groups.setdefault((task.phone, *template), []).append(task)
+        
+        for (phone, template_id, template_desc), group in groups.items():
+            wait = 0.0
+            if SMS_DIGEST_WINDOW_SECONDS > 0:
+                wait = self._snapshot_store.acquire_window(phone, template_id, SMS_DIGEST_WINDOW_SECONDS)
+            if wait > 0:
+                self._defer(group, wait)
+                continue
+            
+            covered_ids = [task.appraisal_id for task in group]
+            sms_service.send_status_notification_async(
+                phone=phone,
+                appraisal_status=group[0].status,
+                appraisal_id=group[0].appraisal_id,
+                covered_ids=covered_ids,
+                callback=lambda result, group=group: self._on_digest_sent(group, result),
+                on_deferred=lambda delay, group=group: self._extend_lease(group, delay)
+            )
+            if len(group) > 1:
+                logger.info(
+                    f"已合并延迟短信: 手机号={phone}, 模板={template_desc}, 覆盖订单数={len(group)}, "
+                    f"订单ID={covered_ids}"
+                )
+    
+    def _defer(self, group: List[DueTask], wait: float) -> None:
+        """窗口未结束，整组推迟到窗口结束后"""
+        logger.info(
+            f"同一号码同一模板窗口内已发送，{wait:.0f} 秒后合并发送: 手机号={group[0].phone}, "
+            f"订单ID={[task.appraisal_id for task in group]}"
+        )
+        redis_tasks = [task.appraisal_id for task in group if task.payload is not None]
+        if redis_tasks:
+            self._redis_queue.defer(redis_tasks, wait)
+        for task in group:
+            if task.payload is None and self._scheduler.get(task.appraisal_id) is None:
+                self._scheduler.schedule(
+                    wait,
+                    self._execute_send,
+                    task.appraisal_id, task.phone, task.status, task.created_time,
+                    key=task.appraisal_id
+                )
+    
+    def _extend_lease(self, group: List[DueTask], delay: float) -> None:
+        """
+        发送调度器推迟发送（限流或重试）时延长 Redis 任务的租约，
+        避免租约先于发送到期、被重新领取后重复发送
+        """
+        redis_tasks = [task.appraisal_id for task in group if task.payload is not None]
+        if redis_tasks:
+            self._redis_queue.defer(redis_tasks, delay + SMS_DELAY_LEASE_SECONDS)
+    
+    def _ack(self, tasks: List[DueTask]) -> None:
+        """确认 Redis 队列中的任务已处理"""
+        for task in tasks:
+            if task.payload is not None:
+                self._redis_queue.ack(task.appraisal_id, task.payload)
+    
+    def _on_digest_sent(self, group: List[DueTask], result: Dict[str, Any]) -> None:
+        """合并短信发送完成：记录结果并确认组内所有任务；调度器已停止时保留任务等待重新投递"""
+        if get_error_code(result) == DISPATCH_STOPPED:
+            self._keep_unsent(group)
+            return
+        self._log_send_result(
+            ",".join(task.appraisal_id for task in group),
+            group[0].phone,
+            group[0].status,
+            result
+        )
+        self._ack(group)
+    
+    def _keep_unsent(self, group: List[DueTask]) -> None:
+        """
+        调度器停止、短信未发送：Redis 任务不确认，租约到期后由本副本重启后或其他副本重新领取；
+        进程内任务写入快照，下次启动时恢复
+        """
+        logger.warning(
+            f"短信发送调度器已停止，延迟短信保留待重新投递: 手机号={group[0].phone}, "
+            f"订单ID={[task.appraisal_id for task in group]}"
+        )
+        now = time.time()
+        snapshot = {
+            task.appraisal_id: {
+                "phone": task.phone,
+                "status": task.status,
+                "scheduled_time": now,
+                "created_time": task.created_time
+            }
+            for task in group if task.payload is None
+        }
+        if snapshot and not self._snapshot_store.save_snapshot(snapshot):
+            logger.error(f"延迟短信任务快照保存失败，以下任务将丢失: {snapshot}")
+    
+    def start(self) -> None:
+        """
+        应用启动时调用：重新调度上次关闭时保存的进程内任务，并启动 Redis 延迟队列轮询线程
+        （memory 后端无需轮询）
+        """
+        self.restore_snapshot()
+        if not self._redis_queue or (self._poller and self._poller.is_alive()):
+            return
+        self._stop_event.clear()
+        self._poller = threading.Thread(target=self._poll_loop, name="sms-delay-poller", daemon=True)
+        self._poller.start()
+        logger.info(f"短信延迟队列轮询已启动，间隔 {SMS_DELAY_POLL_INTERVAL} 秒")
+    
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        应用关闭时调用：停止轮询线程，把进程内待发送任务连同剩余延迟保存到 Redis 后立即取消
+        Redis 延迟队列中的任务本身已持久化，由下次启动或其他副本继续处理
+        """
+        self._stop_event.set()
+        if self._poller:
+            self._poller.join(timeout=timeout)
+            self._poller = None
+        self.snapshot_pending_tasks()
+    
+    def snapshot_pending_tasks(self) -> int:
+        """
+        取出所有进程内待发送任务并保存快照
+        
+        Returns:
+            保存的任务数量
+        """
+        tasks = self._scheduler.drain()
+        with self._gather_lock:
+            gathered, self._gathered = self._gathered, []
+        
+        now = time.time()
+        snapshot = {}
+        # 已到期、等待合并的任务按立即到期保存
+        for task in gathered:
+            snapshot[task.appraisal_id] = {
+                "phone": task.phone,
+                "status": task.status,
+                "scheduled_time": now,
+                "created_time": task.created_time
+            }
+        for task in tasks:
+            # 跳过合并缓冲区的刷新任务（无键）
+            if task.key is None:
+                continue
+            appraisal_id, phone, status, created_time = task.args
+            snapshot[appraisal_id] = {
+                "phone": phone,
+                "status": status,
+                "scheduled_time": now + task.remaining(),
+                "created_time": created_time
+            }
+        if not snapshot:
+            return 0
+        
+        if self._snapshot_store.save_snapshot(snapshot):
+            logger.info(f"已保存延迟短信任务快照，共 {len(snapshot)} 个")
+        else:
+            # 保存失败时把任务完整打到日志里，便于人工补发
+            logger.error(f"延迟短信任务快照保存失败，以下任务将丢失: {snapshot}")
+        return len(snapshot)
+    
+    def restore_snapshot(self) -> int:
+        """
+        取出上次关闭时保存的快照，按剩余延迟重新调度
+        
+        Returns:
+            重新调度的任务数量
+        """
+        snapshot = self._snapshot_store.take_snapshot()
+        if not snapshot:
+            return 0
+        
+        now = time.time()
+        for appraisal_id, task in snapshot.items():
+            phone = task.get("phone")
+            status = task.get("status")
+            created_time = task.get("created_time") or now
+            remaining = max(0.0, task.get("scheduled_time", now) - now)
+            
+            # 不覆盖关闭之后新调度的同一订单任务
+            if self._redis_queue and self._redis_queue.schedule(
+                appraisal_id, phone, status, remaining, created_time=created_time, nx=True
+            ):
+                continue
+            if self._scheduler.get(appraisal_id) is None:
+                self._scheduler.schedule(
+                    remaining,
+                    self._execute_send,
+                    appraisal_id, phone, status, created_time,
+                    key=appraisal_id
+                )
+        
+        logger.info(f"已从快照恢复延迟短信任务，共 {len(snapshot)} 个")
+        return len(snapshot)
+    
+    def _poll_loop(self) -> None:
+        """轮询线程主循环"""
+        while not self._stop_event.is_set():
+            try:
+                claimed = self._poll_once()
+            except Exception as e:
+                logger.error(f"短信延迟队列轮询异常: {str(e)}", exc_info=True)
+                claimed = 0
+            # 一批领满说明还有积压，立即继续
+            if claimed < SMS_DELAY_CLAIM_BATCH:
+                self._stop_event.wait(SMS_DELAY_POLL_INTERVAL)
+    
+    def _poll_once(self) -> int:
+        """
+        领取到期任务并提交发送
+        
+        发送完成后再确认删除任务；进程在发送前退出时，租约到期后任务会被重新领取
+        
+        Returns:
+            领取的任务数量
+        """
+        # 稍微提前领取即将到期的任务，使同一批调度的任务在同一次合并中发送
+        claimed = self._redis_queue.claim_due(
+            SMS_DELAY_LEASE_SECONDS,
+            SMS_DELAY_CLAIM_BATCH,
+            lookahead_seconds=SMS_DIGEST_GATHER_MS / 1000
+        )
+        self._send_digests([
+            DueTask(appraisal_id, task.get("phone"), task.get("status"), task.get("created_time") or 0, payload)
+            for appraisal_id, payload, task in claimed
+        ])
+        return len(claimed)
+    
+    @staticmethod
+    def _log_send_result(appraisal_id: str, phone: str, status: str, result: Dict[str, Any]) -> None:
+        """记录延迟短信的发送结果"""
+        if result.get("success"):
+            logger.info(
+                f"延迟短信发送成功: 订单ID={appraisal_id}, 手机号={phone}, "
+                f"状态={status}"
+            )
+        else:
+            logger.error(
+                f"延迟短信发送失败: 订单ID={appraisal_id}, 手机号={phone}, "
+                f"状态={status}, 错误={result.get('error_message', result.get('message'))}"
+            )
+    
     def get_pending_tasks(self) -> Dict[str, Dict[str, Any]]:
         """
         获取所有待发送任务（用于调试/监控）
@@ -185,10 +448,9 @@ class SmsDelayManager:
         Returns:
             Dict: 待发送任务字典
         """
-        with self._task_lock:
-            # 返回任务信息的副本，不包含 Timer 对象
-            result = {}
-            for appraisal_id, task_info in self._pending_tasks.items():
+        result = {}
+        if self._redis_queue:
+            for appraisal_id, task_info in self._redis_queue.get_tasks().items():
                 result[appraisal_id] = {
                     "phone": task_info.get("phone"),
                     "status": task_info.get("status"),
@@ -196,26 +458,36 @@ class SmsDelayManager:
                     "created_time": task_info.get("created_time"),
                     "remaining_seconds": max(0, int(task_info.get("scheduled_time", 0) - time.time()))
                 }
-            return result
+        
+        now = time.time()
+        for appraisal_id, task in self._scheduler.keyed_tasks().items():
+            _, phone, status, created_time = task.args
+            remaining = task.remaining()
+            result[appraisal_id] = {
+                "phone": phone,
+                "status": status,
+                "scheduled_time": now + remaining,
+                "created_time": created_time,
+                "remaining_seconds": int(remaining)
+            }
+        return result
     
     def get_task_count(self) -> int:
         """获取待发送任务数量"""
-        with self._task_lock:
-            return len(self._pending_tasks)
+        redis_count = self._redis_queue.count() if self._redis_queue else 0
+        return redis_count + self._scheduler.pending_count()
     
     def cancel_all_tasks(self) -> int:
         """
-        取消所有待发送任务（用于应用关闭时）
+        取消所有进程内待发送任务（不保存快照，应用关闭请使用 stop）
+        Redis 中的任务是持久化的，不在此清除
         
         Returns:
             int: 取消的任务数量
         """
-        with self._task_lock:
-            count = len(self._pending_tasks)
-            for appraisal_id in list(self._pending_tasks.keys()):
-                self._cancel_existing_task(appraisal_id)
-            logger.info(f"已取消所有延迟短信任务，共 {count} 个")
-            return count
+        count = self._scheduler.clear()
+        logger.info(f"已取消所有延迟短信任务，共 {count} 个")
+        return count
 
 
 # 全局单例实例
@@ -0,0 +1,285 @@
+"""
+基于 Redis 有序集合的短信延迟队列
+任务按鉴定订单ID去重，到期时间作为分数；多进程/多副本共享，重启不丢失
+"""
+import json
+import logging
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config.settings import ENVIRONMENT
+from app.utils.redis import RedisClient, get_redis
+
+logger = logging.getLogger(__name__)
+
+
+# 领取到期任务：把分数推后一个租约时长，返回 [id1, payload1, id2, payload2, ...]
+_CLAIM_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[3]))
+local out = {}
+for _, id in ipairs(ids) do
+    local payload = redis.call('HGET', KEYS[2], id)
+    if payload then
+        redis.call('ZADD', KEYS[1], ARGV[2], id)
+        table.insert(out, id)
+        table.insert(out, payload)
+    else
+        redis.call('ZREM', KEYS[1], id)
+    end
+end
+return out
+"""
+
+# 确认任务完成：只有任务内容未被重新调度时才删除
+_ACK_SCRIPT = """
+if redis.call('HGET', KEYS[2], ARGV[1]) == ARGV[2] then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+class RedisSmsDelayQueue:
+    """Redis 短信延迟队列"""
+    
+    def __init__(self, redis_client: Optional[RedisClient] = None):
+        """
+        初始化延迟队列
+        
+        Args:
+            redis_client: Redis客户端实例，不传则使用默认实例
+        """
+        self.redis = redis_client or get_redis()
+        # Redis key前缀：生产环境用"online"，其他环境用"dev"
+        self.env_prefix = "online" if ENVIRONMENT == "production" else "dev"
+        self.queue_key = f"{self.env_prefix}:sms_delay:queue"
+        self.tasks_key = f"{self.env_prefix}:sms_delay:tasks"
+        # 进程内任务在关闭时的快照，启动时重新调度
+        self.snapshot_key = f"{self.env_prefix}:sms_delay:snapshot"
+    
+    def schedule(
+        self,
+        appraisal_id: str,
+        phone: str,
+        status: str,
+        delay_seconds: float,
+        created_time: Optional[float] = None,
+        nx: bool = False
+    ) -> bool:
+        """
+        调度（或重新调度）任务，同一订单只保留最新的一条
+        
+        Args:
+            appraisal_id: 鉴定订单ID
+            phone: 用户手机号
+            status: 鉴定状态
+            delay_seconds: 延迟时间（秒）
+            created_time: 任务创建时间，默认当前时间
+            nx: 为 True 时只在该订单没有待发送任务时写入（不覆盖更新的任务）
+            
+        Returns:
+            是否成功
+        """
+        now = time.time()
+        due = now + delay_seconds
+        payload = json.dumps({
+            "phone": phone,
+            "status": status,
+            "scheduled_time": due,
+            "created_time": created_time or now,
+            # 每次调度生成新版本，避免误删发送期间被重新调度的任务
+            "version": uuid.uuid4().hex
+        })
+        try:
+            pipe = self.redis.get_client().pipeline(transaction=True)
+            if nx:
+                pipe.hsetnx(self.tasks_key, appraisal_id, payload)
+                pipe.zadd(self.queue_key, {appraisal_id: due}, nx=True)
+            else:
+                pipe.hset(self.tasks_key, appraisal_id, payload)
+                pipe.zadd(self.queue_key, {appraisal_id: due})
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Redis 延迟队列调度失败: 订单ID={appraisal_id}, 错误={e}", exc_info=True)
+            return False
+    
+    def cancel(self, appraisal_id: str) -> bool:
+        """
+        取消任务
+        
+        Args:
+            appraisal_id: 鉴定订单ID
+            
+        Returns:
+            是否存在并被取消
+        """
+        try:
+            pipe = self.redis.get_client().pipeline(transaction=True)
+            pipe.zrem(self.queue_key, appraisal_id)
+            pipe.hdel(self.tasks_key, appraisal_id)
+            _, deleted = pipe.execute()
+            return bool(deleted)
+        except Exception as e:
+            logger.error(f"Redis 延迟队列取消失败: 订单ID={appraisal_id}, 错误={e}", exc_info=True)
+            return False
+    
+    def claim_due(
+        self,
+        lease_seconds: float,
+        limit: int,
+        lookahead_seconds: float = 0
+    ) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """
+        领取已到期的任务，领取后在租约时长内不会被其他进程重复领取
+        
+        Args:
+            lease_seconds: 租约时长（秒）
+            limit: 最多领取数量
+            lookahead_seconds: 同时领取在此时间内即将到期的任务
+            
+        Returns:
+            [(鉴定订单ID, 原始任务内容, 解析后的任务内容), ...]
+        """
+        now = time.time()
+        try:
+            client = self.redis.get_client()
+            raw = client.eval(
+                _CLAIM_SCRIPT, 2, self.queue_key, self.tasks_key,
+                now + lookahead_seconds, now + lease_seconds, limit
+            )
+        except Exception as e:
+            logger.error(f"Redis 延迟队列领取失败: {e}", exc_info=True)
+            return []
+        
+        claimed = []
+        for i in range(0, len(raw), 2):
+            appraisal_id, payload = raw[i], raw[i + 1]
+            claimed.append((appraisal_id, payload, json.loads(payload)))
+        return claimed
+    
+    def ack(self, appraisal_id: str, payload: str) -> bool:
+        """
+        确认任务已处理
+        
+        Args:
+            appraisal_id: 鉴定订单ID
+            payload: 领取时的原始任务内容
+            
+        Returns:
+            是否删除（任务已被重新调度时返回 False）
+        """
+        try:
+            client = self.redis.get_client()
+            return bool(client.eval(_ACK_SCRIPT, 2, self.queue_key, self.tasks_key, appraisal_id, payload))
+        except Exception as e:
+            logger.error(f"Redis 延迟队列确认失败: 订单ID={appraisal_id}, 错误={e}", exc_info=True)
+            return False
+    
+    def defer(self, appraisal_ids: List[str], delay_seconds: float) -> None:
+        """
+        推迟已领取任务的到期时间（任务内容不变，不影响发送完成后的确认）
+        
+        Args:
+            appraisal_ids: 鉴定订单ID列表
+            delay_seconds: 推迟到当前时间之后多少秒
+        """
+        if not appraisal_ids:
+            return
+        due = time.time() + delay_seconds
+        try:
+            self.redis.get_client().zadd(
+                self.queue_key,
+                {appraisal_id: due for appraisal_id in appraisal_ids},
+                xx=True
+            )
+        except Exception as e:
+            logger.error(f"推迟延迟短信任务失败: 订单ID={appraisal_ids}, 错误={e}", exc_info=True)
+    
+    def acquire_window(self, phone: str, template_id: str, window_seconds: int) -> float:
+        """
+        占用"号码 + 模板"的发送窗口，窗口内同一号码同一模板只发送一条
+        
+        Args:
+            phone: 用户手机号
+            template_id: 模板ID
+            window_seconds: 窗口时长（秒）
+            
+        Returns:
+            0 表示已占用（可以发送）；否则为当前窗口剩余秒数。Redis 不可用时返回 0
+        """
+        key = f"{self.env_prefix}:sms_delay:window:{phone}:{template_id}"
+        try:
+            client = self.redis.get_client()
+            if client.set(key, str(time.time()), ex=window_seconds, nx=True):
+                return 0.0
+            return float(max(1, client.ttl(key)))
+        except Exception as e:
+            logger.error(f"占用短信发送窗口失败，本次放行: 手机号={phone}, 模板={template_id}, 错误={e}", exc_info=True)
+            return 0.0
+    
+    def get_tasks(self) -> Dict[str, Dict[str, Any]]:
+        """获取所有待发送任务"""
+        return {
+            appraisal_id: json.loads(payload)
+            for appraisal_id, payload in self.redis.hgetall(self.tasks_key).items()
+        }
+    
+    def count(self) -> int:
+        """待发送任务数量"""
+        try:
+            return self.redis.get_client().hlen(self.tasks_key)
+        except Exception as e:
+            logger.error(f"获取 Redis 延迟队列长度失败: {e}", exc_info=True)
+            return 0
+    
+    def clear(self) -> int:
+        """清空所有任务，返回清除的数量"""
+        count = self.count()
+        try:
+            self.redis.get_client().delete(self.queue_key, self.tasks_key)
+        except Exception as e:
+            logger.error(f"清空 Redis 延迟队列失败: {e}", exc_info=True)
+            return 0
+        return count
+    
+    def save_snapshot(self, tasks: Dict[str, Dict[str, Any]]) -> bool:
+        """
+        保存进程内待发送任务快照（关闭时调用）
+        
+        Args:
+            tasks: {鉴定订单ID: {"phone", "status", "scheduled_time", "created_time"}}
+            
+        Returns:
+            是否成功
+        """
+        if not tasks:
+            return True
+        try:
+            self.redis.get_client().hset(self.snapshot_key, mapping={
+                appraisal_id: json.dumps(task) for appraisal_id, task in tasks.items()
+            })
+            return True
+        except Exception as e:
+            logger.error(f"保存延迟短信任务快照失败: 任务数={len(tasks)}, 错误={e}", exc_info=True)
+            return False
+    
+    def take_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        取出并删除任务快照（启动时调用），多个副本同时启动时只有一个能取到
+        
+        Returns:
+            {鉴定订单ID: 任务内容}
+        """
+        try:
+            pipe = self.redis.get_client().pipeline(transaction=True)
+            pipe.hgetall(self.snapshot_key)
+            pipe.delete(self.snapshot_key)
+            snapshot, _ = pipe.execute()
+        except Exception as e:
+            logger.error(f"读取延迟短信任务快照失败: {e}", exc_info=True)
+            return {}
+        return {appraisal_id: json.loads(payload) for appraisal_id, payload in snapshot.items()}
@@ -0,0 +1,554 @@
+"""
+短信发送调度器
+所有异步短信（即时与延迟）都经过一个有界队列，由固定数量的工作线程发送；
+工作线程在短时间窗口内合并同模板的短信，一次 SendSms 请求发给多个号码；
+发送前经过限流：全局 QPS 超限时工作线程等待，单号码超限的短信延后重新入队；
+可重试的失败按指数退避重新入队，重试耗尽后进入死信存储
+"""
+import logging
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config.settings import (
+    SMS_DISPATCH_WORKERS,
+    SMS_DISPATCH_QUEUE_SIZE,
+    SMS_DISPATCH_OVERFLOW_POLICY,
+    SMS_DISPATCH_PUT_TIMEOUT,
+    SMS_COALESCE_WINDOW_MS,
+    SMS_COALESCE_MAX_BATCH,
+    SMS_RATE_LIMIT_ENABLED,
+    SMS_RETRY_MAX_ATTEMPTS,
+    SMS_RETRY_BASE_DELAY,
+    SMS_RETRY_MAX_DELAY
+)
+from app.services.sms_dead_letter import SmsDeadLetterStore, get_sms_dead_letter_store
+from app.services.sms_errors import DISPATCH_STOPPED, is_dead_letter_only, is_retryable, get_error_code
+from app.services.sms_rate_limiter import SmsRateLimiter
+from app.utils.metrics import LatencyRecorder
+from app.utils.scheduler import DelayScheduler
+
+logger = logging.getLogger(__name__)
+
+
+# 队列满时的处理策略
+class OverflowPolicy:
+    """溢出策略常量"""
+    BLOCK = "block"  # 阻塞等待，超时后丢弃新消息
+    DROP_OLDEST = "drop_oldest"  # 丢弃最早入队的消息
+    REJECT = "reject"  # 直接丢弃新消息
+    CALLER_RUNS = "caller_runs"  # 在调用方线程同步发送
+
+
+class SmsMessage:
+    """待发送短信"""
+    
+    __slots__ = ("phone", "template_id", "template_desc", "appraisal_id", "callback", "enqueued_at", "attempts",
+                 "covered_ids", "on_deferred")
+    
+    def __init__(
+        self,
+        phone: str,
+        template_id: str,
+        template_desc: str = "",
+        appraisal_id: str = "",
+        callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+        covered_ids: Optional[List[str]] = None,
+        on_deferred: Optional[Callable[[float], None]] = None
+    ):
+        self.phone = phone
+        self.template_id = template_id
+        self.template_desc = template_desc
+        self.appraisal_id = appraisal_id
+        self.callback = callback
+        self.enqueued_at = 0.0
+        self.attempts = 0
+        # 合并通知时本条短信覆盖的全部鉴定订单ID（写入台账）
+        self.covered_ids = covered_ids
+        # 限流或重试推迟发送时以推迟秒数调用（如延长上游任务的租约）
+        self.on_deferred = on_deferred
+
+
+def _default_send_batch(messages: List[SmsMessage]) -> List[Dict[str, Any]]:
+    """默认批量发送函数：同模板、号码不重复的一组短信合并为一次请求"""
+    from app.services.sms import get_sms_service
+    
+    sms_service = get_sms_service()
+    if not sms_service:
+        return [{
+            "success": False,
+            "error_code": "SMS_SERVICE_UNAVAILABLE",
+            "error_message": "短信服务不可用"
+        } for _ in messages]
+    return sms_service.send_template_batch(
+        phones=[message.phone for message in messages],
+        template_id=messages[0].template_id,
+        template_desc=messages[0].template_desc,
+        appraisal_ids=[message.appraisal_id for message in messages],
+        covered_ids=[message.covered_ids for message in messages]
+    )
+
+
+class SmsDispatcher:
+    """短信发送调度器"""
+    
+    def __init__(
+        self,
+        send_batch_func: Optional[Callable[[List[SmsMessage]], List[Dict[str, Any]]]] = None,
+        workers: int = SMS_DISPATCH_WORKERS,
+        queue_size: int = SMS_DISPATCH_QUEUE_SIZE,
+        overflow_policy: str = SMS_DISPATCH_OVERFLOW_POLICY,
+        put_timeout: float = SMS_DISPATCH_PUT_TIMEOUT,
+        coalesce_window_ms: int = SMS_COALESCE_WINDOW_MS,
+        max_batch: int = SMS_COALESCE_MAX_BATCH,
+        rate_limiter: Optional[SmsRateLimiter] = None,
+        max_attempts: int = SMS_RETRY_MAX_ATTEMPTS,
+        dead_letter_store: Optional[SmsDeadLetterStore] = None
+    ):
+        """
+        初始化调度器
+        
+        Args:
+            send_batch_func: 批量发送函数，入参为同模板、号码不重复的一组短信，
+                             返回与之顺序一致的结果列表；默认使用短信服务
+            workers: 工作线程数
+            queue_size: 队列容量
+            overflow_policy: 队列满时策略，见 OverflowPolicy
+            put_timeout: block 策略的最长等待时间（秒）
+            coalesce_window_ms: 取到第一条短信后继续等待合并的时间窗口（毫秒）
+            max_batch: 单次合并的最大条数
+            rate_limiter: 短信限流器，为空则不限流
+            max_attempts: 可重试失败的最多发送次数（含首次），1 表示不重试
+            dead_letter_store: 死信存储，为空则重试耗尽后只记录日志
+        """
+        self._send_batch_func = send_batch_func or _default_send_batch
+        self._coalesce_window = coalesce_window_ms / 1000
+        self._max_batch = max(1, max_batch)
+        self._worker_count = max(1, workers)
+        self._queue: "queue.Queue[Optional[SmsMessage]]" = queue.Queue(maxsize=queue_size)
+        self._overflow_policy = overflow_policy
+        self._put_timeout = put_timeout
+        self._workers = []
+        self._start_lock = threading.Lock()
+        self._stopped = False
+        self._rate_limiter = rate_limiter
+        self._max_attempts = max(1, max_attempts)
+        self._dead_letter_store = dead_letter_store
+        # 单号码超限、等待重试的短信在此等待重新入队
+        self._deferred = DelayScheduler(name="sms-dispatch-deferred")
+        
+        # 指标
+        self._counter_lock = threading.Lock()
+        self._counters = {
+            "submitted": 0,
+            "requests": 0,
+            "sent": 0,
+            "failed": 0,
+            "dropped": 0,
+            "caller_runs": 0,
+            "deferred": 0,
+            "retried": 0,
+            "dead_lettered": 0,
+            "stopped": 0,
+        }
+        self._queue_wait = LatencyRecorder()
+        self._send_latency = LatencyRecorder()
+        self._batch_size = LatencyRecorder()
+        self._throttle_wait = LatencyRecorder()
+    
+    # ========== 提交 ==========
+    
+    def submit(self, message: SmsMessage) -> bool:
+        """
+        提交短信到发送队列
+        
+        发送完成（或被丢弃）后以结果字典调用 message.callback
+        
+        Args:
+            message: 待发送短信
+            
+        Returns:
+            是否被接收（False 表示已按溢出策略或停止状态丢弃）
+        """
+        self._incr("submitted")
+        return self._enqueue(message)
+    
+    def _enqueue(self, message: SmsMessage) -> bool:
+        """放入发送队列，队列满时按溢出策略处理，返回是否被接收"""
+        self._ensure_started()
+        message.enqueued_at = time.monotonic()
+        
+        if self._stopped:
+            self._reject_stopped(message)
+            return False
+        
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            pass
+        
+        policy = self._overflow_policy
+        if policy == OverflowPolicy.BLOCK:
+            try:
+                self._queue.put(message, timeout=self._put_timeout)
+                return True
+            except queue.Full:
+                self._drop(message, f"队列已满，等待 {self._put_timeout} 秒后丢弃")
+                return False
+        elif policy == OverflowPolicy.DROP_OLDEST:
+            try:
+                oldest = self._queue.get_nowait()
+                if oldest is None:
+                    # 取到的是关闭时放入的退出信号：放回信号（队列在消费中，很快有空位），新消息按已停止丢弃
+                    self._queue.put(None)
+                    self._reject_stopped(message)
+                    return False
+                self._drop(oldest, "队列已满，丢弃最早的消息")
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(message)
+                return True
+            except queue.Full:
+                self._drop(message, "队列已满")
+                return False
+        elif policy == OverflowPolicy.CALLER_RUNS:
+            self._incr("caller_runs")
+            self._process_batch([message])
+            return True
+        self._drop(message, "队列已满，拒绝新消息")
+        return False
+    
+    def _reject_stopped(self, message: SmsMessage) -> None:
+        """
+        调度器停止后到达的消息（含限流、重试推迟后重新入队的）：不作为最终失败，
+        以 DISPATCH_STOPPED 回调，由调用方保留任务等待重新投递；没有回调的写入死信
+        """
+        self._incr("stopped")
+        logger.warning(
+            f"短信发送调度器已停止，短信未发送: 订单ID={message.appraisal_id}, 手机号={message.phone}, "
+            f"模板={message.template_id}"
+        )
+        result = {"success": False, "error_code": DISPATCH_STOPPED, "error_message": "调度器已停止"}
+        if message.callback is None and self._dead_letter_store:
+            self._dead_letter_store.add(
+                phone=message.phone,
+                template_id=message.template_id,
+                template_desc=message.template_desc,
+                appraisal_id=message.appraisal_id,
+                attempts=message.attempts,
+                result=result,
+                covered_ids=message.covered_ids
+            )
+        self._complete(message, result)
+    
+    def _drop(self, message: SmsMessage, reason: str) -> None:
+        """丢弃消息并以失败结果回调"""
+        self._incr("dropped")
+        logger.error(
+            f"短信被丢弃: 订单ID={message.appraisal_id}, 手机号={message.phone}, "
+            f"模板={message.template_id}, 原因={reason}"
+        )
+        self._complete(message, {
+            "success": False,
+            "error_code": "DISPATCH_DROPPED",
+            "error_message": reason
+        })
+    
+    # ========== 工作线程 ==========
+    
+    def _ensure_started(self) -> None:
+        """首次提交时启动工作线程"""
+        if self._workers:
+            return
+        with self._start_lock:
+            if self._workers:
+                return
+            for i in range(self._worker_count):
+                thread = threading.Thread(target=self._worker_loop, daemon=True, name=f"sms-dispatch-{i}")
+                thread.start()
+                self._workers.append(thread)
+            logger.info(
+                f"短信发送调度器已启动: 线程数={self._worker_count}, 队列容量={self._queue.maxsize}, "
+                f"溢出策略={self._overflow_policy}"
+            )
+    
+    def _worker_loop(self) -> None:
+        """工作线程：取出一批短信合并发送，收到 None 时退出"""
+        while True:
+            message = self._queue.get()
+            if message is None:
+                return
+            batch = [message]
+            stop = self._collect(batch)
+            self._process_batch(batch)
+            if stop:
+                return
+    
+    def _collect(self, batch: List[SmsMessage]) -> bool:
+        """
+        在合并窗口内继续从队列取短信，直到窗口结束或达到单批上限
+        
+        Returns:
+            是否取到了退出信号
+        """
+        deadline = time.monotonic() + self._coalesce_window
+        while len(batch) < self._max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    message = self._queue.get(timeout=remaining)
+                else:
+                    message = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if message is None:
+                return True
+            batch.append(message)
+        return False
+    
+    @staticmethod
+    def _group(batch: List[SmsMessage]) -> List[List[SmsMessage]]:
+        """按模板分组，同一组内号码不重复（重复号码放入下一组，保证结果可按号码拆分）"""
+        groups: List[List[SmsMessage]] = []
+        open_groups: Dict[str, List[List[SmsMessage]]] = {}
+        for message in batch:
+            for group in open_groups.setdefault(message.template_id, []):
+                if all(m.phone != message.phone for m in group):
+                    group.append(message)
+                    break
+            else:
+                group = [message]
+                open_groups[message.template_id].append(group)
+                groups.append(group)
+        return groups
+    
+    def _process_batch(self, batch: List[SmsMessage]) -> None:
+        """合并发送一批短信，把每个号码的结果回调给各自的调用方"""
+        now = time.monotonic()
+        for message in batch:
+            self._queue_wait.record((now - message.enqueued_at) * 1000)
+        
+        for group in self._group(batch):
+            if self._rate_limiter:
+                group = self._throttle(group)
+                if not group:
+                    continue
+            for message in group:
+                message.attempts += 1
+            started = time.monotonic()
+            try:
+                results = self._send_batch_func(group)
+            except Exception as e:
+                logger.error(f"短信批量发送异常: 模板={group[0].template_id}, 条数={len(group)}, 错误={str(e)}", exc_info=True)
+                results = [{"success": False, "error_code": "UNKNOWN_ERROR", "error_message": str(e)} for _ in group]
+            self._send_latency.record((time.monotonic() - started) * 1000)
+            self._batch_size.record(len(group))
+            self._incr("requests")
+            
+            for message, result in zip(group, results):
+                if result.get("success"):
+                    self._incr("sent")
+                elif self._retry_or_dead_letter(message, result):
+                    continue
+                else:
+                    self._incr("failed")
+                result["attempts"] = message.attempts
+                self._complete(message, result)
+    
+    def _retry_or_dead_letter(self, message: SmsMessage, result: Dict[str, Any]) -> bool:
+        """
+        可重试的失败按指数退避（带抖动）重新入队；重试耗尽或属于短时间内无法恢复的错误时写入死信
+        
+        Returns:
+            是否已安排重试（安排重试时暂不回调）
+        """
+        if is_dead_letter_only(result):
+            self._dead_letter(message, result, "短信发送失败且短时间内无法恢复，进入死信")
+            return False
+        if not is_retryable(result):
+            return False
+        
+        if message.attempts < self._max_attempts:
+            # 等抖动退避：[delay/2, delay] 之间随机，避免大量失败短信同时重试
+            delay = min(SMS_RETRY_MAX_DELAY, SMS_RETRY_BASE_DELAY * (2 ** (message.attempts - 1)))
+            delay = random.uniform(delay / 2, delay)
+            self._incr("retried")
+            logger.warning(
+                f"短信发送失败，{delay:.1f} 秒后第 {message.attempts + 1} 次发送: 订单ID={message.appraisal_id}, "
+                f"手机号={message.phone}, 错误码={get_error_code(result)}"
+            )
+            self._defer(message, delay)
+            return True
+        
+        self._dead_letter(message, result, f"短信重试 {message.attempts} 次仍失败，进入死信")
+        return False
+    
+    def _dead_letter(self, message: SmsMessage, result: Dict[str, Any], reason: str) -> None:
+        """写入死信"""
+        self._incr("dead_lettered")
+        logger.error(
+            f"{reason}: 订单ID={message.appraisal_id}, "
+            f"手机号={message.phone}, 错误码={get_error_code(result)}"
+        )
+        if self._dead_letter_store:
+            self._dead_letter_store.add(
+                phone=message.phone,
+                template_id=message.template_id,
+                template_desc=message.template_desc,
+                appraisal_id=message.appraisal_id,
+                attempts=message.attempts,
+                result=result,
+                covered_ids=message.covered_ids
+            )
+    
+    def _throttle(self, group: List[SmsMessage]) -> List[SmsMessage]:
+        """
+        限流：单号码超限的短信延后重新入队，其余短信等待全局令牌后发送
+        
+        Returns:
+            可以立即发送的短信
+        """
+        waits = self._rate_limiter.reserve_phones([(m.phone, m.template_id) for m in group])
+        allowed = []
+        for message, wait in zip(group, waits):
+            if wait > 0:
+                self._incr("deferred")
+                logger.info(
+                    f"短信触发单号码限流，{wait:.1f} 秒后重试: 订单ID={message.appraisal_id}, "
+                    f"手机号={message.phone}, 模板={message.template_id}"
+                )
+                self._defer(message, wait)
+            else:
+                allowed.append(message)
+        if allowed:
+            self._throttle_wait.record(self._rate_limiter.wait_global() * 1000)
+        return allowed
+    
+    def _defer(self, message: SmsMessage, delay: float) -> None:
+        """推迟 delay 秒后重新入队，并通知调用方"""
+        self._deferred.schedule(delay, self._enqueue, message)
+        if message.on_deferred is None:
+            return
+        try:
+            message.on_deferred(delay)
+        except Exception as e:
+            logger.error(f"短信推迟回调异常: 订单ID={message.appraisal_id}, 错误={str(e)}", exc_info=True)
+    
+    @staticmethod
+    def _complete(message: SmsMessage, result: Dict[str, Any]) -> None:
+        """以发送结果调用消息回调"""
+        if message.callback is None:
+            return
+        try:
+            message.callback(result)
+        except Exception as e:
+            logger.error(f"短信发送回调异常: 订单ID={message.appraisal_id}, 错误={str(e)}", exc_info=True)
+    
+    # ========== 指标与关闭 ==========
+    
+    def _incr(self, name: str, amount: int = 1) -> None:
+        with self._counter_lock:
+            self._counters[name] += amount
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        获取调度器指标
+        
+        Returns:
+            队列深度、计数器、排队等待与单次请求耗时分位数（毫秒）、合并条数分布
+        """
+        with self._counter_lock:
+            counters = dict(self._counters)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "workers": len(self._workers),
+            "overflow_policy": self._overflow_policy,
+            **counters,
+            "queue_wait_ms": self._queue_wait.snapshot(),
+            "send_latency_ms": self._send_latency.snapshot(),
+            "batch_size": self._batch_size.snapshot(),
+            "rate_limited": self._rate_limiter is not None,
+            "deferred_pending": self._deferred.pending_count(),
+            "max_attempts": self._max_attempts,
+            "throttle_wait_ms": self._throttle_wait.snapshot(),
+        }
+    
+    def replay_dead_letters(self, letter_ids: Optional[List[str]] = None, limit: int = 1000) -> int:
+        """
+        从死信存储取出短信重新提交发送（重新计算发送次数）
+        
+        Args:
+            letter_ids: 死信ID列表，为空时重发最早的 limit 条
+            limit: 最多重发条数
+            
+        Returns:
+            重新提交的条数
+        """
+        if not self._dead_letter_store:
+            return 0
+        # 先取出（删除）再提交，避免并发重发同一条；未被接收的放回死信存储
+        letters = self._dead_letter_store.take(letter_ids, limit)
+        rejected = [
+            letter for letter in letters
+            if not self.submit(SmsMessage(
+                phone=letter["phone"],
+                template_id=letter["template_id"],
+                template_desc=letter.get("template_desc") or "",
+                appraisal_id=letter.get("appraisal_id") or "",
+                covered_ids=letter.get("covered_ids")
+            ))
+        ]
+        if rejected:
+            self._dead_letter_store.restore(rejected)
+            logger.warning(f"{len(rejected)} 条死信短信未被发送队列接收，已放回死信")
+        submitted = len(letters) - len(rejected)
+        logger.info(f"已重新提交 {submitted} 条死信短信")
+        return submitted
+    
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """
+        停止接收新消息，等待队列中的消息发送完成（最多 timeout 秒）
+        
+        Args:
+            timeout: 最长等待时间（秒）
+        """
+        self._stopped = True
+        deadline = time.monotonic() + timeout
+        for _ in self._workers:
+            try:
+                self._queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in self._workers:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        self._deferred.shutdown(timeout=0)
+        # 仍在等待限流或重试的短信不会再发送，通知调用方保留任务
+        for task in self._deferred.drain():
+            self._reject_stopped(task.args[0])
+        remaining = self._queue.qsize()
+        if remaining:
+            logger.warning(f"短信发送调度器关闭时仍有 {remaining} 条消息未发送")
+        logger.info("短信发送调度器已停止")
+
+
+# 全局调度器实例
+_dispatcher: Optional[SmsDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_sms_dispatcher() -> SmsDispatcher:
+    """获取短信发送调度器实例（单例模式）"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = SmsDispatcher(
+                    rate_limiter=SmsRateLimiter() if SMS_RATE_LIMIT_ENABLED else None,
+                    dead_letter_store=get_sms_dead_letter_store()
+                )
+    return _dispatcher
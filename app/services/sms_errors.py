@@ -0,0 +1,81 @@
+"""
+短信发送错误分类
+区分可重试（网络、超时、限频等临时错误）与不可重试（参数、模板、签名、黑名单等）错误
+"""
+from typing import Any, Dict
+
+# 可重试的错误码（腾讯云 SDK / SendStatus 以及本服务内部错误码）
+RETRYABLE_CODES = {
+    # SDK 客户端网络错误
+    "ClientNetworkError",
+    "ServerNetworkError",
+    # 平台临时错误
+    "InternalError.Timeout",
+    "InternalError.RequestTimeException",
+    "InternalError.SendAndRecvFail",
+    "InternalError.OtherError",
+    # 频率限制：稍后重试即可（套餐包余量不足、单号码每小时上限等短时间内无法恢复的错误不重试，直接进入死信由人工重发）
+    "RequestLimitExceeded",
+    "LimitExceeded.DeliveryFrequencyLimit",
+    "LimitExceeded.PhoneNumberThirtySecondLimit",
+    # 本服务内部错误
+    "UNKNOWN_ERROR",
+    "SMS_SERVICE_UNAVAILABLE",
+}
+
+# 以这些前缀开头的错误码均视为可重试
+RETRYABLE_PREFIXES = ("InternalError",)
+
+# 短时间内无法恢复的错误码：不重试，直接进入死信，待充值或限额恢复后由人工重发
+DEAD_LETTER_CODES = {
+    "FailedOperation.InsufficientBalanceInSmsPackage",
+    "LimitExceeded.PhoneNumberOneHourLimit",
+}
+
+# 调度器已停止、短信未发送：不是最终失败，调用方应保留任务（如不确认延迟队列任务）以便重新投递
+DISPATCH_STOPPED = "DISPATCH_STOPPED"
+
+
+def get_error_code(result: Dict[str, Any]) -> str:
+    """取发送结果中的错误码（SendStatus.Code 或异常错误码）"""
+    return result.get("error_code") or result.get("code") or ""
+
+
+def is_retryable(result: Dict[str, Any]) -> bool:
+    """
+    判断发送失败是否可重试
+    
+    Args:
+        result: 短信服务返回的发送结果
+        
+    Returns:
+        成功或不可重试的失败返回 False
+    """
+    if result.get("success"):
+        return False
+    code = get_error_code(result)
+    return code in RETRYABLE_CODES or code.startswith(RETRYABLE_PREFIXES)
+
+
+def is_dead_letter_only(result: Dict[str, Any]) -> bool:
+    """判断发送失败是否不重试、直接进入死信"""
+    return not result.get("success") and get_error_code(result) in DEAD_LETTER_CODES
+
+
+def is_provider_failure(error: Exception) -> bool:
+    """
+    判断整个请求的异常是否属于通道故障（网络、超时、平台内部错误、请求限频），
+    属于时换下一个短信通道重试；参数、鉴权等请求本身的问题换通道也不会成功
+    
+    Args:
+        error: 发送请求抛出的异常
+        
+    Returns:
+        是否应切换通道
+    """
+    code = getattr(error, "code", None)
+    if not code:
+        # 没有错误码的异常（如适配其他厂商时的网络异常）按通道故障处理
+        return True
+    # 套餐包余量、单号码限额按账号计算，其他通道可能仍可发送
+    return is_retryable({"error_code": code}) or code in DEAD_LETTER_CODES
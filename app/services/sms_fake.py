@@ -0,0 +1,93 @@
+"""
+本地假短信客户端
+接口与腾讯云 SmsClient.SendSms 保持一致，用于开发环境与压测，不发送真实短信
+"""
+import itertools
+import logging
+import random
+import threading
+import time
+import uuid
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FakeSendStatus:
+    """与 SDK 的 SendStatus 字段一致"""
+    
+    def __init__(self, phone_number: str, code: str = "Ok", message: str = "send success"):
+        self.SerialNo = uuid.uuid4().hex
+        self.PhoneNumber = phone_number
+        self.Fee = 1 if code == "Ok" else 0
+        self.SessionContext = ""
+        self.Code = code
+        self.Message = message
+        self.IsoCode = "CN"
+
+
+class FakeSendSmsResponse:
+    """与 SDK 的 SendSmsResponse 字段一致"""
+    
+    def __init__(self, statuses: List[FakeSendStatus]):
+        self.SendStatusSet = statuses
+        self.RequestId = uuid.uuid4().hex
+
+
+class FakeNetworkError(Exception):
+    """模拟 SDK 的网络错误（错误码与 TencentCloudSDKException 一致）"""
+    
+    def __init__(self):
+        super().__init__("fake network error")
+        self.code = "ClientNetworkError"
+        self.message = "fake network error"
+
+
+class FakeSmsClient:
+    """假短信客户端"""
+    
+    def __init__(
+        self,
+        latency_ms: float = 0,
+        failing_numbers: Optional[Iterable[str]] = None,
+        max_phones_per_request: int = 200,
+        error_rate: float = 0
+    ):
+        """
+        Args:
+            latency_ms: 每次请求模拟的耗时（毫秒），可在运行中修改以模拟通道变慢
+            failing_numbers: 返回失败状态的号码（已格式化，如 "+8613800000000"）
+            max_phones_per_request: 单次请求最多号码数，超出时与腾讯云一样整体报错
+            error_rate: 整个请求失败（抛出网络错误）的概率，用于模拟通道故障
+        """
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.failing_numbers = set(failing_numbers or [])
+        self.max_phones_per_request = max_phones_per_request
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.phone_count = 0
+    
+    def SendSms(self, request) -> FakeSendSmsResponse:
+        """模拟 SendSms"""
+        phone_numbers = list(request.PhoneNumberSet or [])
+        if len(phone_numbers) > self.max_phones_per_request:
+            raise ValueError(f"号码数超过单次请求上限: {len(phone_numbers)} > {self.max_phones_per_request}")
+        
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeNetworkError()
+        
+        with self._lock:
+            self.request_count += 1
+            self.phone_count += len(phone_numbers)
+        
+        statuses = [
+            FakeSendStatus(phone, "FailedOperation.PhoneNumberInBlacklist", "phone number in blacklist")
+            if phone in self.failing_numbers else FakeSendStatus(phone)
+            for phone in phone_numbers
+        ]
+        logger.debug(f"[FakeSms] 模板={request.TemplateId}, 号码数={len(phone_numbers)}")
+        return FakeSendSmsResponse(statuses)
@@ -0,0 +1,365 @@
+"""
+短信发送台账
+每个号码的每次发送尝试记录一条，经后台线程批量写入数据库，不阻塞发送流程；
+运营商送达回执同样经后台线程按流水号批量更新到台账
+"""
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam
+from sqlmodel import Session, select, insert, update, func, case
+
+from app.config.settings import (
+    SMS_LEDGER_ENABLED,
+    SMS_LEDGER_FLUSH_ROWS,
+    SMS_LEDGER_FLUSH_MS,
+    SMS_LEDGER_QUEUE_SIZE,
+    SMS_LEDGER_PHONE_SALT,
+    SMS_RECEIPT_MATCH_WINDOW
+)
+from app.models.sms_ledger import SmsLedger
+from app.schemas.sms import SmsLedgerListData, SmsDailyRollupItem, SmsStatusReport
+from app.utils.batch_writer import BatchWriter
+from app.utils.db import engine
+
+logger = logging.getLogger(__name__)
+
+# 按日汇总使用北京时间
+_BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+def _normalize_phone(phone: str) -> str:
+    """去掉国家码，统一为11位号码"""
+    phone = (phone or "").strip()
+    if phone.startswith("+86"):
+        return phone[3:]
+    if phone.startswith("86") and len(phone) == 13:
+        return phone[2:]
+    return phone
+
+
+def hash_phone(phone: str) -> str:
+    """手机号哈希（加盐 SHA-256），台账中不保存明文号码"""
+    return hashlib.sha256(f"{SMS_LEDGER_PHONE_SALT}{_normalize_phone(phone)}".encode("utf-8")).hexdigest()
+
+
+def mask_phone(phone: str) -> str:
+    """手机号脱敏：138****0001"""
+    phone = _normalize_phone(phone)
+    if len(phone) < 7:
+        return "*" * len(phone)
+    return f"{phone[:3]}****{phone[-4:]}"
+
+
+def _parse_time(value: str) -> datetime:
+    """解析 ISO 时间字符串为 UTC 时间（不带时区，与入库时间一致）"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=_BEIJING_TZ)
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class SmsLedgerService:
+    """短信发送台账服务"""
+    
+    def __init__(self):
+        self.writer: BatchWriter[Dict[str, Any]] = BatchWriter(
+            self._write_rows,
+            max_rows=SMS_LEDGER_FLUSH_ROWS,
+            max_delay_ms=SMS_LEDGER_FLUSH_MS,
+            queue_size=SMS_LEDGER_QUEUE_SIZE,
+            name="sms-ledger-writer"
+        )
+        self.receipt_writer: BatchWriter[Dict[str, Any]] = BatchWriter(
+            self._write_receipts,
+            max_rows=SMS_LEDGER_FLUSH_ROWS,
+            max_delay_ms=SMS_LEDGER_FLUSH_MS,
+            queue_size=SMS_LEDGER_QUEUE_SIZE,
+            name="sms-receipt-writer"
+        )
+        self._receipt_counter_lock = threading.Lock()
+        self._receipt_counters = {"received": 0, "matched": 0, "unmatched": 0}
+        # 先于发送记录到达、暂未匹配的回执：{流水号: (回执, 首次未匹配时间)}，台账写入对应流水号后重新匹配
+        self._pending_receipts: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        # 回执匹配与台账写入后的重试检查互斥，保证两者之间写入的发送记录不会漏掉重试
+        self._pending_lock = threading.Lock()
+    
+    def record(
+        self,
+        appraisal_id: str,
+        phone: str,
+        template_id: str,
+        template_desc: str,
+        result: Dict[str, Any],
+        covered_ids: Optional[List[str]] = None
+    ) -> None:
+        """
+        记录一次发送尝试（只入队，不等待写库）
+        
+        Args:
+            appraisal_id: 鉴定订单ID
+            phone: 用户手机号
+            template_id: 模板ID
+            template_desc: 模板描述
+            result: 短信服务返回的发送结果
+            covered_ids: 合并通知时本条短信覆盖的全部鉴定订单ID
+        """
+        self.writer.add({
+            "appraisal_id": appraisal_id or "",
+            "covered_appraisal_ids": ",".join(covered_ids) if covered_ids and len(covered_ids) > 1 else None,
+            "phone_hash": hash_phone(phone),
+            "phone_masked": mask_phone(phone),
+            "template_id": template_id,
+            "template_desc": template_desc or None,
+            "status": "success" if result.get("success") else "failed",
+            "code": result.get("code") or result.get("error_code"),
+            "message": (result.get("message") or result.get("error_message") or "")[:255] or None,
+            "request_id": result.get("request_id"),
+            "serial_no": result.get("serial_no"),
+            "fee": result.get("fee") or 0,
+            "latency_ms": result.get("latency_ms"),
+            "created_at": datetime.now(timezone.utc).replace(tzinfo=None)
+        })
+    
+    def _write_rows(self, rows: List[Dict[str, Any]]) -> None:
+        """一次 INSERT 写入一批台账记录，写入后重新匹配在此之前到达的回执"""
+        with Session(engine) as session:
+            session.execute(insert(SmsLedger), rows)
+            session.commit()
+        self._retry_pending_receipts({row["serial_no"] for row in rows if row.get("serial_no")})
+    
+    def _retry_pending_receipts(self, serial_nos: Set[str]) -> None:
+        """
+        刚写入的发送记录有暂未匹配的回执时重新入队更新；超过保留时间的回执丢弃
+        
+        Args:
+            serial_nos: 刚写入的发送记录流水号
+        """
+        expire_before = time.monotonic() - SMS_RECEIPT_MATCH_WINDOW
+        with self._pending_lock:
+            if not self._pending_receipts:
+                return
+            retry = [
+                self._pending_receipts.pop(serial_no)[0]
+                for serial_no in serial_nos if serial_no in self._pending_receipts
+            ]
+            expired = [
+                serial_no for serial_no, (_, first_seen) in self._pending_receipts.items()
+                if first_seen < expire_before
+            ]
+            for serial_no in expired:
+                del self._pending_receipts[serial_no]
+        
+        if expired:
+            with self._receipt_counter_lock:
+                self._receipt_counters["unmatched"] += len(expired)
+            logger.warning(f"短信回执超过 {SMS_RECEIPT_MATCH_WINDOW} 秒仍未匹配到发送记录，已丢弃: 条数={len(expired)}")
+        for row in retry:
+            if not self.receipt_writer.add(row):
+                logger.warning(f"短信回执重新匹配入队失败: 流水号={row['b_serial_no']}")
+    
+    def record_receipts(self, reports: List[SmsStatusReport]) -> int:
+        """
+        记录一批送达回执（只入队，不等待写库）
+        
+        Args:
+            reports: 回调推送的回执列表
+            
+        Returns:
+            入队的回执数量
+        """
+        accepted = 0
+        for report in reports:
+            delivered_at = None
+            if report.user_receive_time:
+                try:
+                    delivered_at = _parse_time(report.user_receive_time)
+                except ValueError:
+                    logger.warning(f"短信回执接收时间格式错误: sid={report.sid}, time={report.user_receive_time}")
+            if self.receipt_writer.add({
+                "b_serial_no": report.sid,
+                "b_delivery_status": "delivered" if report.report_status == "SUCCESS" else "undelivered",
+                "b_delivery_code": (report.errmsg or "")[:64] or None,
+                "b_delivered_at": delivered_at
+            }):
+                accepted += 1
+        with self._receipt_counter_lock:
+            self._receipt_counters["received"] += len(reports)
+        return accepted
+    
+    def _write_receipts(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        一个事务内按流水号批量更新送达状态
+        
+        同一流水号重复推送时结果相同（幂等），同一批内只保留最后一条；
+        发送记录尚未写入的回执暂存，等对应记录写入台账后重新更新
+        """
+        rows = list({row["b_serial_no"]: row for row in rows}.values())
+        statement = (
+            update(SmsLedger)
+            .where(SmsLedger.serial_no == bindparam("b_serial_no"))
+            .values(
+                delivery_status=bindparam("b_delivery_status"),
+                delivery_code=bindparam("b_delivery_code"),
+                delivered_at=bindparam("b_delivered_at")
+            )
+        )
+        serial_nos = [row["b_serial_no"] for row in rows]
+        now = time.monotonic()
+        with self._pending_lock:
+            with Session(engine) as session:
+                session.connection().execute(statement, rows)
+                session.commit()
+                found = set(session.exec(
+                    select(SmsLedger.serial_no).where(SmsLedger.serial_no.in_(serial_nos))
+                ).all())
+            pending = [row for row in rows if row["b_serial_no"] not in found]
+            discarded = 0
+            for row in pending:
+                serial_no = row["b_serial_no"]
+                if serial_no not in self._pending_receipts and len(self._pending_receipts) >= SMS_LEDGER_QUEUE_SIZE:
+                    # 暂存已满（多为流水号不属于本服务），不再保留
+                    discarded += 1
+                    continue
+                first_seen = self._pending_receipts.get(serial_no, (row, now))[1]
+                self._pending_receipts[serial_no] = (row, first_seen)
+        
+        with self._receipt_counter_lock:
+            self._receipt_counters["matched"] += len(rows) - len(pending)
+            self._receipt_counters["unmatched"] += discarded
+    
+    def get_receipt_metrics(self) -> Dict[str, Any]:
+        """回执计数与写入队列指标"""
+        with self._receipt_counter_lock:
+            counters = dict(self._receipt_counters)
+        with self._pending_lock:
+            pending = len(self._pending_receipts)
+        return {**counters, "pending": pending, "writer": self.receipt_writer.get_metrics()}
+    
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """写完队列中的记录后停止"""
+        self.writer.shutdown(timeout=timeout)
+        self.receipt_writer.shutdown(timeout=timeout)
+    
+    @staticmethod
+    def get_ledger_list(
+        page: int = 1,
+        pageSize: int = 20,
+        appraisal_id: Optional[str] = None,
+        phone: Optional[str] = None,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        status: Optional[str] = None,
+        session: Session = None
+    ) -> SmsLedgerListData:
+        """
+        查询台账记录（按发送时间倒序）
+        
+        Args:
+            page: 页码
+            pageSize: 每页条数
+            appraisal_id: 鉴定订单ID
+            phone: 手机号（按哈希匹配）
+            start_time: 开始时间（ISO 格式，不带时区按北京时间）
+            end_time: 结束时间（ISO 格式，不带时区按北京时间）
+            status: 发送状态
+            session: 数据库会话
+            
+        Returns:
+            分页结果
+        """
+        query = select(SmsLedger)
+        
+        if appraisal_id:
+            query = query.where(SmsLedger.appraisal_id == appraisal_id)
+        
+        if phone:
+            query = query.where(SmsLedger.phone_hash == hash_phone(phone))
+        
+        if start_time:
+            query = query.where(SmsLedger.created_at >= _parse_time(start_time))
+        
+        if end_time:
+            query = query.where(SmsLedger.created_at <= _parse_time(end_time))
+        
+        if status:
+            query = query.where(SmsLedger.status == status)
+        
+        total_query = select(func.count()).select_from(query.subquery())
+        total = session.exec(total_query).one()
+        
+        offset = (page - 1) * pageSize
+        query = query.order_by(SmsLedger.created_at.desc(), SmsLedger.id.desc()).offset(offset).limit(pageSize)
+        
+        records = session.exec(query).all()
+        
+        return SmsLedgerListData(
+            total=total,
+            page=page,
+            pageSize=pageSize,
+            list=[record.model_dump() for record in records]
+        )
+    
+    @staticmethod
+    def get_daily_rollup(start_date: str, end_date: str, session: Session) -> List[SmsDailyRollupItem]:
+        """
+        按日（北京时间）汇总发送条数、失败条数、送达条数与计费条数
+        
+        Args:
+            start_date: 开始日期 YYYY-MM-DD
+            end_date: 结束日期 YYYY-MM-DD（包含）
+            session: 数据库会话
+            
+        Returns:
+            按日期升序的汇总列表
+        """
+        start = _parse_time(f"{start_date}T00:00:00")
+        end = _parse_time(f"{end_date}T00:00:00") + timedelta(days=1)
+        
+        day = func.date(func.convert_tz(SmsLedger.created_at, "+00:00", "+08:00"))
+        query = (
+            select(
+                day.label("day"),
+                func.count(SmsLedger.id),
+                func.sum(case((SmsLedger.status == "success", 1), else_=0)),
+                func.sum(case((SmsLedger.status == "failed", 1), else_=0)),
+                func.sum(SmsLedger.fee),
+                func.sum(case((SmsLedger.delivery_status == "delivered", 1), else_=0))
+            )
+            .where(SmsLedger.created_at >= start, SmsLedger.created_at < end)
+            .group_by(day)
+            .order_by(day)
+        )
+        
+        return [
+            SmsDailyRollupItem(
+                date=str(row[0]),
+                total=row[1] or 0,
+                success_count=int(row[2] or 0),
+                failed_count=int(row[3] or 0),
+                delivered_count=int(row[5] or 0),
+                fee=int(row[4] or 0)
+            )
+            for row in session.exec(query).all()
+        ]
+
+
+# 全局台账服务实例
+_ledger_service: Optional[SmsLedgerService] = None
+_ledger_lock = threading.Lock()
+
+
+def get_sms_ledger_service() -> Optional[SmsLedgerService]:
+    """获取短信台账服务实例（单例模式），未启用时返回None"""
+    global _ledger_service
+    if not SMS_LEDGER_ENABLED:
+        return None
+    if _ledger_service is None:
+        with _ledger_lock:
+            if _ledger_service is None:
+                _ledger_service = SmsLedgerService()
+    return _ledger_service
@@ -0,0 +1,220 @@
+"""
+短信通道与故障转移
+每个通道是一个实现 SendSms(request) 的客户端（腾讯云 SmsClient，或接口一致的其他厂商适配器/假实现）；
+按配置顺序选择健康的通道发送，通道故障（网络、超时、平台内部错误、限频）时换下一个通道；
+可选对冲：当前通道超过耗时预算仍未返回时并发请求下一个通道，取先成功的结果
+"""
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from app.config.settings import SMS_PROVIDER_MAX_ERROR_RATE, SMS_PROVIDER_COOLDOWN
+from app.services.sms_errors import is_provider_failure
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderHealth:
+    """通道健康度：最近请求耗时与错误率的指数滑动平均"""
+    
+    def __init__(
+        self,
+        alpha: float = 0.2,
+        max_error_rate: float = SMS_PROVIDER_MAX_ERROR_RATE,
+        cooldown: float = SMS_PROVIDER_COOLDOWN
+    ):
+        """
+        Args:
+            alpha: 滑动平均中最新样本的权重
+            max_error_rate: 错误率超过该值时暂停使用
+            cooldown: 暂停时长（秒），到期后放行请求探测，探测失败则再次暂停
+        """
+        self._alpha = alpha
+        self._max_error_rate = max_error_rate
+        self._cooldown = cooldown
+        self._lock = threading.Lock()
+        self.latency_ms = 0.0
+        self.error_rate = 0.0
+        self.samples = 0
+        self._paused_until = 0.0
+    
+    def record(self, latency_ms: float, failed: bool) -> None:
+        """记录一次请求结果"""
+        with self._lock:
+            if self.samples == 0:
+                self.latency_ms = latency_ms
+            else:
+                self.latency_ms += self._alpha * (latency_ms - self.latency_ms)
+            self.error_rate += self._alpha * ((1.0 if failed else 0.0) - self.error_rate)
+            self.samples += 1
+            if failed and self.error_rate > self._max_error_rate:
+                self._paused_until = time.monotonic() + self._cooldown
+    
+    def available(self) -> bool:
+        """是否可以使用（未处于暂停期）"""
+        return time.monotonic() >= self._paused_until
+    
+    def score(self, timeout_ms: float) -> float:
+        """
+        综合得分，越小越好：平均耗时 + 错误率 × 超时时长（失败的代价按一次超时计）
+        
+        Args:
+            timeout_ms: 请求超时（毫秒）
+        """
+        return self.latency_ms + self.error_rate * timeout_ms
+
+
+class SmsProvider:
+    """短信通道"""
+    
+    def __init__(self, name: str, client: Any, timeout_ms: float = 10000):
+        """
+        Args:
+            name: 通道名称（用于日志与指标）
+            client: 实现 SendSms(request) 的客户端
+            timeout_ms: 请求超时（毫秒），用于计算健康得分
+        """
+        self.name = name
+        self.client = client
+        self.timeout_ms = timeout_ms
+        self.health = ProviderHealth()
+        self._counter_lock = threading.Lock()
+        self.counters = {"requests": 0, "failures": 0, "wins": 0}
+    
+    def incr(self, name: str) -> None:
+        with self._counter_lock:
+            self.counters[name] += 1
+    
+    def send(self, request: Any) -> Any:
+        """调用 SendSms 并记录耗时与是否通道故障"""
+        self.incr("requests")
+        started = time.monotonic()
+        try:
+            response = self.client.SendSms(request)
+        except Exception as e:
+            failed = is_provider_failure(e)
+            if failed:
+                self.incr("failures")
+            self.health.record((time.monotonic() - started) * 1000, failed)
+            raise
+        self.health.record((time.monotonic() - started) * 1000, False)
+        return response
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._counter_lock:
+            counters = dict(self.counters)
+        return {
+            "name": self.name,
+            "available": self.health.available(),
+            "latency_ewma_ms": round(self.health.latency_ms, 2),
+            "error_rate": round(self.health.error_rate, 3),
+            "score": round(self.health.score(self.timeout_ms), 2),
+            **counters,
+        }
+
+
+class FailoverSmsClient:
+    """
+    多通道短信客户端，接口与腾讯云 SmsClient.SendSms 一致
+    
+    - 可用通道按配置顺序优先，暂停中的通道按健康得分排在最后（全部暂停时仍会尝试）
+    - 通道故障时依次换下一个通道；参数、鉴权等请求本身的错误直接抛出
+    - hedge_after_ms > 0 时开启对冲：请求超过该耗时仍未返回，同时请求下一个通道，
+      先成功的结果返回，另一请求的结果丢弃（短信可能重复送达，适合可容忍重复的通知）
+    """
+    
+    def __init__(self, providers: List[SmsProvider], hedge_after_ms: int = 0, hedge_workers: int = 8):
+        """
+        Args:
+            providers: 有序的通道列表，至少一个
+            hedge_after_ms: 对冲等待时间（毫秒），0 表示关闭
+            hedge_workers: 对冲请求线程数
+        """
+        if not providers:
+            raise ValueError("至少需要配置一个短信通道")
+        self.providers = providers
+        self._hedge_after = hedge_after_ms / 1000
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if hedge_after_ms > 0 and len(providers) > 1:
+            self._executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="sms-hedge")
+        self._counter_lock = threading.Lock()
+        self._counters = {"failovers": 0, "hedged": 0}
+    
+    def _incr(self, name: str) -> None:
+        with self._counter_lock:
+            self._counters[name] += 1
+    
+    def ordered_providers(self) -> List[SmsProvider]:
+        """本次请求的通道顺序"""
+        available = [p for p in self.providers if p.health.available()]
+        paused = sorted(
+            (p for p in self.providers if not p.health.available()),
+            key=lambda p: p.health.score(p.timeout_ms)
+        )
+        return available + paused
+    
+    def SendSms(self, request: Any) -> Any:
+        """按通道顺序发送，返回第一个成功的响应"""
+        providers = self.ordered_providers()
+        if self._executor:
+            return self._send_hedged(request, providers)
+        
+        last_error: Optional[Exception] = None
+        for index, provider in enumerate(providers):
+            if index > 0:
+                self._incr("failovers")
+            try:
+                response = provider.send(request)
+            except Exception as e:
+                if not is_provider_failure(e):
+                    raise
+                last_error = e
+                logger.warning(f"短信通道 {provider.name} 请求失败，尝试下一个通道: {str(e)}")
+                continue
+            provider.incr("wins")
+            return response
+        raise last_error
+    
+    def _send_hedged(self, request: Any, providers: List[SmsProvider]) -> Any:
+        """
+        对冲发送：当前请求失败时立即请求下一个通道，超过对冲等待时间未返回时也请求下一个通道
+        """
+        pending: Dict[Future, SmsProvider] = {}
+        next_index = 0
+        timed_out = False
+        last_error: Optional[Exception] = None
+        while True:
+            if next_index < len(providers) and (not pending or timed_out):
+                if next_index > 0:
+                    self._incr("hedged" if timed_out else "failovers")
+                provider = providers[next_index]
+                pending[self._executor.submit(provider.send, request)] = provider
+                next_index += 1
+            if not pending:
+                raise last_error
+            
+            timeout = self._hedge_after if next_index < len(providers) else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            timed_out = not done
+            for future in done:
+                provider = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    provider.incr("wins")
+                    return future.result()
+                if not is_provider_failure(error):
+                    raise error
+                last_error = error
+                logger.warning(f"短信通道 {provider.name} 请求失败: {str(error)}")
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """故障转移计数与各通道健康度"""
+        with self._counter_lock:
+            counters = dict(self._counters)
+        return {
+            "hedge_after_ms": int(self._hedge_after * 1000),
+            **counters,
+            "providers": [provider.get_metrics() for provider in self.providers],
+        }
@@ -0,0 +1,76 @@
+"""
+短信发送限流
+在调用腾讯云之前按全局 QPS、单号码频率限流，避免触发运营商/平台的频率限制
+"""
+import logging
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from app.config.settings import (
+    ENVIRONMENT,
+    SMS_GLOBAL_QPS,
+    SMS_GLOBAL_BURST,
+    SMS_PHONE_TEMPLATE_INTERVAL,
+    SMS_PHONE_HOURLY_LIMIT
+)
+from app.utils.rate_limiter import RedisRateLimiter, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class SmsRateLimiter:
+    """短信限流器（Redis 令牌桶，多副本共享）"""
+    
+    def __init__(self, limiter: Optional[RedisRateLimiter] = None):
+        """
+        Args:
+            limiter: 令牌桶限流器，不传则使用默认 Redis 实例
+        """
+        self.limiter = limiter or RedisRateLimiter()
+        # Redis key前缀：生产环境用"online"，其他环境用"dev"
+        env_prefix = "online" if ENVIRONMENT == "production" else "dev"
+        self.key_prefix = f"{env_prefix}:sms_rate"
+    
+    def _global_bucket(self) -> TokenBucket:
+        """全局 SendSms 请求令牌桶（每次请求消耗 1 个，与号码数无关）"""
+        return TokenBucket(f"{self.key_prefix}:global", SMS_GLOBAL_QPS, SMS_GLOBAL_BURST)
+    
+    def _phone_buckets(self, phone: str, template_id: str) -> List[TokenBucket]:
+        """单号码令牌桶：同模板最小间隔 + 每小时总条数"""
+        buckets = []
+        if SMS_PHONE_TEMPLATE_INTERVAL > 0:
+            buckets.append(TokenBucket(
+                f"{self.key_prefix}:phone_tpl:{phone}:{template_id}",
+                1 / SMS_PHONE_TEMPLATE_INTERVAL,
+                1
+            ))
+        if SMS_PHONE_HOURLY_LIMIT > 0:
+            buckets.append(TokenBucket(
+                f"{self.key_prefix}:phone:{phone}",
+                SMS_PHONE_HOURLY_LIMIT / 3600,
+                SMS_PHONE_HOURLY_LIMIT
+            ))
+        return buckets
+    
+    def reserve_phones(self, targets: Sequence[Tuple[str, str]]) -> List[float]:
+        """
+        为一批短信的号码取令牌
+        
+        Args:
+            targets: [(手机号, 模板ID), ...]
+            
+        Returns:
+            与 targets 顺序一致的等待秒数，0 表示可以立即发送
+        """
+        return self.limiter.reserve_many([self._phone_buckets(phone, template_id) for phone, template_id in targets])
+    
+    def wait_global(self) -> float:
+        """
+        阻塞直到取得一次 SendSms 请求的全局令牌
+        
+        Returns:
+            实际等待的秒数
+        """
+        started = time.monotonic()
+        self.limiter.wait([self._global_bucket()])
+        return time.monotonic() - started
@@ -3,8 +3,6 @@ import uuid
 from datetime import datetime
 from typing import Optional
 from fastapi import UploadFile, HTTPException
-from qcloud_cos import CosConfig, CosS3Client
-from qcloud_cos.cos_exception import CosServiceError, CosClientError
 
 from app.schemas.upload import ImageUploadResponse, UploadConfig
 from app.config.settings import COS_SECRET_ID, COS_SECRET_KEY, COS_REGION, COS_BUCKET
@@ -23,6 +21,9 @@ class UploadService:
             raise ValueError("腾讯云COS配置不完整，请检查环境变量")
     
     def _get_cos_client(self):
+        # COS SDK 较重，首次创建上传服务时才导入
+        from qcloud_cos import CosConfig, CosS3Client
+        
         config = CosConfig(
             Region=COS_REGION,
             SecretId=COS_SECRET_ID,
@@ -75,6 +76,8 @@ class UploadService:
         return file_key
     
     async def upload_image(self, file: UploadFile, folder: str = None) -> ImageUploadResponse:
+        from qcloud_cos.cos_exception import CosServiceError, CosClientError
+        
         try:
             self.validate_image_file(file)
             if folder is None:
@@ -126,6 +129,8 @@ class UploadService:
             return False
     
     def list_buckets(self):
+        from qcloud_cos.cos_exception import CosServiceError, CosClientError
+        
         try:
             response = self.cos_client.list_buckets()
             return response
@@ -9,6 +9,7 @@ from app.schemas.user import (
     UserInfo, UserListRequest, UserListResponse, 
     UserCreateRequest, UserUpdateSelfRequest, UserUpdateAdminRequest
 )
+from app.utils.cache import cached, invalidate_tags
 from app.utils.db import get_session
 from app.services.auth import verify_token
 from app.utils.response import success_response, ResponseCode
@@ -16,6 +17,11 @@ from app.utils.response import success_response, ResponseCode
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 
+def _user_tag(user_id: int) -> str:
+    """用户缓存标签，用户信息变更后失效"""
+    return f"user:{user_id}"
+
+
 class UserService:
 
     @staticmethod
@@ -79,6 +85,12 @@ class UserService:
         })
 
     @staticmethod
+    @cached(
+        "user:detail",
+        ttl=300,
+        key=lambda args: str(args["user_id"]),
+        tags=lambda args: [_user_tag(args["user_id"])]
+    )
     def get_user_by_id(user_id: int, session: Session = Depends(get_session)) -> dict:
         user = session.exec(select(User).where(User.id == user_id)).first()
         
@@ -193,6 +205,7 @@ class UserService:
         session.add(current_user)
         session.commit()
         session.refresh(current_user)
+        invalidate_tags(_user_tag(current_user.id))
         
         user_info = UserInfo(
             id=current_user.id,
@@ -262,6 +275,7 @@ class UserService:
         session.add(user)
         session.commit()
         session.refresh(user)
+        invalidate_tags(_user_tag(user.id))
         
         user_info = UserInfo(
             id=user.id,
@@ -0,0 +1,153 @@
+"""
+后台批量写入工具
+调用方只把记录放入内存队列，由后台线程累计到 N 条或 T 毫秒后一次写入，避免拖慢主流程
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 停止信号
+_STOP = object()
+
+
+class BatchWriter(Generic[T]):
+    """批量写入器"""
+    
+    def __init__(
+        self,
+        flush_func: Callable[[List[T]], None],
+        max_rows: int = 200,
+        max_delay_ms: int = 1000,
+        queue_size: int = 20000,
+        name: str = "batch-writer"
+    ):
+        """
+        Args:
+            flush_func: 写入函数，入参为一批记录；抛出异常时该批记录丢弃并计数
+            max_rows: 累计多少条写一次
+            max_delay_ms: 第一条记录入队后最长多久写一次（毫秒）
+            queue_size: 队列容量，满时丢弃新记录
+            name: 后台线程名称
+        """
+        self._flush_func = flush_func
+        self._max_rows = max(1, max_rows)
+        self._max_delay = max_delay_ms / 1000
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._name = name
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stopped = False
+        self._counter_lock = threading.Lock()
+        self._counters = {"added": 0, "written": 0, "dropped": 0, "failed": 0, "flushes": 0}
+    
+    def add(self, row: T) -> bool:
+        """
+        放入一条记录（不阻塞）
+        
+        Returns:
+            是否入队成功
+        """
+        if self._stopped:
+            self._incr("dropped")
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._incr("dropped")
+            return False
+        self._incr("added")
+        return True
+    
+    def _ensure_started(self) -> None:
+        """首次写入时启动后台线程"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+    
+    def _run(self) -> None:
+        """后台线程：累计一批后写入，收到停止信号时写完剩余记录退出"""
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self._max_delay
+            while len(batch) < self._max_rows:
+                remaining = deadline - time.monotonic()
+                try:
+                    row = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stop = True
+                    break
+                batch.append(row)
+            self._flush(batch)
+            if stop:
+                self._drain()
+                return
+    
+    def _drain(self) -> None:
+        """停止时写完队列中剩余的记录"""
+        batch = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is _STOP:
+                continue
+            batch.append(row)
+            if len(batch) >= self._max_rows:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+    
+    def _flush(self, batch: List[T]) -> None:
+        """写入一批记录"""
+        try:
+            self._flush_func(batch)
+            self._incr("written", len(batch))
+        except Exception as e:
+            self._incr("failed", len(batch))
+            logger.error(f"{self._name} 批量写入失败，丢弃 {len(batch)} 条: {str(e)}", exc_info=True)
+        self._incr("flushes")
+    
+    def _incr(self, name: str, amount: int = 1) -> None:
+        with self._counter_lock:
+            self._counters[name] += amount
+    
+    def get_metrics(self) -> Dict[str, int]:
+        """队列深度与写入计数"""
+        with self._counter_lock:
+            counters = dict(self._counters)
+        return {"queue_depth": self._queue.qsize(), **counters}
+    
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """
+        停止接收新记录，写完队列中的记录后退出（最多 timeout 秒）
+        
+        Args:
+            timeout: 最长等待时间（秒）
+        """
+        self._stopped = True
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning(f"{self._name} 队列已满，无法发送停止信号")
+            return
+        self._thread.join(timeout=timeout)
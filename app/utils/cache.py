@@ -0,0 +1,610 @@
+"""
+两级缓存
+进程内 LRU（短 TTL）+ Redis（跨副本共享），按标签失效，同一个键并发未命中时只回源一次
+
+用法:
+    @cached("article:detail", ttl=300, model=ArticleDetail, tags=lambda args: [f"article:{args['article_id']}"])
+    def get_article_detail(article_id: str, session: Session) -> Optional[ArticleDetail]:
+        ...
+        
+    # 数据变更并提交后
+    invalidate_tags(f"article:{article_id}")
+"""
+import base64
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple, Type, Union
+
+import redis
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from app.config.settings import (
+    ENVIRONMENT, CACHE_ENABLED, CACHE_SERIALIZER, CACHE_DEFAULT_TTL, CACHE_LOCAL_TTL,
+    CACHE_LOCAL_MAXSIZE, CACHE_LOCK_TTL, CACHE_LOCK_WAIT
+)
+from app.utils.redis import RedisClient, get_redis
+
+logger = logging.getLogger(__name__)
+
+
+# ========== 序列化 ==========
+
+class JsonSerializer:
+    """标准库 json"""
+    name = "json"
+    
+    def dumps(self, value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    
+    def loads(self, payload: str) -> Any:
+        return json.loads(payload)
+
+
+class OrjsonSerializer:
+    """orjson，序列化与反序列化速度明显快于标准库"""
+    name = "orjson"
+    
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+    
+    def dumps(self, value: Any) -> str:
+        return self._orjson.dumps(value).decode("utf-8")
+    
+    def loads(self, payload: str) -> Any:
+        return self._orjson.loads(payload)
+
+
+class MsgpackSerializer:
+    """
+    msgpack，体积更小
+    Redis 客户端按文本解码响应，二进制结果以 base64 文本存储
+    """
+    name = "msgpack"
+    
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+    
+    def dumps(self, value: Any) -> str:
+        return base64.b64encode(self._msgpack.packb(value, use_bin_type=True)).decode("ascii")
+    
+    def loads(self, payload: str) -> Any:
+        return self._msgpack.unpackb(base64.b64decode(payload), raw=False)
+
+
+_SERIALIZERS = {
+    "json": JsonSerializer,
+    "orjson": OrjsonSerializer,
+    "msgpack": MsgpackSerializer,
+}
+
+
+def get_serializer(name: str):
+    """
+    按名称创建序列化器，依赖未安装或名称未知时回退到 json
+    
+    Args:
+        name: json, orjson, msgpack
+    """
+    serializer_class = _SERIALIZERS.get(name)
+    if serializer_class is None:
+        logger.warning(f"未知的缓存序列化方式 {name}，使用 json")
+        return JsonSerializer()
+    try:
+        return serializer_class()
+    except ImportError:
+        logger.warning(f"缓存序列化方式 {name} 的依赖未安装，使用 json")
+        return JsonSerializer()
+
+
+# ========== 进程内缓存 ==========
+
+class LocalTTLCache:
+    """进程内 LRU 缓存，条目带过期时间与标签（线程安全）"""
+    
+    def __init__(self, maxsize: int = CACHE_LOCAL_MAXSIZE):
+        """
+        Args:
+            maxsize: 最多条数，超出时淘汰最久未使用的
+        """
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, float, FrozenSet[str]]]" = OrderedDict()
+    
+    def get(self, key: str) -> Optional[str]:
+        """获取未过期的条目，不存在时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, expires_at, _ = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+    
+    def set(self, key: str, payload: str, ttl: float, tags: Iterable[str] = ()) -> None:
+        """写入条目"""
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (payload, time.monotonic() + ttl, frozenset(tags))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        """删除带有任一标签的条目，返回删除条数"""
+        tags = set(tags)
+        with self._lock:
+            keys = [key for key, (_, _, entry_tags) in self._entries.items() if entry_tags & tags]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# ========== 两级缓存 ==========
+
+# 命中缓存、未调用回源函数的标记
+_NOT_LOADED = object()
+
+
+class _Flight:
+    """进行中的回源，同一个键的并发请求等待同一个结果"""
+    __slots__ = ("event", "payload", "error")
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.payload: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+class _PendingLoad:
+    """进行中的回源依赖的版本号 key，回源期间其中任一被本进程失效时标记为过期"""
+    __slots__ = ("generation_keys", "stale")
+    
+    def __init__(self, generation_keys: List[str]):
+        self.generation_keys = generation_keys
+        self.stale = False
+
+
+class TwoTierCache:
+    """
+    两级缓存：先查进程内缓存，再查 Redis，都未命中时回源
+    
+    - 同一进程内同一个键并发未命中时只有一个线程回源，其余线程等待结果（回源异常同样传给等待的线程）
+    - 跨进程用 Redis 锁（SET NX EX）保证同一时间只有一个副本回源，其余副本等待缓存写入，超时后自行回源
+    - 标签失效：写入 Redis 时把键加入标签集合，失效时删除集合内的所有键；
+      本进程的进程内缓存立即删除，其他副本的进程内缓存在 CACHE_LOCAL_TTL 内过期
+    - 失效时递增键与标签的版本号，回源期间版本号变化时不写入回源结果，避免失效前读到的旧数据被重新缓存
+    - Redis 不可用时按未命中处理，直接回源
+    """
+    
+    def __init__(
+        self,
+        redis_client: Optional[RedisClient] = None,
+        serializer: Any = None,
+        local_maxsize: int = CACHE_LOCAL_MAXSIZE,
+        local_ttl: float = CACHE_LOCAL_TTL,
+        lock_ttl: int = CACHE_LOCK_TTL,
+        lock_wait: float = CACHE_LOCK_WAIT
+    ):
+        """
+        Args:
+            redis_client: Redis客户端实例，不传则使用默认实例
+            serializer: 序列化器，不传则按 CACHE_SERIALIZER 配置创建
+            local_maxsize: 进程内缓存最多条数
+            local_ttl: 进程内缓存过期时间（秒），0 表示只用 Redis
+            lock_ttl: 跨进程回源锁的最长持有时间（秒）
+            lock_wait: 未拿到回源锁时等待缓存写入的最长时间（秒）
+        """
+        self.redis = redis_client or get_redis()
+        self.serializer = serializer or get_serializer(CACHE_SERIALIZER)
+        self.local = LocalTTLCache(local_maxsize)
+        self.local_ttl = local_ttl
+        self.lock_ttl = lock_ttl
+        self.lock_wait = lock_wait
+        # 标签集合的最短保留时间，不短于其中任何键的过期时间
+        self.tag_ttl = 86400
+        # Redis key前缀：生产环境用"online"，其他环境用"dev"
+        self.env_prefix = "online" if ENVIRONMENT == "production" else "dev"
+        self._flights: Dict[str, _Flight] = {}
+        self._flights_lock = threading.Lock()
+        # 版本号 key -> 依赖它的进行中回源，Redis 不可用时据此判断回源期间该键或标签是否被失效
+        self._pending_loads: Dict[str, List[_PendingLoad]] = {}
+        self._pending_lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._counters = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "loads": 0,
+            "coalesced": 0,
+            "lock_waits": 0,
+            "invalidations": 0,
+            "stale_skipped": 0,
+        }
+    
+    # ========== Key生成 ==========
+    
+    def _get_key(self, namespace: str, key: str) -> str:
+        """生成缓存key"""
+        return f"{self.env_prefix}:cache:{namespace}:{key}"
+    
+    def _get_tag_key(self, tag: str) -> str:
+        """生成标签集合的key"""
+        return f"{self.env_prefix}:cache_tag:{tag}"
+    
+    def _get_tag_generation_key(self, tag: str) -> str:
+        """生成标签版本号的key"""
+        return f"{self.env_prefix}:cache_tag_gen:{tag}"
+    
+    def _get_generation_keys(self, full_key: str, tags: Iterable[str]) -> List[str]:
+        """生成键与各标签版本号的key"""
+        return [f"{full_key}:gen"] + [self._get_tag_generation_key(tag) for tag in tags]
+    
+    def _incr(self, name: str) -> None:
+        with self._counter_lock:
+            self._counters[name] += 1
+    
+    def _begin_load(self, generation_keys: List[str]) -> _PendingLoad:
+        """登记进行中的回源"""
+        pending = _PendingLoad(generation_keys)
+        with self._pending_lock:
+            for generation_key in generation_keys:
+                self._pending_loads.setdefault(generation_key, []).append(pending)
+        return pending
+    
+    def _end_load(self, pending: _PendingLoad) -> None:
+        """回源结束，取消登记"""
+        with self._pending_lock:
+            for generation_key in pending.generation_keys:
+                loads = self._pending_loads.get(generation_key)
+                if loads is None:
+                    continue
+                loads.remove(pending)
+                if not loads:
+                    del self._pending_loads[generation_key]
+    
+    def _mark_stale(self, generation_keys: Iterable[str]) -> None:
+        """把依赖这些版本号的进行中回源标记为过期"""
+        with self._pending_lock:
+            for generation_key in generation_keys:
+                for pending in self._pending_loads.get(generation_key, ()):
+                    pending.stale = True
+    
+    # ========== 读取 ==========
+    
+    def get_or_load(
+        self,
+        namespace: str,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: int = CACHE_DEFAULT_TTL,
+        tags: Iterable[str] = (),
+        encode: Callable[[Any], Any] = jsonable_encoder,
+        decode: Callable[[Any], Any] = lambda data: data,
+        cache_none: bool = False
+    ) -> Any:
+        """
+        读取缓存，未命中时调用 loader 回源并写入缓存
+        
+        Args:
+            namespace: 命名空间（一般为 服务:方法）
+            key: 命名空间内的键
+            loader: 回源函数
+            ttl: Redis 缓存过期时间（秒）
+            tags: 标签，用于批量失效
+            encode: 回源结果转换为可序列化数据
+            decode: 反序列化后的数据转换为返回值
+            cache_none: 是否缓存 None 结果
+            
+        Returns:
+            缓存或回源的结果
+        """
+        full_key = self._get_key(namespace, key)
+        tags = tuple(tags)
+        payload = self.local.get(full_key)
+        if payload is not None:
+            self._incr("local_hits")
+            return decode(self.serializer.loads(payload))
+        
+        with self._flights_lock:
+            flight = self._flights.get(full_key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[full_key] = flight
+        
+        if not leader:
+            self._incr("coalesced")
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            if flight.payload is None:
+                return None
+            return decode(self.serializer.loads(flight.payload))
+        
+        try:
+            flight.payload, value = self._load_shared(full_key, loader, ttl, tags, encode, cache_none)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(full_key, None)
+            flight.event.set()
+        if value is not _NOT_LOADED:
+            return value
+        return decode(self.serializer.loads(flight.payload))
+    
+    def _load_shared(
+        self,
+        full_key: str,
+        loader: Callable[[], Any],
+        ttl: int,
+        tags: Tuple[str, ...],
+        encode: Callable[[Any], Any],
+        cache_none: bool
+    ) -> Tuple[Optional[str], Any]:
+        """
+        查 Redis，未命中时在跨进程锁内回源
+        
+        Returns:
+            (payload, 回源得到的原始结果)；命中缓存时原始结果为 _NOT_LOADED，结果为 None 且不缓存时 payload 为 None
+        """
+        payload = self.redis.get(full_key)
+        if payload is not None:
+            self._incr("redis_hits")
+            self.local.set(full_key, payload, min(self.local_ttl, ttl), tags)
+            return payload, _NOT_LOADED
+        
+        lock_key = f"{full_key}:lock"
+        token = uuid.uuid4().hex
+        locked = self.redis.set(lock_key, token, ex=self.lock_ttl, nx=True)
+        if not locked and self.redis.exists(lock_key):
+            # 其他副本正在回源，等待其写入缓存
+            self._incr("lock_waits")
+            deadline = time.monotonic() + self.lock_wait
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                payload = self.redis.get(full_key)
+                if payload is not None:
+                    self._incr("redis_hits")
+                    self.local.set(full_key, payload, min(self.local_ttl, ttl), tags)
+                    return payload, _NOT_LOADED
+                if not self.redis.exists(lock_key):
+                    break
+        
+        # 回源前记下版本号，回源期间发生失效时不写入
+        generation_keys = self._get_generation_keys(full_key, tags)
+        pending = self._begin_load(generation_keys)
+        generations = self.redis.mget(generation_keys)
+        try:
+            self._incr("loads")
+            value = loader()
+            if value is None and not cache_none:
+                return None, value
+            payload = self.serializer.dumps(encode(value))
+            self._store(full_key, payload, ttl, tags, generations, pending)
+            return payload, value
+        finally:
+            self._end_load(pending)
+            # 只释放自己持有的锁（比较与删除原子执行）
+            if locked:
+                self.redis.delete_if_equal(lock_key, token)
+    
+    def _store(
+        self,
+        full_key: str,
+        payload: str,
+        ttl: int,
+        tags: Tuple[str, ...],
+        generations: List[Optional[str]],
+        pending: _PendingLoad
+    ) -> None:
+        """
+        版本号未变化时写入 Redis（含标签集合）与进程内缓存
+        
+        WATCH 版本号后比较并在事务内写入，比较之后、写入之前发生的失效同样会使写入放弃
+        """
+        if pending.stale:
+            self._skip_stale(full_key)
+            return
+        generation_keys = pending.generation_keys
+        try:
+            with self.redis.get_client().pipeline(transaction=True) as pipe:
+                pipe.watch(*generation_keys)
+                if pipe.mget(generation_keys) != generations:
+                    self._skip_stale(full_key)
+                    return
+                pipe.multi()
+                pipe.set(full_key, payload, ex=ttl)
+                for tag in tags:
+                    tag_key = self._get_tag_key(tag)
+                    pipe.sadd(tag_key, full_key)
+                    pipe.expire(tag_key, max(ttl, self.tag_ttl))
+                pipe.execute()
+        except redis.WatchError:
+            self._skip_stale(full_key)
+            return
+        except Exception as e:
+            logger.warning(f"写入缓存失败: key={full_key}, 错误={e}")
+        self.local.set(full_key, payload, min(self.local_ttl, ttl), tags)
+    
+    def _skip_stale(self, full_key: str) -> None:
+        """回源期间发生失效，放弃写入"""
+        self._incr("stale_skipped")
+        logger.debug(f"回源期间缓存已失效，不写入回源结果: key={full_key}")
+    
+    def _bump_generations(self, pipe, generation_keys: List[str]) -> None:
+        """在 pipeline 中递增版本号（带过期时间，不长期占用内存）"""
+        for generation_key in generation_keys:
+            pipe.incr(generation_key)
+            pipe.expire(generation_key, self.tag_ttl)
+    
+    # ========== 失效 ==========
+    
+    def invalidate(self, namespace: str, key: str) -> None:
+        """删除单个键"""
+        full_key = self._get_key(namespace, key)
+        generation_keys = self._get_generation_keys(full_key, ())
+        self._mark_stale(generation_keys)
+        self.local.delete(full_key)
+        with self.redis.pipeline() as pipe:
+            self._bump_generations(pipe, generation_keys)
+            pipe.delete(full_key)
+        if not pipe.succeeded:
+            logger.warning(f"失效缓存失败: key={full_key}, 错误={pipe.error}")
+        self._incr("invalidations")
+    
+    def invalidate_tags(self, *tags: str) -> int:
+        """
+        删除带有任一标签的缓存
+        
+        Returns:
+            删除的 Redis 键数量
+        """
+        if not tags:
+            return 0
+        generation_keys = [self._get_tag_generation_key(tag) for tag in tags]
+        self._mark_stale(generation_keys)
+        self.local.invalidate_tags(tags)
+        tag_keys = [self._get_tag_key(tag) for tag in tags]
+        keys = set()
+        for tag_key in tag_keys:
+            keys.update(self.redis.smembers(tag_key))
+        with self.redis.pipeline() as pipe:
+            self._bump_generations(pipe, generation_keys)
+            for key in keys:
+                pipe.delete(key)
+            for tag_key in tag_keys:
+                pipe.delete(tag_key)
+        if not pipe.succeeded:
+            logger.warning(f"按标签失效缓存失败: tags={tags}, 错误={pipe.error}")
+        self._incr("invalidations")
+        return len(keys)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """命中、回源与合并计数"""
+        with self._counter_lock:
+            counters = dict(self._counters)
+        return {
+            "serializer": self.serializer.name,
+            "local_size": len(self.local),
+            **counters,
+        }
+
+
+# 全局缓存实例
+_cache: Optional[TwoTierCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TwoTierCache:
+    """获取缓存实例（单例模式）"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TwoTierCache()
+    return _cache
+
+
+def invalidate_tags(*tags: str) -> int:
+    """按标签失效缓存（数据变更提交后调用）"""
+    if not CACHE_ENABLED:
+        return 0
+    return get_cache().invalidate_tags(*tags)
+
+
+# ========== 装饰器 ==========
+
+def _default_key(arguments: Dict[str, Any]) -> str:
+    """按参数生成键：参数较短时直接拼接，否则取哈希"""
+    raw = json.dumps(jsonable_encoder(arguments), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    if len(raw) <= 64:
+        return raw
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def cached(
+    namespace: str,
+    ttl: int = CACHE_DEFAULT_TTL,
+    key: Optional[Callable[[Dict[str, Any]], str]] = None,
+    tags: Union[Iterable[str], Callable[[Dict[str, Any]], Iterable[str]]] = (),
+    model: Optional[Type[BaseModel]] = None,
+    ignore: Iterable[str] = ("session",),
+    cache_none: bool = False
+):
+    """
+    缓存函数结果（两级缓存），函数签名与调用方式不变
+    
+    Args:
+        namespace: 命名空间，不同函数不能重复
+        ttl: Redis 缓存过期时间（秒）
+        key: 由参数字典生成键，不传则用全部参数（ignore 中的除外）生成
+        tags: 标签列表，或由参数字典生成标签列表的函数
+        model: 返回值的 Pydantic 模型，命中缓存时按模型还原；不传则返回值须可 JSON 编码，命中时为编码后的数据
+        ignore: 不参与生成键的参数名（如数据库会话）
+        cache_none: 是否缓存 None 结果（如查询不到的详情）
+        
+    Returns:
+        装饰器
+    """
+    ignore = set(ignore)
+    
+    if model is not None:
+        encode = lambda value: value.model_dump(mode="json")
+        decode = model.model_validate
+    else:
+        encode = jsonable_encoder
+        decode = lambda data: data
+    
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        signature = inspect.signature(func)
+        
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not CACHE_ENABLED:
+                return func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = {name: value for name, value in bound.arguments.items() if name not in ignore}
+            cache_key = key(arguments) if key else _default_key(arguments)
+            cache_tags = tags(arguments) if callable(tags) else tags
+            return get_cache().get_or_load(
+                namespace,
+                str(cache_key),
+                lambda: func(*args, **kwargs),
+                ttl=ttl,
+                tags=cache_tags,
+                encode=encode,
+                decode=decode,
+                cache_none=cache_none
+            )
+        
+        return wrapper
+    
+    return decorator
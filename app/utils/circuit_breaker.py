@@ -0,0 +1,152 @@
+"""
+熔断器
+依赖（如 Redis）连续失败达到阈值后熔断，熔断期间调用直接失败而不再等待超时；
+熔断时长到期后放行一个探测请求，成功则恢复，失败则继续熔断
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+
+class CircuitState:
+    """熔断器状态"""
+    CLOSED = "closed"  # 正常
+    OPEN = "open"  # 熔断中，调用直接失败
+    HALF_OPEN = "half_open"  # 探测中，只放行一个请求
+
+
+class CircuitOpenError(Exception):
+    """熔断中，调用未执行"""
+
+
+class CircuitBreaker:
+    """连续失败熔断器（线程安全）"""
+    
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 10,
+        failure_exceptions: Tuple[Type[BaseException], ...] = (Exception,),
+        open_error: Type[Exception] = CircuitOpenError
+    ):
+        """
+        Args:
+            name: 名称（用于日志与指标）
+            failure_threshold: 连续失败多少次后熔断
+            reset_timeout: 熔断多少秒后放行探测请求
+            failure_exceptions: 计为依赖故障的异常类型，其他异常说明依赖可达，不计入失败
+            open_error: 熔断期间抛出的异常类型，便于调用方按原有的异常类型处理
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_exceptions = failure_exceptions
+        self.open_error = open_error
+        self._lock = threading.Lock()
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._trips = 0
+        self._rejected = 0
+        self._last_error: Optional[str] = None
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+    
+    def _current_state(self) -> str:
+        """当前状态，熔断时长到期后视为探测中（需持有锁）"""
+        if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = CircuitState.HALF_OPEN
+        return self._state
+    
+    def before_call(self) -> None:
+        """
+        调用前检查，熔断中或已有探测请求在执行时直接失败
+        
+        Raises:
+            open_error: 调用未放行
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CircuitState.CLOSED:
+                return
+            if state == CircuitState.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self._rejected += 1
+        raise self.open_error(f"{self.name} 熔断中，暂停访问")
+    
+    def on_success(self) -> None:
+        """调用成功（依赖可达），恢复正常"""
+        with self._lock:
+            self._consecutive_failures = 0
+            self._probing = False
+            self._state = CircuitState.CLOSED
+    
+    def on_failure(self, error: BaseException) -> None:
+        """依赖故障，连续失败达到阈值或探测失败时熔断"""
+        with self._lock:
+            self._consecutive_failures += 1
+            self._last_error = f"{type(error).__name__}: {error}"
+            if self._probing or self._consecutive_failures >= self.failure_threshold:
+                if self._state != CircuitState.OPEN:
+                    self._trips += 1
+                self._state = CircuitState.OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
+    
+    def on_other_error(self) -> None:
+        """非依赖故障的异常（如参数错误），不改变状态，只释放探测名额"""
+        with self._lock:
+            self._probing = False
+    
+    def call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """经熔断器执行调用"""
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except self.failure_exceptions as e:
+            self.on_failure(e)
+            raise
+        except BaseException:
+            self.on_other_error()
+            raise
+        self.on_success()
+        return result
+    
+    async def call_async(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """经熔断器执行协程调用"""
+        self.before_call()
+        try:
+            result = await func(*args, **kwargs)
+        except self.failure_exceptions as e:
+            self.on_failure(e)
+            raise
+        except BaseException:
+            self.on_other_error()
+            raise
+        self.on_success()
+        return result
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """熔断器状态与计数"""
+        with self._lock:
+            state = self._current_state()
+            retry_in = 0.0
+            if state == CircuitState.OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            return {
+                "name": self.name,
+                "state": state,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "retry_in": round(retry_in, 1),
+                "trips": self._trips,
+                "rejected": self._rejected,
+                "last_error": self._last_error,
+            }
@@ -0,0 +1,45 @@
+"""
+轻量级进程内指标工具
+"""
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable
+
+
+class LatencyRecorder:
+    """滑动窗口延迟统计（保留最近 N 个样本，按需计算分位数）"""
+    
+    def __init__(self, window: int = 2048):
+        """
+        Args:
+            window: 保留的最近样本数
+        """
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._count = 0
+        self._lock = threading.Lock()
+    
+    def record(self, value_ms: float) -> None:
+        """记录一个样本（毫秒）"""
+        with self._lock:
+            self._samples.append(value_ms)
+            self._count += 1
+    
+    def snapshot(self, percentiles: Iterable[int] = (50, 95, 99)) -> Dict[str, float]:
+        """
+        返回样本总数、窗口内最大值及分位数
+        
+        Returns:
+            {"count": 总样本数, "max": 最大值, "p50": ..., "p95": ..., "p99": ...}
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self._count
+        
+        result: Dict[str, float] = {"count": count, "max": round(samples[-1], 2) if samples else 0.0}
+        for p in percentiles:
+            if samples:
+                index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+                result[f"p{p}"] = round(samples[index], 2)
+            else:
+                result[f"p{p}"] = 0.0
+        return result
@@ -0,0 +1,150 @@
+"""
+基于 Redis 的令牌桶限流
+多个令牌桶在一个 Lua 脚本中原子检查，全部有足够令牌时才一起扣减；
+令牌不足时不扣减，返回需要等待的时间，由调用方决定延后重试
+"""
+import logging
+import math
+import time
+from typing import List, NamedTuple, Optional, Sequence
+
+from app.utils.redis import RedisClient, get_redis
+
+logger = logging.getLogger(__name__)
+
+
+# KEYS: 令牌桶键; ARGV[1]: 当前时间（毫秒）; 之后每个桶依次为 速率(个/秒)、容量、消耗
+# 返回 0 表示已扣减，否则返回需等待的毫秒数
+_TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local wait = 0
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local base = 1 + (i - 1) * 3
+    local rate = tonumber(ARGV[base + 1])
+    local capacity = tonumber(ARGV[base + 2])
+    local cost = tonumber(ARGV[base + 3])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local current = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    current = math.min(capacity, current + math.max(0, now - ts) * rate / 1000)
+    tokens[i] = current
+    if current < cost then
+        wait = math.max(wait, math.ceil((cost - current) * 1000 / rate))
+    end
+end
+if wait > 0 then
+    return wait
+end
+for i, key in ipairs(KEYS) do
+    local base = 1 + (i - 1) * 3
+    local rate = tonumber(ARGV[base + 1])
+    local capacity = tonumber(ARGV[base + 2])
+    local cost = tonumber(ARGV[base + 3])
+    redis.call('HSET', key, 'tokens', tostring(tokens[i] - cost), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(capacity * 1000 / rate) + 1000)
+end
+return 0
+"""
+
+
+class TokenBucket(NamedTuple):
+    """令牌桶参数"""
+    key: str  # Redis 键
+    rate: float  # 每秒补充的令牌数
+    capacity: float  # 桶容量（允许的突发量）
+    cost: float = 1  # 本次消耗的令牌数
+
+
+class RedisRateLimiter:
+    """Redis 令牌桶限流器"""
+    
+    def __init__(self, redis_client: Optional[RedisClient] = None):
+        """
+        Args:
+            redis_client: Redis客户端实例，不传则使用默认实例
+        """
+        self.redis = redis_client or get_redis()
+        self._script = None
+    
+    def _get_script(self):
+        """注册 Lua 脚本（redis-py 会优先使用 EVALSHA）"""
+        if self._script is None:
+            self._script = self.redis.get_client().register_script(_TOKEN_BUCKET_SCRIPT)
+        return self._script
+    
+    @staticmethod
+    def _args(buckets: Sequence[TokenBucket], now_ms: int) -> List[float]:
+        args: List[float] = [now_ms]
+        for bucket in buckets:
+            args.extend((bucket.rate, bucket.capacity, bucket.cost))
+        return args
+    
+    def reserve(self, buckets: Sequence[TokenBucket]) -> float:
+        """
+        尝试从所有令牌桶中取令牌
+        
+        Args:
+            buckets: 令牌桶列表，全部满足才扣减
+            
+        Returns:
+            0 表示已取得令牌；否则为需要等待的秒数。Redis 不可用时放行并返回 0
+        """
+        if not buckets:
+            return 0.0
+        try:
+            wait_ms = self._get_script()(
+                keys=[bucket.key for bucket in buckets],
+                args=self._args(buckets, int(time.time() * 1000))
+            )
+            return int(wait_ms) / 1000
+        except Exception as e:
+            logger.error(f"令牌桶限流检查失败，本次放行: {str(e)}", exc_info=True)
+            return 0.0
+    
+    def reserve_many(self, bucket_groups: Sequence[Sequence[TokenBucket]]) -> List[float]:
+        """
+        在一个 pipeline 中对多组令牌桶分别调用 reserve
+        
+        Args:
+            bucket_groups: 令牌桶列表的列表，每组独立判断
+            
+        Returns:
+            与 bucket_groups 顺序一致的等待秒数列表
+        """
+        if not bucket_groups:
+            return []
+        try:
+            script = self._get_script()
+            now_ms = int(time.time() * 1000)
+            pipe = self.redis.get_client().pipeline(transaction=False)
+            for buckets in bucket_groups:
+                script(
+                    keys=[bucket.key for bucket in buckets],
+                    args=self._args(buckets, now_ms),
+                    client=pipe
+                )
+            return [int(wait_ms) / 1000 for wait_ms in pipe.execute()]
+        except Exception as e:
+            logger.error(f"令牌桶批量限流检查失败，本次放行: {str(e)}", exc_info=True)
+            return [0.0] * len(bucket_groups)
+    
+    def wait(self, buckets: Sequence[TokenBucket], max_wait: float = math.inf) -> bool:
+        """
+        阻塞直到取得令牌
+        
+        Args:
+            buckets: 令牌桶列表
+            max_wait: 最长等待时间（秒）
+            
+        Returns:
+            是否在 max_wait 内取得令牌
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            delay = self.reserve(buckets)
+            if delay <= 0:
+                return True
+            if time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
@@ -1,9 +1,185 @@
 """
 Redis 连接和操作工具
 """
+import threading
+import time
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+
 import redis
-from typing import Optional, Any, Union
-from app.config.settings import REDIS_HOST, REDIS_PORT, REDIS_USER, REDIS_PASSWORD, REDIS_DB
+import redis.asyncio as aioredis
+from typing import Optional, Any, Dict, ContextManager, Iterable, Iterator, List
+from app.config.settings import (
+    REDIS_HOST, REDIS_PORT, REDIS_USER, REDIS_PASSWORD, REDIS_DB,
+    REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT, REDIS_SOCKET_TIMEOUT, REDIS_CONNECT_TIMEOUT,
+    REDIS_HEALTH_CHECK_INTERVAL, REDIS_BREAKER_ENABLED, REDIS_BREAKER_FAILURE_THRESHOLD, REDIS_BREAKER_RESET_TIMEOUT
+)
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.metrics import LatencyRecorder
+
+
+def pool_kwargs() -> Dict[str, Any]:
+    """同步与异步客户端共用的连接池参数"""
+    return {
+        "host": REDIS_HOST,
+        "port": REDIS_PORT,
+        "username": REDIS_USER,
+        "password": REDIS_PASSWORD,
+        "db": REDIS_DB,
+        "decode_responses": True,  # 自动解码响应为字符串
+        "max_connections": REDIS_MAX_CONNECTIONS,
+        "timeout": REDIS_POOL_TIMEOUT,
+        "socket_connect_timeout": REDIS_CONNECT_TIMEOUT,
+        "socket_timeout": REDIS_SOCKET_TIMEOUT,
+        "retry_on_timeout": True,
+        "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+    }
+
+
+class _WaitTimedQueue(LifoQueue):
+    """连接池内部的空闲连接队列，记录取连接的等待耗时与等待超时次数"""
+    
+    def __init__(self, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.wait_latency = LatencyRecorder()
+        self.exhausted = 0
+    
+    def get(self, block: bool = True, timeout: Optional[float] = None):
+        started = time.monotonic()
+        try:
+            return super().get(block, timeout)
+        except Empty:
+            with self.mutex:
+                self.exhausted += 1
+            raise
+        finally:
+            self.wait_latency.record((time.monotonic() - started) * 1000)
+
+
+class RedisPoolExhaustedError(redis.RedisError):
+    """等待空闲连接超时（本地连接池耗尽，Redis 本身可达，不计入熔断失败）"""
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """
+    带指标的阻塞连接池
+    连接数达到上限时等待空闲连接（最多 timeout 秒），而不是无限制地新建连接
+    """
+    
+    def __init__(self, **kwargs):
+        kwargs.setdefault("queue_class", _WaitTimedQueue)
+        super().__init__(**kwargs)
+    
+    def get_connection(self, command_name, *keys, **options):
+        try:
+            return super().get_connection(command_name, *keys, **options)
+        except redis.ConnectionError as e:
+            # 父类在等待空闲连接超时（Empty）时抛出 ConnectionError("No connection available.")，
+            # 与建连失败区分开，避免本地并发过高被熔断器当作 Redis 故障
+            if isinstance(e.__context__, Empty):
+                raise RedisPoolExhaustedError(f"Redis 连接池已耗尽，等待 {self.timeout} 秒无空闲连接") from e
+            raise
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        连接池使用情况
+        
+        Returns:
+            {"max_connections", "created", "in_use", "idle", "exhausted", "wait_ms"}
+        """
+        queue = self.pool
+        with queue.mutex:
+            idle = sum(1 for connection in queue.queue if connection is not None)
+            exhausted = queue.exhausted
+        created = len(self._connections)
+        return {
+            "max_connections": self.max_connections,
+            "created": created,
+            "in_use": max(0, created - idle),
+            "idle": idle,
+            "exhausted": exhausted,
+            "wait_ms": queue.wait_latency.snapshot(),
+        }
+
+
+# 值与期望一致时才删除（释放自己持有的锁），读取与删除在 Redis 中原子执行
+_DELETE_IF_EQUAL_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class RedisCircuitOpenError(redis.ConnectionError):
+    """Redis 熔断中，命令未发送（继承 ConnectionError，调用方按连接失败处理）"""
+
+
+# 同步与异步客户端共用一个熔断器：连接失败与超时计为故障，命令错误（如 WRONGTYPE）说明 Redis 可达
+redis_breaker = CircuitBreaker(
+    "redis",
+    failure_threshold=REDIS_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=REDIS_BREAKER_RESET_TIMEOUT,
+    failure_exceptions=(redis.ConnectionError, redis.TimeoutError),
+    open_error=RedisCircuitOpenError
+)
+
+
+class _BreakerPipeline(redis.client.Pipeline):
+    """经熔断器发送的 pipeline"""
+    
+    def execute(self, raise_on_error: bool = True) -> List[Any]:
+        # 空 pipeline 不访问 Redis，不能作为探测成功
+        if not self.command_stack and not self.watching:
+            return []
+        return redis_breaker.call(super().execute, raise_on_error)
+
+
+class _BreakerRedis(redis.Redis):
+    """经熔断器执行命令的 Redis 客户端"""
+    
+    def execute_command(self, *args, **options):
+        return redis_breaker.call(super().execute_command, *args, **options)
+    
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> _BreakerPipeline:
+        return _BreakerPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class _AsyncBreakerRedis(aioredis.Redis):
+    """经熔断器执行命令的异步 Redis 客户端"""
+    
+    async def execute_command(self, *args, **options):
+        return await redis_breaker.call_async(super().execute_command, *args, **options)
+
+
+class RedisPipeline:
+    """
+    pipeline 包装：with 块内排队命令（与 redis-py pipeline 的命令方法相同），正常退出时一次往返发送
+    发送失败不抛异常：results 为空列表、succeeded 为 False，error 为失败原因
+    raise_on_error=False 时单条命令的错误不视为失败，以异常对象的形式出现在 results 对应位置
+    """
+    
+    def __init__(self, pipe: redis.client.Pipeline, raise_on_error: bool = True):
+        self._pipe = pipe
+        self._raise_on_error = raise_on_error
+        self.results: List[Any] = []
+        self.succeeded = False
+        self.error: Optional[Exception] = None
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pipe, name)
+    
+    def __len__(self) -> int:
+        return len(self._pipe)
+    
+    def _execute(self) -> None:
+        try:
+            self.results = self._pipe.execute(raise_on_error=self._raise_on_error)
+            self.succeeded = True
+        except Exception as e:
+            self.error = e
+        finally:
+            self._pipe.reset()
 
 
 class RedisClient:
@@ -11,23 +187,25 @@ class RedisClient:
     
     def __init__(self):
         self._client: Optional[redis.Redis] = None
+        self._pool: Optional[InstrumentedConnectionPool] = None
+        self._init_lock = threading.Lock()
     
     def get_client(self) -> redis.Redis:
-        """获取 Redis 客户端连接"""
-        if self._client is None:
-            self._client = redis.Redis(
-                host=REDIS_HOST,
-                port=REDIS_PORT,
-                username=REDIS_USER,
-                password=REDIS_PASSWORD,
-                db=REDIS_DB,
-                decode_responses=True,  # 自动解码响应为字符串
-                socket_connect_timeout=5,
-                socket_timeout=5,
-                retry_on_timeout=True,
-                health_check_interval=30
-            )
-        return self._client
+        """获取 Redis 客户端连接（首次调用时创建连接池，多线程并发调用只会创建一次）"""
+        client = self._client
+        if client is not None:
+            return client
+        with self._init_lock:
+            if self._client is None:
+                self._pool = InstrumentedConnectionPool(**pool_kwargs())
+                client_class = _BreakerRedis if REDIS_BREAKER_ENABLED else redis.Redis
+                self._client = client_class(connection_pool=self._pool)
+            return self._client
+    
+    def get_pool_metrics(self) -> Optional[Dict[str, Any]]:
+        """连接池指标，尚未创建连接池时返回 None"""
+        pool = self._pool
+        return pool.get_metrics() if pool else None
     
     def ping(self) -> bool:
         """检查 Redis 连接状态"""
@@ -37,11 +215,11 @@ class RedisClient:
         except Exception:
             return False
     
-    def set(self, key: str, value: Any, ex: Optional[int] = None) -> bool:
-        """设置键值对"""
+    def set(self, key: str, value: Any, ex: Optional[int] = None, nx: bool = False) -> bool:
+        """设置键值对（nx=True 时仅在键不存在时设置）"""
         try:
             client = self.get_client()
-            return client.set(key, value, ex=ex)
+            return bool(client.set(key, value, ex=ex, nx=nx))
         except Exception:
             return False
     
@@ -61,6 +239,23 @@ class RedisClient:
         except Exception:
             return False
     
+    def delete_if_equal(self, key: str, value: str) -> bool:
+        """
+        键的值等于 value 时删除（原子操作），用于释放自己持有的锁
+        
+        Args:
+            key: 键
+            value: 期望的值（如加锁时写入的 token）
+        
+        Returns:
+            是否删除成功
+        """
+        try:
+            client = self.get_client()
+            return bool(client.eval(_DELETE_IF_EQUAL_SCRIPT, 1, key, value))
+        except Exception:
+            return False
+    
     def exists(self, key: str) -> bool:
         """检查键是否存在"""
         try:
@@ -183,6 +378,89 @@ class RedisClient:
         except Exception:
             return False
     
+    # ========== 批量操作 ==========
+    
+    @contextmanager
+    def pipeline(self, transaction: bool = False, raise_on_error: bool = True) -> Iterator[RedisPipeline]:
+        """
+        批量发送命令，减少往返次数
+        
+        用法:
+            with redis_client.pipeline() as pipe:
+                pipe.sadd(key, *members)
+                pipe.expire(key, ttl)
+            if not pipe.succeeded:
+                ...
+        
+        Args:
+            transaction: 是否用 MULTI/EXEC 包裹，保证原子执行
+            raise_on_error: False 时单条命令出错不影响其他结果，错误放在 results 对应位置
+            
+        Yields:
+            RedisPipeline，with 块内抛出异常时不发送
+        """
+        wrapper = RedisPipeline(self.get_client().pipeline(transaction=transaction), raise_on_error)
+        try:
+            yield wrapper
+        except BaseException:
+            wrapper.reset()
+            raise
+        wrapper._execute()
+    
+    def transaction(self, raise_on_error: bool = True) -> ContextManager[RedisPipeline]:
+        """原子执行一组命令（MULTI/EXEC），用法同 pipeline()"""
+        return self.pipeline(transaction=True, raise_on_error=raise_on_error)
+    
+    def mget(self, keys: List[str]) -> List[Optional[str]]:
+        """批量获取键值，与 keys 一一对应"""
+        if not keys:
+            return []
+        try:
+            client = self.get_client()
+            return client.mget(keys)
+        except Exception:
+            return [None] * len(keys)
+    
+    def mset(self, mapping: Dict[str, Any], ex: Optional[int] = None) -> bool:
+        """批量设置键值对（指定 ex 时每个键设置相同的过期时间，单次往返）"""
+        if not mapping:
+            return True
+        if ex is None:
+            try:
+                client = self.get_client()
+                return bool(client.mset(mapping))
+            except Exception:
+                return False
+        with self.pipeline() as pipe:
+            for key, value in mapping.items():
+                pipe.set(key, value, ex=ex)
+        return pipe.succeeded
+    
+    def sadd_many(self, members: Dict[str, Iterable[Any]], ex: Optional[int] = None) -> int:
+        """
+        批量添加元素到多个集合（单次往返）
+        
+        Args:
+            members: {集合key: 元素列表}
+            ex: 每个集合的过期时间（秒），不传则不修改
+            
+        Returns:
+            新增的元素总数
+        """
+        added = 0
+        with self.pipeline() as pipe:
+            for name, values in members.items():
+                values = list(values)
+                if not values:
+                    continue
+                pipe.sadd(name, *values)
+                if ex is not None:
+                    pipe.expire(name, ex)
+        step = 1 if ex is None else 2
+        for count in pipe.results[::step]:
+            added += count
+        return added
+    
     # ========== 计数操作 ==========
     
     def incr(self, name: str, amount: int = 1) -> int:
@@ -218,10 +496,249 @@ class RedisClient:
             return 0
     
     def close(self):
-        """关闭连接"""
+        """关闭连接并断开连接池中的所有连接"""
+        with self._init_lock:
+            if self._client:
+                self._client.close()
+                self._client = None
+            if self._pool:
+                self._pool.disconnect()
+                self._pool = None
+
+
+class AsyncRedisClient:
+    """
+    异步 Redis 客户端封装类（redis.asyncio），方法与 RedisClient 一致，供 async 接口使用，不阻塞事件循环
+    连接参数与同步客户端相同；连接池绑定首次使用时所在的事件循环
+    
+    使用非阻塞连接池：连接数达到上限时直接失败（按失败默认值返回）。
+    redis 5.0.1 的异步 BlockingConnectionPool 在建连失败时会在持有条件锁的情况下归还连接而卡住，直到等待超时且连接不再归还
+    """
+    
+    def __init__(self):
+        self._client: Optional[aioredis.Redis] = None
+        self._pool: Optional[aioredis.ConnectionPool] = None
+    
+    def get_client(self) -> aioredis.Redis:
+        """获取异步 Redis 客户端（创建过程没有 await，同一事件循环内不会重复创建）"""
+        if self._client is None:
+            kwargs = pool_kwargs()
+            kwargs.pop("timeout")
+            self._pool = aioredis.ConnectionPool(**kwargs)
+            client_class = _AsyncBreakerRedis if REDIS_BREAKER_ENABLED else aioredis.Redis
+            self._client = client_class(connection_pool=self._pool)
+        return self._client
+    
+    def get_pool_metrics(self) -> Optional[Dict[str, Any]]:
+        """连接池指标，尚未创建连接池时返回 None"""
+        pool = self._pool
+        if pool is None:
+            return None
+        in_use = len(getattr(pool, "_in_use_connections", ()))
+        idle = len(getattr(pool, "_available_connections", ()))
+        return {
+            "max_connections": pool.max_connections,
+            "created": in_use + idle,
+            "in_use": in_use,
+            "idle": idle,
+        }
+    
+    async def ping(self) -> bool:
+        """检查 Redis 连接状态"""
+        try:
+            client = self.get_client()
+            return await client.ping()
+        except Exception:
+            return False
+    
+    async def set(self, key: str, value: Any, ex: Optional[int] = None, nx: bool = False) -> bool:
+        """设置键值对（nx=True 时仅在键不存在时设置）"""
+        try:
+            client = self.get_client()
+            return bool(await client.set(key, value, ex=ex, nx=nx))
+        except Exception:
+            return False
+    
+    async def get(self, key: str) -> Optional[str]:
+        """获取键值"""
+        try:
+            client = self.get_client()
+            return await client.get(key)
+        except Exception:
+            return None
+    
+    async def delete(self, key: str) -> bool:
+        """删除键"""
+        try:
+            client = self.get_client()
+            return bool(await client.delete(key))
+        except Exception:
+            return False
+    
+    async def exists(self, key: str) -> bool:
+        """检查键是否存在"""
+        try:
+            client = self.get_client()
+            return bool(await client.exists(key))
+        except Exception:
+            return False
+    
+    async def expire(self, key: str, seconds: int) -> bool:
+        """设置键过期时间"""
+        try:
+            client = self.get_client()
+            return await client.expire(key, seconds)
+        except Exception:
+            return False
+    
+    async def ttl(self, key: str) -> int:
+        """获取键的剩余过期时间"""
+        try:
+            client = self.get_client()
+            return await client.ttl(key)
+        except Exception:
+            return -1
+    
+    async def hset(self, name: str, mapping: dict) -> int:
+        """设置哈希字段"""
+        try:
+            client = self.get_client()
+            return await client.hset(name, mapping=mapping)
+        except Exception:
+            return 0
+    
+    async def hget(self, name: str, key: str) -> Optional[str]:
+        """获取哈希字段值"""
+        try:
+            client = self.get_client()
+            return await client.hget(name, key)
+        except Exception:
+            return None
+    
+    async def hgetall(self, name: str) -> dict:
+        """获取所有哈希字段"""
+        try:
+            client = self.get_client()
+            return await client.hgetall(name)
+        except Exception:
+            return {}
+    
+    async def hdel(self, name: str, *keys: str) -> int:
+        """删除哈希字段"""
+        try:
+            client = self.get_client()
+            return await client.hdel(name, *keys)
+        except Exception:
+            return 0
+    
+    async def lpush(self, name: str, *values: Any) -> int:
+        """从左侧推入列表"""
+        try:
+            client = self.get_client()
+            return await client.lpush(name, *values)
+        except Exception:
+            return 0
+    
+    async def rpop(self, name: str) -> Optional[str]:
+        """从右侧弹出列表元素"""
+        try:
+            client = self.get_client()
+            return await client.rpop(name)
+        except Exception:
+            return None
+    
+    async def llen(self, name: str) -> int:
+        """获取列表长度"""
+        try:
+            client = self.get_client()
+            return await client.llen(name)
+        except Exception:
+            return 0
+    
+    # ========== Set 操作 ==========
+    
+    async def sadd(self, name: str, *values: Any) -> int:
+        """添加元素到集合"""
+        try:
+            client = self.get_client()
+            return await client.sadd(name, *values)
+        except Exception:
+            return 0
+    
+    async def srem(self, name: str, *values: Any) -> int:
+        """从集合中删除元素"""
+        try:
+            client = self.get_client()
+            return await client.srem(name, *values)
+        except Exception:
+            return 0
+    
+    async def smembers(self, name: str) -> set:
+        """获取集合所有成员"""
+        try:
+            client = self.get_client()
+            return await client.smembers(name)
+        except Exception:
+            return set()
+    
+    async def scard(self, name: str) -> int:
+        """获取集合元素数量"""
+        try:
+            client = self.get_client()
+            return await client.scard(name)
+        except Exception:
+            return 0
+    
+    async def sismember(self, name: str, value: Any) -> bool:
+        """检查元素是否在集合中"""
+        try:
+            client = self.get_client()
+            return bool(await client.sismember(name, value))
+        except Exception:
+            return False
+    
+    # ========== 计数操作 ==========
+    
+    async def incr(self, name: str, amount: int = 1) -> int:
+        """递增计数器"""
+        try:
+            client = self.get_client()
+            return await client.incr(name, amount)
+        except Exception:
+            return 0
+    
+    async def decr(self, name: str, amount: int = 1) -> int:
+        """递减计数器"""
+        try:
+            client = self.get_client()
+            return await client.decr(name, amount)
+        except Exception:
+            return 0
+    
+    async def incrby(self, name: str, amount: int) -> int:
+        """按指定值递增"""
+        try:
+            client = self.get_client()
+            return await client.incrby(name, amount)
+        except Exception:
+            return 0
+    
+    async def decrby(self, name: str, amount: int) -> int:
+        """按指定值递减"""
+        try:
+            client = self.get_client()
+            return await client.decrby(name, amount)
+        except Exception:
+            return 0
+    
+    async def close(self):
+        """关闭连接并断开连接池中的所有连接"""
         if self._client:
-            self._client.close()
+            await self._client.aclose()
             self._client = None
+        if self._pool:
+            await self._pool.disconnect()
+            self._pool = None
 
 
 # 全局 Redis 客户端实例
@@ -231,3 +748,12 @@ redis_client = RedisClient()
 def get_redis() -> RedisClient:
     """获取 Redis 客户端依赖注入"""
     return redis_client
+
+
+# 全局异步 Redis 客户端实例
+async_redis_client = AsyncRedisClient()
+
+
+def get_async_redis() -> AsyncRedisClient:
+    """获取异步 Redis 客户端依赖注入"""
+    return async_redis_client
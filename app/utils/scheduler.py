@@ -0,0 +1,210 @@
+"""
+单线程延迟任务调度器
+用最小堆保存到期时间，所有延迟任务共用一个线程，替代每个任务一个 Timer 线程
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledTask:
+    """调度任务记录（__slots__ 减少大量待执行任务时的内存占用）"""
+    
+    __slots__ = ("due", "seq", "key", "func", "args", "cancelled")
+    
+    def __init__(self, due: float, seq: int, key: Optional[Hashable], func: Callable[..., Any], args: tuple):
+        self.due = due
+        self.seq = seq
+        self.key = key
+        self.func = func
+        self.args = args
+        self.cancelled = False
+    
+    def __lt__(self, other: "ScheduledTask") -> bool:
+        return (self.due, self.seq) < (other.due, other.seq)
+    
+    def remaining(self) -> float:
+        """距到期的剩余秒数"""
+        return max(0.0, self.due - time.monotonic())
+
+
+class DelayScheduler:
+    """
+    基于最小堆的延迟调度器
+    
+    - schedule/reschedule: O(log n) 入堆
+    - cancel: O(1) 标记删除，出堆时跳过；已取消记录过多时整体重建堆
+    - 回调在调度线程中执行，应尽快返回（耗时操作交给发送调度器等线程池）
+    """
+    
+    def __init__(self, name: str = "delay-scheduler"):
+        """
+        Args:
+            name: 调度线程名称
+        """
+        self.name = name
+        self._heap: List[ScheduledTask] = []
+        self._keyed: Dict[Hashable, ScheduledTask] = {}
+        self._cancelled = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition(threading.Lock())
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+    
+    def schedule(
+        self,
+        delay_seconds: float,
+        func: Callable[..., Any],
+        *args: Any,
+        key: Optional[Hashable] = None
+    ) -> ScheduledTask:
+        """
+        调度延迟任务；同一 key 已有任务时先取消旧任务（即重新调度）
+        
+        Args:
+            delay_seconds: 延迟时间（秒）
+            func: 到期后执行的函数
+            *args: 函数参数
+            key: 任务键，用于按键取消/重新调度；为空则为匿名任务
+            
+        Returns:
+            任务记录
+        """
+        task = ScheduledTask(time.monotonic() + max(0.0, delay_seconds), next(self._seq), key, func, args)
+        with self._cond:
+            if key is not None:
+                self._cancel_locked(self._keyed.get(key))
+                self._keyed[key] = task
+            heapq.heappush(self._heap, task)
+            self._ensure_started()
+            # 新任务成为堆顶时唤醒调度线程，重新计算等待时间
+            if self._heap[0] is task:
+                self._cond.notify()
+        return task
+    
+    def cancel(self, key: Hashable) -> bool:
+        """
+        按键取消任务
+        
+        Returns:
+            是否存在并被取消
+        """
+        with self._cond:
+            return self._cancel_locked(self._keyed.get(key))
+    
+    def cancel_task(self, task: ScheduledTask) -> bool:
+        """取消指定任务记录"""
+        with self._cond:
+            return self._cancel_locked(task)
+    
+    def _cancel_locked(self, task: Optional[ScheduledTask]) -> bool:
+        """在持有锁的情况下取消任务"""
+        if task is None or task.cancelled:
+            return False
+        task.cancelled = True
+        self._cancelled += 1
+        if task.key is not None and self._keyed.get(task.key) is task:
+            del self._keyed[task.key]
+        # 已取消记录超过一半时重建堆，避免内存只增不减
+        if self._cancelled > 1024 and self._cancelled * 2 > len(self._heap):
+            self._heap = [t for t in self._heap if not t.cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+        return True
+    
+    def get(self, key: Hashable) -> Optional[ScheduledTask]:
+        """按键获取待执行任务"""
+        with self._cond:
+            return self._keyed.get(key)
+    
+    def keyed_tasks(self) -> Dict[Hashable, ScheduledTask]:
+        """所有带键的待执行任务（副本）"""
+        with self._cond:
+            return dict(self._keyed)
+    
+    def pending_count(self) -> int:
+        """待执行任务数量（不含已取消）"""
+        with self._cond:
+            return len(self._heap) - self._cancelled
+    
+    def clear(self) -> int:
+        """
+        取消所有待执行任务
+        
+        Returns:
+            取消的任务数量
+        """
+        return len(self.drain())
+    
+    def drain(self) -> List[ScheduledTask]:
+        """
+        取出并取消所有待执行任务（用于关闭时转存），取出后的任务不会再被执行
+        
+        Returns:
+            按到期时间排序的任务列表
+        """
+        with self._cond:
+            tasks = sorted(task for task in self._heap if not task.cancelled)
+            for task in self._heap:
+                task.cancelled = True
+            self._heap = []
+            self._keyed.clear()
+            self._cancelled = 0
+            return tasks
+    
+    def _ensure_started(self) -> None:
+        """首次调度时启动调度线程（需持有锁）"""
+        if self._thread is None and not self._stopped:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+    
+    def _pop_due_locked(self) -> Optional[ScheduledTask]:
+        """
+        等待并弹出下一个到期任务（需持有锁）
+        
+        Returns:
+            到期任务，调度器停止时返回 None
+        """
+        while not self._stopped:
+            while self._heap and self._heap[0].cancelled:
+                heapq.heappop(self._heap)
+                self._cancelled -= 1
+            if not self._heap:
+                self._cond.wait()
+                continue
+            wait = self._heap[0].due - time.monotonic()
+            if wait > 0:
+                self._cond.wait(wait)
+                continue
+            task = heapq.heappop(self._heap)
+            # 出堆即视为不再待执行，之后的取消调用直接返回 False
+            task.cancelled = True
+            if task.key is not None and self._keyed.get(task.key) is task:
+                del self._keyed[task.key]
+            return task
+        return None
+    
+    def _run(self) -> None:
+        """调度线程主循环"""
+        while True:
+            with self._cond:
+                task = self._pop_due_locked()
+            if task is None:
+                return
+            try:
+                task.func(*task.args)
+            except Exception as e:
+                logger.error(f"延迟任务执行异常: key={task.key}, 错误={str(e)}", exc_info=True)
+    
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """停止调度线程，未到期任务保留在内存中（可通过 keyed_tasks 读取后转存）"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
@@ -0,0 +1,107 @@
+"""
+应用导入耗时分析：在子进程中以 python -X importtime 导入入口模块，按模块统计导入耗时
+
+用法:
+    python benchmarks/import_time.py                         # 导入 main，列出累计耗时最多的 30 个模块
+    python benchmarks/import_time.py --top 50 --self         # 按模块自身耗时排序
+    python benchmarks/import_time.py --budget-ms 1500        # 总导入耗时超过预算时以非零状态退出（可用于 CI）
+    python benchmarks/import_time.py --module app.services.appraisal
+    
+在独立子进程中运行，不受当前进程已导入模块的影响；耗时会随磁盘缓存冷热波动，预算应留出余量。
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ImportTiming(NamedTuple):
+    """单个模块的导入耗时（微秒）"""
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def profile_imports(module: str) -> List[ImportTiming]:
+    """
+    在子进程中导入模块并解析 -X importtime 输出
+    
+    Args:
+        module: 要导入的模块
+        
+    Returns:
+        每个被导入模块的耗时，顺序与输出一致（最外层模块在最后）
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    timings = []
+    errors = []
+    for line in proc.stderr.splitlines():
+        # 格式: "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        timings.append(ImportTiming(parts[2].rstrip(), int(parts[0]), int(parts[1])))
+    if proc.returncode != 0:
+        print("\n".join(errors), file=sys.stderr)
+        raise SystemExit(f"导入 {module} 失败，退出码 {proc.returncode}")
+    return timings
+
+
+def _top_level_total(timings: List[ImportTiming]) -> int:
+    """顶层导入（缩进为 1 个空格）的累计耗时之和，即整体导入耗时"""
+    return sum(t.cumulative_us for t in timings if not t.module[1:].startswith(" "))
+
+
+def _group_by_package(timings: List[ImportTiming]) -> Dict[str, int]:
+    """按顶层包汇总自身耗时"""
+    totals: Dict[str, int] = {}
+    for timing in timings:
+        package = timing.module.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + timing.self_us
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="要导入的入口模块")
+    parser.add_argument("--top", type=int, default=30, help="列出耗时最多的模块数")
+    parser.add_argument("--self", dest="by_self", action="store_true", help="按模块自身耗时排序（默认按累计耗时）")
+    parser.add_argument("--budget-ms", type=float, help="总导入耗时预算（毫秒），超出时以状态码 1 退出")
+    args = parser.parse_args()
+    
+    timings = profile_imports(args.module)
+    total_ms = _top_level_total(timings) / 1000
+    
+    key = (lambda t: t.self_us) if args.by_self else (lambda t: t.cumulative_us)
+    print(f"{'self(ms)':>10} {'cumulative(ms)':>15}  module")
+    for timing in sorted(timings, key=key, reverse=True)[:args.top]:
+        print(f"{timing.self_us / 1000:>10.1f} {timing.cumulative_us / 1000:>15.1f}  {timing.module.strip()}")
+    
+    print("\n按顶层包汇总（自身耗时）:")
+    packages = sorted(_group_by_package(timings).items(), key=lambda item: item[1], reverse=True)
+    for package, self_us in packages[:15]:
+        print(f"{self_us / 1000:>10.1f}ms  {package}")
+    
+    print(f"\n导入 {args.module} 共 {len(timings)} 个模块，总耗时 {total_ms:.1f}ms")
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"超出导入耗时预算 {args.budget_ms:.0f}ms", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
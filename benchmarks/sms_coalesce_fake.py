@@ -0,0 +1,77 @@
+"""
+短信合并发送验证：调度器 + 短信服务 + 本地假客户端
+
+用法:
+    python benchmarks/sms_coalesce_fake.py --messages 2000 --latency-ms 50
+
+按 3 个模板随机提交短信，其中部分号码在假客户端中返回失败，
+检查每条短信的回调都拿到了自己号码的结果，并对比 SendSms 请求数与短信条数。
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SMS_PROVIDER", "fake")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000, help="提交的短信条数")
+    parser.add_argument("--latency-ms", type=float, default=50, help="假客户端单次请求耗时（毫秒）")
+    parser.add_argument("--workers", type=int, default=4, help="调度器线程数")
+    parser.add_argument("--window-ms", type=int, default=200, help="合并窗口（毫秒）")
+    args = parser.parse_args()
+    
+    from app.services.sms import get_sms_service
+    from app.services.sms_dispatcher import SmsDispatcher, SmsMessage
+    
+    sms_service = get_sms_service()
+    client = sms_service.client.providers[0].client
+    client.latency_ms = args.latency_ms
+    phones = [f"138{i:08d}" for i in range(args.messages // 2)]
+    failing = set(random.sample(phones, k=max(1, len(phones) // 50)))
+    client.failing_numbers = {sms_service._format_phone_number(phone) for phone in failing}
+    
+    dispatcher = SmsDispatcher(workers=args.workers, coalesce_window_ms=args.window_ms)
+    results = {}
+    done = threading.Semaphore(0)
+    
+    def make_callback(index):
+        def callback(result):
+            results[index] = result
+            done.release()
+        return callback
+    
+    expected = {}
+    started = time.monotonic()
+    for i in range(args.messages):
+        phone = random.choice(phones)
+        template_id = random.choice(["2553333", "2553334", "2553335"])
+        expected[i] = (sms_service._format_phone_number(phone), template_id, phone not in failing)
+        dispatcher.submit(SmsMessage(phone=phone, template_id=template_id, appraisal_id=str(i), callback=make_callback(i)))
+    for _ in range(args.messages):
+        done.acquire()
+    elapsed = time.monotonic() - started
+    
+    mismatched = [
+        i for i, (phone, template_id, ok) in expected.items()
+        if results[i].get("phone_number") != phone
+        or results[i].get("template_id") != template_id
+        or bool(results[i].get("success")) != ok
+    ]
+    metrics = dispatcher.get_metrics()
+    print(
+        f"messages={args.messages} requests={client.request_count} phones_sent={client.phone_count} "
+        f"elapsed={elapsed:.2f}s failed={metrics['failed']} mismatched={len(mismatched)}"
+    )
+    print(f"batch_size={metrics['batch_size']} send_latency_ms={metrics['send_latency_ms']}")
+    dispatcher.shutdown()
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == "__main__":
+    main()
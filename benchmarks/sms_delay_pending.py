@@ -0,0 +1,130 @@
+"""
+大量待发送延迟任务基准：每个任务一个 Timer 线程 vs 单线程堆调度器
+
+用法:
+    python benchmarks/sms_delay_pending.py                   # 两种模式各跑一次并对比
+    python benchmarks/sms_delay_pending.py --mode scheduler --tasks 100000
+
+任务延迟设为 300 秒，测试期间不会到期执行；统计调度、重新调度、取消的吞吐以及线程数和内存。
+Timer 模式可能受系统线程数上限限制，无法创建线程时会提前停止并报告已创建的数量。
+每种模式在独立子进程中运行，互不影响内存与线程统计。
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.sms_dispatch_burst import _peak_rss_mb  # noqa: E402
+
+DELAY_SECONDS = 300
+
+
+def _noop(*_):
+    pass
+
+
+def _rate(count: int, seconds: float) -> str:
+    return f"{count / seconds:,.0f}/s" if seconds > 0 else "inf"
+
+
+def run_timer(tasks: int) -> None:
+    """旧实现：每个任务一个 Timer 线程，重新调度为 cancel + 新建"""
+    timers = {}
+    tracemalloc.start()
+    
+    started = time.monotonic()
+    try:
+        for i in range(tasks):
+            timer = threading.Timer(DELAY_SECONDS, _noop, args=(i,))
+            timer.daemon = True  # 基准中设为守护线程，避免异常退出时进程挂起
+            timer.start()
+            timers[i] = timer
+    except RuntimeError as e:
+        print(f"timer      无法继续创建线程（已创建 {len(timers)} 个）: {e}")
+    schedule_seconds = time.monotonic() - started
+    created = len(timers)
+    peak_threads = threading.active_count()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    
+    started = time.monotonic()
+    for i in range(created):
+        timers[i].cancel()
+        timer = threading.Timer(DELAY_SECONDS, _noop, args=(i,))
+        timer.daemon = True
+        timer.start()
+        timers[i] = timer
+    reschedule_seconds = time.monotonic() - started
+    
+    started = time.monotonic()
+    for timer in timers.values():
+        timer.cancel()
+    cancel_seconds = time.monotonic() - started
+    tracemalloc.stop()
+    
+    print(
+        f"{'timer':<10} tasks={created} schedule={_rate(created, schedule_seconds)} "
+        f"reschedule={_rate(created, reschedule_seconds)} cancel={_rate(created, cancel_seconds)} "
+        f"threads={peak_threads} traced_peak={traced_peak / 1024 / 1024:.1f}MB "
+        f"peak_rss={_peak_rss_mb():.1f}MB"
+    )
+
+
+def run_scheduler(tasks: int) -> None:
+    """新实现：单线程最小堆调度器"""
+    from app.utils.scheduler import DelayScheduler
+    
+    scheduler = DelayScheduler()
+    tracemalloc.start()
+    
+    started = time.monotonic()
+    for i in range(tasks):
+        scheduler.schedule(DELAY_SECONDS, _noop, str(i), "13800000000", "3", time.time(), key=str(i))
+    schedule_seconds = time.monotonic() - started
+    peak_threads = threading.active_count()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    
+    started = time.monotonic()
+    for i in range(tasks):
+        scheduler.schedule(DELAY_SECONDS, _noop, str(i), "13800000000", "4", time.time(), key=str(i))
+    reschedule_seconds = time.monotonic() - started
+    
+    started = time.monotonic()
+    for i in range(tasks):
+        scheduler.cancel(str(i))
+    cancel_seconds = time.monotonic() - started
+    _, traced_peak_after = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    scheduler.shutdown()
+    
+    print(
+        f"{'scheduler':<10} tasks={tasks} schedule={_rate(tasks, schedule_seconds)} "
+        f"reschedule={_rate(tasks, reschedule_seconds)} cancel={_rate(tasks, cancel_seconds)} "
+        f"threads={peak_threads} traced_peak={traced_peak / 1024 / 1024:.1f}MB "
+        f"(含重新调度 {traced_peak_after / 1024 / 1024:.1f}MB) peak_rss={_peak_rss_mb():.1f}MB"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["timer", "scheduler"], help="只运行指定模式")
+    parser.add_argument("--tasks", type=int, default=100000, help="待发送任务数")
+    args = parser.parse_args()
+    
+    if args.mode == "timer":
+        run_timer(args.tasks)
+        return
+    if args.mode == "scheduler":
+        run_scheduler(args.tasks)
+        return
+    
+    for mode in ("timer", "scheduler"):
+        subprocess.run([sys.executable, __file__, "--mode", mode, "--tasks", str(args.tasks)], check=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+短信突发发送基准：每条消息一个线程 vs 有界调度器
+
+用法:
+    python benchmarks/sms_dispatch_burst.py                  # 两种模式各跑一次并对比
+    python benchmarks/sms_dispatch_burst.py --mode dispatcher --messages 10000 --latency-ms 50
+
+发送函数为本地假实现（sleep 模拟腾讯云调用耗时），不会产生真实短信。
+每种模式在独立子进程中运行，互不影响内存与线程统计。
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _peak_rss_mb() -> float:
+    """进程峰值 RSS（MB）"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ThreadSampler:
+    """定时采样活动线程数，记录峰值"""
+    
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            time.sleep(self.interval)
+    
+    def __enter__(self):
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run(mode: str, messages: int, latency_ms: float, workers: int) -> None:
+    from app.services.sms_dispatcher import SmsDispatcher, SmsMessage
+    
+    done = threading.Semaphore(0)
+    
+    def fake_send(*_):
+        time.sleep(latency_ms / 1000)
+        done.release()
+        return {"success": True}
+    
+    def fake_send_batch(messages):
+        # 不合并，保持与线程模式相同的单号码请求，只比较调度方式
+        return [fake_send() for _ in messages]
+    
+    tracemalloc.start()
+    started = time.monotonic()
+    with ThreadSampler() as sampler:
+        if mode == "thread":
+            # 旧实现：每条消息启动一个守护线程
+            for i in range(messages):
+                threading.Thread(target=fake_send, daemon=True, name=f"sms-{i}").start()
+        else:
+            dispatcher = SmsDispatcher(
+                send_batch_func=fake_send_batch,
+                workers=workers,
+                queue_size=messages,
+                coalesce_window_ms=0,
+                max_batch=1
+            )
+            for i in range(messages):
+                dispatcher.submit(SmsMessage(phone=f"138{i:08d}", template_id="0", appraisal_id=str(i)))
+        submit_seconds = time.monotonic() - started
+        for _ in range(messages):
+            done.acquire()
+    elapsed = time.monotonic() - started
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    print(
+        f"{mode:<10} messages={messages} submit={submit_seconds:.2f}s total={elapsed:.2f}s "
+        f"peak_threads={sampler.peak} traced_peak={traced_peak / 1024 / 1024:.1f}MB "
+        f"peak_rss={_peak_rss_mb():.1f}MB"
+    )
+    if mode == "dispatcher":
+        metrics = dispatcher.get_metrics()
+        print(f"{'':<10} queue_wait_ms={metrics['queue_wait_ms']} send_latency_ms={metrics['send_latency_ms']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["thread", "dispatcher"], help="只运行指定模式")
+    parser.add_argument("--messages", type=int, default=10000, help="突发消息数")
+    parser.add_argument("--latency-ms", type=float, default=50, help="模拟单次发送耗时（毫秒）")
+    parser.add_argument("--workers", type=int, default=32, help="调度器线程数")
+    args = parser.parse_args()
+    
+    if args.mode:
+        run(args.mode, args.messages, args.latency_ms, args.workers)
+        return
+    
+    for mode in ("thread", "dispatcher"):
+        subprocess.run([
+            sys.executable, __file__, "--mode", mode,
+            "--messages", str(args.messages),
+            "--latency-ms", str(args.latency_ms),
+            "--workers", str(args.workers),
+        ], check=True)
+
+
+if __name__ == "__main__":
+    main()
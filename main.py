@@ -10,6 +10,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from app.api.router import api_router
+from app.core.lifespan import lifespan
 from app.core.exception_handler import (
     validation_exception_handler,
     http_exception_handler,
@@ -21,7 +22,8 @@ from app.core.exception_handler import (
 app = FastAPI(
     title="开门管理后台",
     description="基于 FastAPI 构建的管理后台系统",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 配置 CORS
@@ -0,0 +1,88 @@
+"""
+两级缓存：回源期间失效时不写入旧数据
+Redis 使用 fakeredis，不需要真实的 Redis 服务
+"""
+import threading
+
+import fakeredis
+import pytest
+
+from app.utils.cache import TwoTierCache
+from app.utils.redis import RedisClient
+
+
+def make_redis(connected: bool = True) -> RedisClient:
+    client = RedisClient()
+    client._client = fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    client._client.connection_pool.connection_kwargs["server"].connected = connected
+    return client
+
+
+class SlowLoader:
+    """回源时阻塞，直到测试放行，用于在回源期间执行失效"""
+    
+    def __init__(self, value):
+        self.value = value
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+    
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        return self.value
+
+
+def load_while(cache: TwoTierCache, key: str, tags, during) -> None:
+    """在后台回源，回源期间执行 during"""
+    loader = SlowLoader({"v": 1})
+    thread = threading.Thread(target=cache.get_or_load, args=("ns", key, loader), kwargs={"tags": tags})
+    thread.start()
+    assert loader.started.wait(5)
+    during()
+    loader.release.set()
+    thread.join(5)
+
+
+@pytest.fixture(params=[True, False], ids=["redis", "redis_down"])
+def cache(request) -> TwoTierCache:
+    return TwoTierCache(redis_client=make_redis(connected=request.param), local_ttl=60)
+
+
+def test_caches_loaded_value():
+    cache = TwoTierCache(redis_client=make_redis(), local_ttl=60)
+    loader = SlowLoader({"v": 1})
+    loader.release.set()
+    
+    assert cache.get_or_load("ns", "k", loader) == {"v": 1}
+    assert cache.get_or_load("ns", "k", loader) == {"v": 1}
+    assert loader.calls == 1
+    assert cache.redis.get(cache._get_key("ns", "k")) is not None
+
+
+def test_invalidate_during_load_skips_store(cache):
+    load_while(cache, "k", ("a",), lambda: cache.invalidate("ns", "k"))
+    
+    assert cache.local.get(cache._get_key("ns", "k")) is None
+    assert cache.redis.get(cache._get_key("ns", "k")) is None
+    assert cache.get_metrics()["stale_skipped"] == 1
+
+
+def test_invalidate_tag_during_load_skips_store(cache):
+    load_while(cache, "k", ("a",), lambda: cache.invalidate_tags("a"))
+    
+    assert cache.local.get(cache._get_key("ns", "k")) is None
+    assert cache.get_metrics()["stale_skipped"] == 1
+
+
+def test_unrelated_invalidation_during_load_still_stores(cache):
+    def invalidate_others():
+        cache.invalidate("ns", "other")
+        cache.invalidate_tags("b")
+    
+    load_while(cache, "k", ("a",), invalidate_others)
+    
+    assert cache.local.get(cache._get_key("ns", "k")) is not None
+    assert cache.get_metrics()["stale_skipped"] == 0
+    assert cache._pending_loads == {}
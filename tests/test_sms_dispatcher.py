@@ -0,0 +1,222 @@
+"""
+短信发送调度器：合并发送与队列溢出策略
+使用本地假短信客户端，不依赖腾讯云 SDK、Redis 与数据库
+"""
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import pytest
+
+from app.services.sms_dispatcher import OverflowPolicy, SmsDispatcher, SmsMessage
+from app.services.sms_errors import DISPATCH_STOPPED
+from app.services.sms_fake import FakeSmsClient
+
+
+def make_send_batch(client: FakeSmsClient):
+    """用假客户端实现批量发送函数：一组短信一次 SendSms，按号码拆分结果"""
+    def send_batch(messages: List[SmsMessage]) -> List[Dict[str, Any]]:
+        request = SimpleNamespace(
+            PhoneNumberSet=[message.phone for message in messages],
+            TemplateId=messages[0].template_id
+        )
+        statuses = {status.PhoneNumber: status for status in client.SendSms(request).SendStatusSet}
+        return [
+            {"success": statuses[message.phone].Code == "Ok", "code": statuses[message.phone].Code}
+            for message in messages
+        ]
+    return send_batch
+
+
+class Collector:
+    """收集回调结果，可等待指定条数"""
+    
+    def __init__(self):
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self._cond = threading.Condition()
+    
+    def callback(self, key: str):
+        def record(result: Dict[str, Any]) -> None:
+            with self._cond:
+                self.results[key] = result
+                self._cond.notify_all()
+        return record
+    
+    def wait(self, count: int, timeout: float = 5.0) -> Dict[str, Dict[str, Any]]:
+        with self._cond:
+            assert self._cond.wait_for(lambda: len(self.results) >= count, timeout=timeout)
+            return dict(self.results)
+
+
+@pytest.fixture
+def client() -> FakeSmsClient:
+    return FakeSmsClient()
+
+
+def submit(dispatcher: SmsDispatcher, collector: Collector, key: str, phone: str, template_id: str = "t1") -> bool:
+    return dispatcher.submit(SmsMessage(
+        phone=phone,
+        template_id=template_id,
+        appraisal_id=key,
+        callback=collector.callback(key)
+    ))
+
+
+# ========== 合并发送 ==========
+
+def test_same_template_coalesced_into_one_request(client):
+    dispatcher = SmsDispatcher(send_batch_func=make_send_batch(client), workers=1, coalesce_window_ms=300)
+    collector = Collector()
+    for i in range(10):
+        submit(dispatcher, collector, str(i), f"1380000{i:04d}")
+    results = collector.wait(10)
+    dispatcher.shutdown(timeout=2)
+    
+    assert client.request_count == 1
+    assert client.phone_count == 10
+    assert all(result["success"] for result in results.values())
+
+
+def test_groups_by_template_and_splits_duplicate_phones(client):
+    dispatcher = SmsDispatcher(send_batch_func=make_send_batch(client), workers=1, coalesce_window_ms=300)
+    collector = Collector()
+    submit(dispatcher, collector, "a", "13800000001", "t1")
+    submit(dispatcher, collector, "b", "13800000002", "t1")
+    submit(dispatcher, collector, "c", "13800000001", "t1")
+    submit(dispatcher, collector, "d", "13800000001", "t2")
+    collector.wait(4)
+    dispatcher.shutdown(timeout=2)
+    
+    # t1: [a, b] + [c]（同一号码不在同一请求里）；t2: [d]
+    assert client.request_count == 3
+    assert client.phone_count == 4
+
+
+def test_results_routed_to_each_message():
+    client = FakeSmsClient(failing_numbers=["13800000002"])
+    dispatcher = SmsDispatcher(
+        send_batch_func=make_send_batch(client), workers=1, coalesce_window_ms=300, max_attempts=1
+    )
+    collector = Collector()
+    for i in range(1, 4):
+        submit(dispatcher, collector, str(i), f"1380000000{i}")
+    results = collector.wait(3)
+    dispatcher.shutdown(timeout=2)
+    
+    assert client.request_count == 1
+    assert results["1"]["success"] and results["3"]["success"]
+    assert not results["2"]["success"]
+    assert results["2"]["code"] == "FailedOperation.PhoneNumberInBlacklist"
+
+
+def test_max_batch_limits_request_size(client):
+    dispatcher = SmsDispatcher(
+        send_batch_func=make_send_batch(client), workers=1, coalesce_window_ms=300, max_batch=4
+    )
+    collector = Collector()
+    for i in range(10):
+        submit(dispatcher, collector, str(i), f"1380000{i:04d}")
+    collector.wait(10)
+    dispatcher.shutdown(timeout=2)
+    
+    assert client.request_count == 3
+
+
+# ========== 队列溢出策略 ==========
+
+class BlockingSender:
+    """第一次发送时阻塞，直到测试放行，用于把队列塞满"""
+    
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.sent: List[str] = []
+        self.threads: List[threading.Thread] = []
+    
+    def __call__(self, messages: List[SmsMessage]) -> List[Dict[str, Any]]:
+        self.threads.append(threading.current_thread())
+        self.started.set()
+        self.release.wait(5)
+        self.sent.extend(message.appraisal_id for message in messages)
+        return [{"success": True} for _ in messages]
+
+
+def fill_queue(policy: str, put_timeout: float = 5.0):
+    """发送线程阻塞在 m1，队列（容量 1）中有 m2"""
+    sender = BlockingSender()
+    dispatcher = SmsDispatcher(
+        send_batch_func=sender,
+        workers=1,
+        queue_size=1,
+        overflow_policy=policy,
+        put_timeout=put_timeout,
+        coalesce_window_ms=0
+    )
+    collector = Collector()
+    assert submit(dispatcher, collector, "m1", "13800000001")
+    assert sender.started.wait(2)
+    assert submit(dispatcher, collector, "m2", "13800000002")
+    return dispatcher, sender, collector
+
+
+def test_reject_drops_new_message():
+    dispatcher, sender, collector = fill_queue(OverflowPolicy.REJECT)
+    assert not submit(dispatcher, collector, "m3", "13800000003")
+    assert collector.results["m3"]["error_code"] == "DISPATCH_DROPPED"
+    
+    sender.release.set()
+    collector.wait(3)
+    dispatcher.shutdown(timeout=2)
+    assert sender.sent == ["m1", "m2"]
+    assert dispatcher.get_metrics()["dropped"] == 1
+
+
+def test_drop_oldest_drops_queued_message():
+    dispatcher, sender, collector = fill_queue(OverflowPolicy.DROP_OLDEST)
+    assert submit(dispatcher, collector, "m3", "13800000003")
+    assert collector.results["m2"]["error_code"] == "DISPATCH_DROPPED"
+    
+    sender.release.set()
+    collector.wait(3)
+    dispatcher.shutdown(timeout=2)
+    assert sender.sent == ["m1", "m3"]
+
+
+def test_block_drops_after_put_timeout():
+    dispatcher, sender, collector = fill_queue(OverflowPolicy.BLOCK, put_timeout=0.1)
+    started = time.monotonic()
+    assert not submit(dispatcher, collector, "m3", "13800000003")
+    assert time.monotonic() - started >= 0.1
+    assert collector.results["m3"]["error_code"] == "DISPATCH_DROPPED"
+    
+    sender.release.set()
+    collector.wait(3)
+    dispatcher.shutdown(timeout=2)
+    assert sender.sent == ["m1", "m2"]
+
+
+def test_caller_runs_sends_in_caller_thread():
+    dispatcher, sender, collector = fill_queue(OverflowPolicy.CALLER_RUNS)
+    caller = threading.Thread(target=submit, args=(dispatcher, collector, "m3", "13800000003"))
+    caller.start()
+    sender.release.set()
+    caller.join(2)
+    collector.wait(3)
+    dispatcher.shutdown(timeout=2)
+    
+    assert sorted(sender.sent) == ["m1", "m2", "m3"]
+    assert caller in sender.threads
+    assert dispatcher.get_metrics()["caller_runs"] == 1
+
+
+def test_submit_after_shutdown_is_not_a_terminal_failure(client):
+    dispatcher = SmsDispatcher(send_batch_func=make_send_batch(client), workers=1, coalesce_window_ms=0)
+    collector = Collector()
+    submit(dispatcher, collector, "m1", "13800000001")
+    collector.wait(1)
+    dispatcher.shutdown(timeout=2)
+    
+    assert not submit(dispatcher, collector, "m2", "13800000002")
+    assert collector.results["m2"]["error_code"] == DISPATCH_STOPPED
+    assert client.request_count == 1
@@ -0,0 +1,136 @@
+"""
+多短信通道：故障转移与对冲请求
+使用本地假短信客户端，不依赖腾讯云 SDK
+"""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.sms_fake import FakeNetworkError, FakeSmsClient
+from app.services.sms_providers import FailoverSmsClient, SmsProvider
+
+
+class InvalidTemplateError(Exception):
+    """请求本身的错误，换通道也不会成功"""
+    code = "FailedOperation.TemplateIncorrectOrUnapproved"
+
+
+class RaisingClient:
+    """每次请求都抛出指定异常"""
+    
+    def __init__(self, error: Exception):
+        self.error = error
+        self.request_count = 0
+    
+    def SendSms(self, request):
+        self.request_count += 1
+        raise self.error
+
+
+def make_request(*phones: str) -> SimpleNamespace:
+    return SimpleNamespace(PhoneNumberSet=list(phones), TemplateId="t1")
+
+
+def test_fails_over_to_next_provider():
+    primary = FakeSmsClient(error_rate=1)
+    secondary = FakeSmsClient()
+    client = FailoverSmsClient([SmsProvider("primary", primary), SmsProvider("secondary", secondary)])
+    
+    response = client.SendSms(make_request("13800000001"))
+    
+    assert [status.Code for status in response.SendStatusSet] == ["Ok"]
+    assert secondary.request_count == 1
+    metrics = client.get_metrics()
+    assert metrics["failovers"] == 1
+    assert metrics["providers"][0]["failures"] == 1
+    assert metrics["providers"][1]["wins"] == 1
+
+
+def test_request_error_is_not_failed_over():
+    primary = RaisingClient(InvalidTemplateError("模板未审核"))
+    secondary = FakeSmsClient()
+    client = FailoverSmsClient([SmsProvider("primary", primary), SmsProvider("secondary", secondary)])
+    
+    with pytest.raises(InvalidTemplateError):
+        client.SendSms(make_request("13800000001"))
+    assert secondary.request_count == 0
+    assert client.get_metrics()["failovers"] == 0
+
+
+def test_raises_last_error_when_all_providers_fail():
+    client = FailoverSmsClient([
+        SmsProvider("primary", FakeSmsClient(error_rate=1)),
+        SmsProvider("secondary", FakeSmsClient(error_rate=1)),
+    ])
+    
+    with pytest.raises(FakeNetworkError):
+        client.SendSms(make_request("13800000001"))
+
+
+def test_paused_provider_is_tried_last():
+    primary = FakeSmsClient(error_rate=1)
+    secondary = FakeSmsClient()
+    client = FailoverSmsClient([SmsProvider("primary", primary), SmsProvider("secondary", secondary)])
+    
+    # 连续失败使错误率超过阈值，主通道进入暂停期
+    for _ in range(10):
+        client.SendSms(make_request("13800000001"))
+        if not client.providers[0].health.available():
+            break
+    assert not client.providers[0].health.available()
+    
+    requests_before = primary.request_count
+    client.SendSms(make_request("13800000001"))
+    assert primary.request_count == requests_before
+    assert [p.name for p in client.ordered_providers()] == ["secondary", "primary"]
+
+
+def test_hedges_slow_provider():
+    primary = FakeSmsClient(latency_ms=1000)
+    secondary = FakeSmsClient()
+    client = FailoverSmsClient(
+        [SmsProvider("primary", primary), SmsProvider("secondary", secondary)],
+        hedge_after_ms=50
+    )
+    
+    started = time.monotonic()
+    response = client.SendSms(make_request("13800000001"))
+    
+    assert time.monotonic() - started < 0.5
+    assert [status.Code for status in response.SendStatusSet] == ["Ok"]
+    metrics = client.get_metrics()
+    assert metrics["hedged"] == 1
+    assert metrics["providers"][1]["wins"] == 1
+
+
+def test_hedged_send_fails_over_immediately():
+    primary = FakeSmsClient(error_rate=1)
+    secondary = FakeSmsClient()
+    client = FailoverSmsClient(
+        [SmsProvider("primary", primary), SmsProvider("secondary", secondary)],
+        hedge_after_ms=5000
+    )
+    
+    started = time.monotonic()
+    client.SendSms(make_request("13800000001"))
+    
+    # 失败后不等对冲时间，直接请求下一个通道
+    assert time.monotonic() - started < 1
+    metrics = client.get_metrics()
+    assert metrics["failovers"] == 1
+    assert metrics["hedged"] == 0
+
+
+def test_fast_primary_is_not_hedged():
+    primary = FakeSmsClient()
+    secondary = FakeSmsClient()
+    client = FailoverSmsClient(
+        [SmsProvider("primary", primary), SmsProvider("secondary", secondary)],
+        hedge_after_ms=500
+    )
+    
+    client.SendSms(make_request("13800000001"))
+    
+    assert secondary.request_count == 0
+    assert client.get_metrics()["hedged"] == 0